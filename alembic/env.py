@@ -67,9 +67,12 @@ def run_migrations_online():
                 poolclass=pool.NullPool)
 
     connection = engine.connect()
+    # Every migration commits on its own, so one can run statements that
+    # are not allowed in a transaction through its own connection.
     context.configure(
                 connection=connection,
-                target_metadata=target_metadata
+                target_metadata=target_metadata,
+                transaction_per_migration=True
                 )
 
     try:
@@ -0,0 +1,35 @@
+"""site_activity
+
+Revision ID: 3f8b6d2c4a90
+Revises: 9c4e2a7d5b1f
+Create Date: 2018-06-25 09:30:02.811945
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f8b6d2c4a90'
+down_revision = '9c4e2a7d5b1f'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'site_activity',
+        sa.Column('day', sa.Date, primary_key=True),
+        sa.Column('project_id', sa.Integer,
+                  sa.ForeignKey('project.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('user_id', sa.Integer, primary_key=True, default=0),
+        sa.Column('n_task_runs', sa.Integer, nullable=False, default=0),
+        sa.Column('task_run_seconds', sa.Float, nullable=False, default=0),
+        sa.Column('n_timed_task_runs', sa.Integer, nullable=False,
+                  default=0),
+        sa.Column('n_tasks_created', sa.Integer, nullable=False, default=0),
+        sa.Column('n_completed_tasks', sa.Integer, nullable=False, default=0)
+    )
+
+
+def downgrade():
+    op.drop_table('site_activity')
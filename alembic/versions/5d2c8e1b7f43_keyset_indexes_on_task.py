@@ -0,0 +1,26 @@
+"""keyset pagination indexes on task
+
+Revision ID: 5d2c8e1b7f43
+Revises: 6a1d9e3f2b84
+Create Date: 2018-07-09 14:22:05.318844
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d2c8e1b7f43'
+down_revision = '6a1d9e3f2b84'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('task_project_id_priority_idx', 'task',
+                    ['project_id', 'priority_0', 'id'])
+    op.create_index('task_project_id_created_idx', 'task',
+                    ['project_id', 'created', 'id'])
+
+
+def downgrade():
+    op.drop_index('task_project_id_created_idx')
+    op.drop_index('task_project_id_priority_idx')
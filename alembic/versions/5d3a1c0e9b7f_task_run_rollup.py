@@ -0,0 +1,39 @@
+"""task_run_rollup
+
+Revision ID: 5d3a1c0e9b7f
+Revises: 2edf951cc6ae
+Create Date: 2018-06-04 10:12:40.118233
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d3a1c0e9b7f'
+down_revision = '2edf951cc6ae'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TIMESTAMP
+
+
+def upgrade():
+    op.create_table(
+        'task_run_rollup',
+        sa.Column('project_id', sa.Integer,
+                  sa.ForeignKey('project.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('hour', TIMESTAMP, primary_key=True),
+        sa.Column('user_id', sa.Integer, primary_key=True, default=0),
+        sa.Column('user_ip', sa.Text, primary_key=True, default=u''),
+        sa.Column('n_task_runs', sa.Integer, nullable=False, default=0),
+        sa.Column('n_tasks', sa.Integer, nullable=False, default=0)
+    )
+    op.create_table(
+        'rollup_watermark',
+        sa.Column('name', sa.Text, primary_key=True),
+        sa.Column('last_id', sa.Integer, nullable=False, default=0)
+    )
+
+
+def downgrade():
+    op.drop_table('rollup_watermark')
+    op.drop_table('task_run_rollup')
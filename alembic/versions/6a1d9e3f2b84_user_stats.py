@@ -0,0 +1,61 @@
+"""user_stats and user_project_stats
+
+Revision ID: 6a1d9e3f2b84
+Revises: 3f8b6d2c4a90
+Create Date: 2018-07-02 11:05:48.530170
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6a1d9e3f2b84'
+down_revision = '3f8b6d2c4a90'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'user_stats',
+        sa.Column('user_id', sa.Integer,
+                  sa.ForeignKey('user.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('n_answers', sa.Integer, nullable=False, default=0),
+        sa.Column('n_projects', sa.Integer, nullable=False, default=0),
+        sa.Column('first_submission_on', sa.Text),
+        sa.Column('last_submission_on', sa.Text),
+        sa.Column('total_time', sa.Float, nullable=False, default=0)
+    )
+    op.create_table(
+        'user_project_stats',
+        sa.Column('user_id', sa.Integer,
+                  sa.ForeignKey('user.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('project_id', sa.Integer,
+                  sa.ForeignKey('project.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('n_answers', sa.Integer, nullable=False, default=0),
+        sa.Column('last_submission_on', sa.Text)
+    )
+    op.execute('''
+        INSERT INTO user_project_stats (user_id, project_id, n_answers,
+                                        last_submission_on)
+        SELECT user_id, project_id, COUNT(id), MAX(finish_time)
+        FROM task_run WHERE user_id IS NOT NULL
+        GROUP BY user_id, project_id
+        ''')
+    op.execute('''
+        INSERT INTO user_stats (user_id, n_answers, n_projects,
+                                first_submission_on, last_submission_on,
+                                total_time)
+        SELECT user_id, COUNT(id), COUNT(DISTINCT project_id),
+               MIN(finish_time), MAX(finish_time),
+               COALESCE(SUM(EXTRACT(EPOCH FROM finish_time_ts - created_ts)), 0)
+        FROM task_run WHERE user_id IS NOT NULL
+        GROUP BY user_id
+        ''')
+
+
+def downgrade():
+    op.drop_table('user_project_stats')
+    op.drop_table('user_stats')
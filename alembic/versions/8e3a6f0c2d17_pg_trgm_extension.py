@@ -0,0 +1,22 @@
+"""pg_trgm extension for the searchable columns indexes
+
+Revision ID: 8e3a6f0c2d17
+Revises: 5d2c8e1b7f43
+Create Date: 2018-07-16 09:41:27.604113
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8e3a6f0c2d17'
+down_revision = '5d2c8e1b7f43'
+
+from alembic import op
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+def downgrade():
+    # drops the searchable columns indexes too
+    op.execute('DROP EXTENSION IF EXISTS pg_trgm CASCADE')
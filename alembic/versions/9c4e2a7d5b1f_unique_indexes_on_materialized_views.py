@@ -0,0 +1,32 @@
+"""recreate materialized views with unique indexes
+
+Revision ID: 9c4e2a7d5b1f
+Revises: c3e8f1a6d2b9
+Create Date: 2018-06-18 10:12:37.220431
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9c4e2a7d5b1f'
+down_revision = 'c3e8f1a6d2b9'
+
+from alembic import op
+
+
+# Dashboard views are recreated by their jobs with the unique indexes
+# needed by REFRESH MATERIALIZED VIEW CONCURRENTLY. users_rank has been
+# replaced by the Redis leaderboard scores.
+VIEWS = ['dashboard_week_users', 'dashboard_week_anon',
+         'dashboard_week_project_draft', 'dashboard_week_project_published',
+         'dashboard_week_project_update', 'dashboard_week_new_task',
+         'dashboard_week_new_task_run', 'dashboard_week_new_users',
+         'dashboard_week_returning_users', 'users_rank']
+
+
+def upgrade():
+    for view in VIEWS:
+        op.execute('DROP MATERIALIZED VIEW IF EXISTS %s;' % view)
+
+
+def downgrade():
+    pass
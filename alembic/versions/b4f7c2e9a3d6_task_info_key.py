@@ -0,0 +1,49 @@
+"""task_info_key catalog
+
+Revision ID: b4f7c2e9a3d6
+Revises: 8e3a6f0c2d17
+Create Date: 2018-07-23 10:18:52.746310
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b4f7c2e9a3d6'
+down_revision = '8e3a6f0c2d17'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'task_info_key',
+        sa.Column('project_id', sa.Integer,
+                  sa.ForeignKey('project.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('path', sa.Text, primary_key=True),
+        sa.Column('json_type', sa.Text, primary_key=True),
+        sa.Column('depth', sa.Integer, nullable=False, default=0),
+        sa.Column('n_tasks', sa.Integer, nullable=False, default=0)
+    )
+    op.execute('''
+        WITH RECURSIVE info_key(project_id, path, depth, value) AS (
+            SELECT task.project_id, e.key, 0, e.value
+            FROM task CROSS JOIN LATERAL jsonb_each(
+                CASE WHEN jsonb_typeof(task.info) = 'object'
+                THEN task.info ELSE '{}' END) AS e
+            UNION ALL
+            SELECT info_key.project_id, info_key.path || '__' || e.key,
+                   info_key.depth + 1, e.value
+            FROM info_key CROSS JOIN LATERAL jsonb_each(
+                CASE WHEN jsonb_typeof(info_key.value) = 'object'
+                THEN info_key.value ELSE '{}' END) AS e
+        )
+        INSERT INTO task_info_key (project_id, path, json_type, depth,
+                                   n_tasks)
+        SELECT project_id, path, jsonb_typeof(value), MIN(depth), COUNT(*)
+        FROM info_key GROUP BY project_id, path, jsonb_typeof(value)
+        ''')
+
+
+def downgrade():
+    op.drop_table('task_info_key')
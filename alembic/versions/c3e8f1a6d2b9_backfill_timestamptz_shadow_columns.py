@@ -0,0 +1,74 @@
+"""backfill and index the timestamptz shadow columns
+
+Revision ID: c3e8f1a6d2b9
+Revises: 7b2e4f9a1c3d
+Create Date: 2018-06-11 09:58:40.117253
+
+This migration does not run in the migration transaction. env.py runs
+every migration in its own transaction, so the shadow columns added by
+7b2e4f9a1c3d are committed when it starts; the rows are then backfilled
+in batches, and the indexes built CONCURRENTLY, through a separate
+AUTOCOMMIT connection while the tables are still written. If it fails
+half way it can be run again: the batches and the indexes are idempotent.
+In offline mode the backfill and the indexes are emitted as plain
+statements instead.
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8f1a6d2b9'
+down_revision = '7b2e4f9a1c3d'
+
+from alembic import op, context
+
+
+SHADOWS = [('task', ['created'], [['created_ts'], ['project_id', 'created_ts']]),
+           ('task_run', ['created', 'finish_time'],
+            [['finish_time_ts'], ['project_id', 'finish_time_ts']]),
+           ('project', ['created', 'updated'],
+            [['created_ts'], ['updated_ts']])]
+
+BATCH_SIZE = 10000
+
+
+def index_name(table, index):
+    return '%s_%s_idx' % (table, '_'.join(index))
+
+
+def assignments(columns):
+    return ', '.join('%s_ts = iso_to_timestamptz(%s)' % (column, column)
+                     for column in columns)
+
+
+def upgrade():
+    if context.is_offline_mode():
+        for table, columns, indexes in SHADOWS:
+            op.execute('UPDATE %s SET %s;' % (table, assignments(columns)))
+            for index in indexes:
+                op.execute('CREATE INDEX %s ON %s (%s);'
+                           % (index_name(table, index), table,
+                              ', '.join(index)))
+        return
+
+    conn = op.get_bind().engine.connect().execution_options(
+        isolation_level='AUTOCOMMIT')
+    try:
+        for table, columns, indexes in SHADOWS:
+            max_id = conn.execute('SELECT MAX(id) FROM %s' % table).scalar()
+            for first_id in xrange(0, max_id or 0, BATCH_SIZE):
+                conn.execute('UPDATE %s SET %s WHERE id > %s AND id <= %s'
+                             % (table, assignments(columns), first_id,
+                                first_id + BATCH_SIZE))
+            for index in indexes:
+                conn.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS %s '
+                             'ON %s (%s)'
+                             % (index_name(table, index), table,
+                                ', '.join(index)))
+    finally:
+        conn.close()
+
+
+def downgrade():
+    for table, columns, indexes in SHADOWS:
+        for index in indexes:
+            op.execute('DROP INDEX IF EXISTS %s;' % index_name(table, index))
@@ -656,6 +656,21 @@ def update_project_stats():
                        VALUES (%s, 0, 0, 0, 0, 0, 0, 0, 0, 0, '{}');""" % (project.id)
         db.engine.execute(sql_query)
 
+def update_user_stats():
+    """Backfill the user_stats and user_project_stats tables."""
+    from pybossa.cache.users import rebuild_user_stats
+
+    print "Computing user stats from the task runs"
+    rebuild_user_stats()
+
+def rebuild_site_activity():
+    """Aggregate the whole history of the site_activity rollup again."""
+    from pybossa.cache.site_stats import update_site_activity
+
+    with app.app_context():
+        print "Computing site activity from the tasks and task runs"
+        update_site_activity(rebuild=True)
+
 def anonymize_ips():
     """Anonymize all the IPs of the server."""
     from pybossa.core import anonymizer, task_repo
@@ -45,6 +45,7 @@ import pybossa.model as model
 from pybossa.core import csrf, ratelimits, sentinel, anonymizer
 from pybossa.ratelimit import ratelimit
 from pybossa.cache.projects import n_tasks
+from pybossa.traffic import increment_project_traffic
 import pybossa.sched as sched
 from pybossa.util import sign_task
 from pybossa.error import ErrorStatus
@@ -73,6 +74,8 @@ from pybossa.sched import (get_project_scheduler_and_timeout, get_scheduler_and_
                            has_lock, release_lock, Schedulers, get_locks)
 from pybossa.api.project_by_name import ProjectByNameAPI
 from pybossa.api.pwd_manager import get_pwd_manager
+from pybossa.api.api_base import get_etag, conditional_response
+from pybossa.cache import get_cache_group_generation
 
 blueprint = Blueprint('api', __name__)
 
@@ -153,6 +156,7 @@ def new_task(project_id):
         if type(tasks) is Response:
             return tasks
 
+        increment_project_traffic(project_id)
         user_id_or_ip = get_user_id_or_ip()
         # If there is a task for the user, return it
         if tasks is not None:
@@ -274,9 +278,20 @@ def user_progress(project_id=None, short_name=None):
     if current_user.is_anonymous():
         return abort(401)
     if project_id or short_name:
+        project = None
         if short_name:
             project = project_repo.get_by_shortname(short_name)
-        elif project_id:
+            if project is None:
+                return abort(404)
+            project_id = project.id
+        # Answered before loading the project when nothing has changed
+        etag = get_etag('userprogress', project_id, current_user.id,
+                        current_user.user_pref,
+                        get_cache_group_generation(project_id))
+        not_modified = conditional_response(etag)
+        if not_modified:
+            return not_modified
+        if project is None:
             project = project_repo.get(project_id)
 
         if project:
@@ -289,7 +304,9 @@ def user_progress(project_id=None, short_name=None):
             num_available_tasks_for_user = n_available_tasks_for_user(project, current_user.id)
             tmp = dict(done=taskrun_count, total=n_tasks(project.id), remaining=num_available_tasks,
                        remaining_for_user=num_available_tasks_for_user)
-            return Response(json.dumps(tmp), mimetype="application/json")
+            response = Response(json.dumps(tmp), mimetype="application/json")
+            response.set_etag(etag)
+            return response
         else:
             return abort(404)
     else:  # pragma: no cover
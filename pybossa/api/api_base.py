@@ -27,7 +27,10 @@ This package adds GET, POST, PUT and DELETE methods for any class:
 
 """
 import json
-from flask import request, abort, Response, current_app
+import hashlib
+from collections import defaultdict
+from itertools import islice
+from flask import request, abort, Response, current_app, stream_with_context
 from flask.ext.login import current_user
 from flask.views import MethodView
 from werkzeug.exceptions import NotFound, Unauthorized, Forbidden, BadRequest
@@ -46,6 +49,7 @@ from pybossa.model import DomainObject, announcement
 from pybossa.model.task import Task
 from pybossa.cache.projects import clean_project
 from pybossa.cache.users import delete_user_summary_id
+from pybossa.cache import get_cache_group_generation
 
 repos = {'Task': {'repo': task_repo, 'filter': 'filter_tasks_by',
                   'get': 'get_task', 'save': 'save', 'update': 'update',
@@ -83,6 +87,22 @@ cors_headers = ['Content-Type', 'Authorization']
 
 error = ErrorStatus()
 
+# Rows dictized per batch of related objects when streaming
+related_chunk_size = 100
+
+
+def get_etag(*parts):
+    """Return an ETag for a response identified by the given parts."""
+    return hashlib.md5(json.dumps(parts, default=str)).hexdigest()
+
+
+def conditional_response(etag):
+    """Return a 304 response if the request already has the given ETag."""
+    if etag and request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
 
 class APIBase(MethodView):
 
@@ -92,6 +112,11 @@ class APIBase(MethodView):
 
     allowed_classes_upload = ['blogpost', 'helpingmaterial', 'announcement']
 
+    # Columns _select_attributes reads, loaded even if not in fields=
+    fields_select_requires = ()
+
+    _related = None
+
     def refresh_cache(self, cls_name, oid):
         """Refresh the cache."""
         if caching.get(cls_name):
@@ -122,38 +147,132 @@ class APIBase(MethodView):
         """
         try:
             ensure_authorized_to('read', self.__class__)
-            query = self._db_query(oid)
-            json_response = self._create_json_response(query, oid)
-            return Response(json_response, mimetype='application/json')
+            etag = self._get_etag(oid)
+            not_modified = conditional_response(etag)
+            if not_modified:
+                return not_modified
+            if oid is None and self._ndjson_requested():
+                response = self._create_ndjson_response()
+            else:
+                query = self._db_query(oid)
+                json_response = self._create_json_response(query, oid)
+                response = Response(json_response,
+                                    mimetype='application/json')
+            if etag:
+                response.set_etag(etag)
+            return response
         except Exception as e:
             return error.format_exception(
                 e,
                 target=self.__class__.__name__.lower(),
                 action='GET')
 
+    def _get_etag(self, oid):
+        """Return an ETag for the request, or None.
+
+        The ETag is derived from the generation of the project cache group,
+        so it can only be built for requests scoped to one project: listings
+        of project owned objects filtered by a single project_id and single
+        projects. Every write to those objects must bump the generation.
+        """
+        if request.args.get('callback'):
+            return None
+        if oid is None and hasattr(self.__class__, 'project_id'):
+            project_id = request.args.get('project_id', '')
+        elif self.__class__.__name__ == 'Project':
+            project_id = str(oid)
+        else:
+            return None
+        if not project_id.isdigit():
+            return None
+        generation = get_cache_group_generation(int(project_id))
+        return get_etag(self.__class__.__name__, oid, request.full_path,
+                        request.headers.get('Accept'), get_user_id_or_ip(),
+                        generation)
+
+    def _ndjson_requested(self):
+        best = request.accept_mimetypes.best_match(['application/json',
+                                                    'application/x-ndjson'])
+        return best == 'application/x-ndjson'
+
+    def _create_ndjson_response(self):
+        """Stream the filtered items as newline delimited JSON.
+
+        Rows are read through a server side cursor and written one object
+        per line, so large limits do not have to be held in memory. Items
+        are always returned in id order; use the id of the last line as
+        last_id to fetch the next page.
+        """
+        repo_info = repos[self.__class__.__name__]
+        limit = self._set_ndjson_limit()
+        results = self._filter_query(repo_info, limit, 0, 'id',
+                                     yielded=True)
+        # Run the query before streaming so errors get a proper status
+        rows = iter(results)
+
+        def gen_ndjson():
+            chunks = iter(lambda: list(islice(rows, related_chunk_size)), [])
+            for chunk in chunks:
+                self._related = self._prefetch_related(chunk)
+                self._prepare_auth(self._unpack_items(chunk))
+                for result in chunk:
+                    item, datum = self._create_datum(result)
+                    if datum is None:
+                        continue
+                    try:
+                        ensure_authorized_to('read', item)
+                    except (Forbidden, Unauthorized):
+                        continue
+                    yield json.dumps(datum) + '\n'
+
+        return Response(stream_with_context(gen_ndjson()),
+                        mimetype='application/x-ndjson')
+
+    def _set_ndjson_limit(self):
+        max_limit = current_app.config.get('API_NDJSON_MAX_LIMIT')
+        try:
+            return min(max_limit, int(request.args.get('limit')))
+        except (ValueError, TypeError):
+            return max_limit
+
+    def _unpack_result(self, result):
+        # This is for n_favs orderby case
+        if not isinstance(result, DomainObject):
+            if 'n_favs' in result.keys():
+                result = result[0]
+        if (result.__class__ != self.__class__):
+            return result
+        return result, None, None
+
+    def _unpack_items(self, query_result):
+        return [self._unpack_result(result)[0]
+                for result in query_result if result is not None]
+
+    def _create_datum(self, result, trim=True):
+        item, headline, rank = self._unpack_result(result)
+        if not self._verify_auth(item):
+            return item, None
+        datum = self._create_dict_from_model(item)
+        if trim:
+            self._trim_fields(datum)
+        if headline:
+            datum['headline'] = headline
+        if rank:
+            datum['rank'] = rank
+        return item, datum
+
     def _create_json_response(self, query_result, oid):
         if len(query_result) == 1 and query_result[0] is None:
             raise abort(404)
         items = []
+        self._related = self._prefetch_related(query_result)
+        self._prepare_auth(self._unpack_items(query_result))
         for result in query_result:
-            # This is for n_favs orderby case
-            if not isinstance(result, DomainObject):
-                if 'n_favs' in result.keys():
-                    result = result[0]
             try:
-                if (result.__class__ != self.__class__):
-                    (item, headline, rank) = result
-                else:
-                    item = result
-                    headline = None
-                    rank = None
-                if not self._verify_auth(item):
+                # a single item is signed before it is trimmed to fields=
+                item, datum = self._create_datum(result, trim=oid is None)
+                if datum is None:
                     continue
-                datum = self._create_dict_from_model(item)
-                if headline:
-                    datum['headline'] = headline
-                if rank:
-                    datum['rank'] = rank
                 ensure_authorized_to('read', item)
                 items.append(datum)
             except (Forbidden, Unauthorized):
@@ -167,44 +286,102 @@ class APIBase(MethodView):
                 raise Forbidden('Forbidden')
             ensure_authorized_to('read', query_result[0])
             self._sign_item(items[0])
-            items = items[0]
+            items = self._trim_fields(items[0])
         return json.dumps(items)
 
     def _create_dict_from_model(self, model):
         return self._select_attributes(self._add_hateoas_links(model))
 
+    def _trim_fields(self, datum):
+        """Remove from datum the columns not requested with fields=."""
+        fields = self._get_fields()
+        if fields:
+            columns = self.__class__.__table__.columns
+            for key in datum.keys():
+                if key in columns and key not in fields:
+                    del datum[key]
+        return datum
+
+    def _get_fields(self):
+        """Return the columns requested with fields=, or None for all."""
+        fields = request.args.get('fields')
+        if not fields:
+            return None
+        columns = self.__class__.__table__.columns
+        fields = [field.strip() for field in fields.split(',')
+                  if field.strip()]
+        for field in fields:
+            if (field not in columns or
+                    columns[field].info.get('timestamp_shadow')):
+                raise AttributeError('Invalid field: %s' % field)
+        return fields
+
+    def _get_load_fields(self, fields):
+        """Return the columns to load from the DB for a fields= request.
+
+        Besides the requested columns it includes the keys used for links,
+        related objects and authorization.
+        """
+        columns = self.__class__.__table__.columns
+        load = set(fields) | set(self.fields_select_requires)
+        load.update(key for key in ('id', 'project_id', 'task_id',
+                                    'category_id')
+                    if key in columns)
+        return sorted(load)
+
+    def _prefetch_related(self, query_result):
+        """Load the related objects of a page of items in a few queries.
+
+        Returns a dict with the dictized tasks, task runs and last version
+        results of the items, keyed by task id, or None when the request
+        does not ask for related objects.
+        """
+        if not request.args.get('related'):
+            return None
+        items = self._unpack_items(query_result)
+        task_ids = set()
+        cls_names = set()
+        for item in items:
+            cls_name = item.__class__.__name__
+            if cls_name == 'Task':
+                task_ids.add(item.id)
+            elif cls_name in ['TaskRun', 'Result']:
+                task_ids.add(item.task_id)
+            cls_names.add(cls_name)
+        task_ids = list(task_ids)
+        related = dict(tasks={}, task_runs=defaultdict(list), results={})
+        if cls_names & set(['TaskRun', 'Result']):
+            for t in task_repo.get_tasks_by_ids(task_ids):
+                related['tasks'][t.id] = t.dictize()
+        if cls_names & set(['Task', 'Result']):
+            for tr in task_repo.get_task_runs_by_task_ids(task_ids):
+                related['task_runs'][tr.task_id].append(tr.dictize())
+        if cls_names & set(['Task', 'TaskRun']):
+            for r in result_repo.get_last_versions_by_task_ids(task_ids):
+                related['results'][r.task_id] = r.dictize()
+        return related
+
     def _add_hateoas_links(self, item):
-        obj = item.dictize()
+        fields = self._get_fields()
+        if fields:
+            obj = item.dictize(self._get_load_fields(fields))
+        else:
+            obj = item.dictize()
         related = request.args.get('related')
         if related:
+            related = self._related or self._prefetch_related([item])
             if item.__class__.__name__ == 'Task':
-                obj['task_runs'] = []
-                obj['result'] = None
-                task_runs = task_repo.filter_task_runs_by(task_id=item.id)
-                results = result_repo.filter_by(task_id=item.id, last_version=True)
-                for tr in task_runs:
-                    obj['task_runs'].append(tr.dictize())
-                for r in results:
-                    obj['result'] = r.dictize()
+                obj['task_runs'] = list(related['task_runs'].get(item.id, []))
+                obj['result'] = related['results'].get(item.id)
 
             if item.__class__.__name__ == 'TaskRun':
-                tasks = task_repo.filter_tasks_by(id=item.task_id)
-                results = result_repo.filter_by(task_id=item.task_id, last_version=True)
-                obj['task'] = None
-                obj['result'] = None
-                for t in tasks:
-                    obj['task'] = t.dictize()
-                for r in results:
-                    obj['result'] = r.dictize()
+                obj['task'] = related['tasks'].get(item.task_id)
+                obj['result'] = related['results'].get(item.task_id)
 
             if item.__class__.__name__ == 'Result':
-                tasks = task_repo.filter_tasks_by(id=item.task_id)
-                task_runs = task_repo.filter_task_runs_by(task_id=item.task_id)
-                obj['task_runs'] = []
-                for t in tasks:
-                    obj['task'] = t.dictize()
-                for tr in task_runs:
-                    obj['task_runs'].append(tr.dictize())
+                obj['task_runs'] = list(related['task_runs'].get(item.task_id, []))
+                if item.task_id in related['tasks']:
+                    obj['task'] = related['tasks'][item.task_id]
 
         links, link = self.hateoas.create_links(item)
         if links:
@@ -232,12 +409,13 @@ class APIBase(MethodView):
             del filters['owner_id']
         return filters
 
-    def _filter_query(self, repo_info, limit, offset, orderby):
+    def _filter_query(self, repo_info, limit, offset, orderby,
+                      yielded=False):
         filters = {}
         for k in request.args.keys():
             if k not in ['limit', 'offset', 'api_key', 'last_id', 'all',
                          'fulltextsearch', 'desc', 'orderby', 'related',
-                         'participated', 'full']:
+                         'participated', 'full', 'fields']:
                 # Raise an error if the k arg is not a column
                 if self.__class__ == Task and k == 'external_uid':
                     pass
@@ -248,20 +426,27 @@ class APIBase(MethodView):
         filters = self.api_context(all_arg=request.args.get('all'), **filters)
         query_func = repo_info['filter']
         filters = self._custom_filter(filters)
+        fields = self._get_fields()
+        if fields:
+            filters['fields'] = self._get_load_fields(fields)
         last_id = request.args.get('last_id')
         if request.args.get('participated'):
             filters['participated'] = get_user_id_or_ip()
         fulltextsearch = request.args.get('fulltextsearch')
         desc = request.args.get('desc') if request.args.get('desc') else False
         desc = fuzzyboolean(desc)
+        if yielded:
+            desc = False
         if last_id:
             results = getattr(repo, query_func)(limit=limit, last_id=last_id,
+                                                yielded=yielded,
                                                 fulltextsearch=fulltextsearch,
                                                 desc=False,
                                                 orderby=orderby,
                                                 **filters)
         else:
             results = getattr(repo, query_func)(limit=limit, offset=offset,
+                                                yielded=yielded,
                                                 fulltextsearch=fulltextsearch,
                                                 desc=desc,
                                                 orderby=orderby,
@@ -551,6 +736,12 @@ class APIBase(MethodView):
                 uploader.delete_file(obj.info['file_name'],
                                      obj.info['container'])
 
+    def _prepare_auth(self, items):
+        """Method to be overriden in inheriting classes that need to load
+        data for _verify_auth, once for a whole page of items
+        """
+        pass
+
     def _verify_auth(self, item):
         """Method to be overriden in inheriting classes for additional checks
         on the items to return
@@ -48,6 +48,7 @@ class ProjectAPI(APIBase):
     """
 
     __class__ = Project
+    fields_select_requires = ('owners_ids', 'info')
     reserved_keys = set(['id', 'created', 'updated', 'completed', 'contacted',
                          'published', 'secret_key'])
     private_keys = set(['secret_key'])
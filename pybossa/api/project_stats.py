@@ -31,7 +31,7 @@ class ProjectStatsAPI(APIBase):
     __class__ = ProjectStats
 
     def _select_attributes(self, stats_data):
-        if not request.args.get('full'):
+        if not request.args.get('full') and 'info' in stats_data:
             tmp = copy.deepcopy(stats_data)
             tmp['info'].pop('hours_stats', None)
             tmp['info'].pop('dates_stats', None)
@@ -33,7 +33,7 @@ from api_base import APIBase
 from pybossa.api.pwd_manager import get_pwd_manager
 from pybossa.util import get_user_id_or_ip, validate_required_fields
 from pybossa.core import task_repo
-from pybossa.cache.projects import get_project_data
+from pybossa.cache.projects import get_project_data, get_projects_data
 import json
 
 
@@ -43,6 +43,7 @@ class TaskAPI(APIBase):
 
     __class__ = Task
     reserved_keys = set(['id', 'created', 'state', 'fav_user_ids'])
+    _project_access = None
 
     def _forbidden_attributes(self, data):
         for key in data.keys():
@@ -71,14 +72,32 @@ class TaskAPI(APIBase):
             raise BadRequest('Missing or incorrect required fields: {}'
                             .format(','.join(invalid_fields)))
 
+    def _prepare_auth(self, items):
+        """Resolve the project access of a page of tasks, once per project."""
+        if self._project_access is None:
+            self._project_access = {}
+        if not current_user.is_authenticated():
+            return
+        if current_user.admin or current_user.subadmin:
+            return
+        project_ids = set(item.project_id for item in items)
+        project_ids.difference_update(self._project_access)
+        user_id_or_ip = get_user_id_or_ip()
+        for project_data in get_projects_data(project_ids):
+            project = Project(**project_data)
+            pwd_manager = get_pwd_manager(project)
+            self._project_access[project.id] = \
+                not pwd_manager.password_needed(project, user_id_or_ip)
+
     def _verify_auth(self, item):
         if not current_user.is_authenticated():
             return False
         if current_user.admin or current_user.subadmin:
             return True
-        project = Project(**get_project_data(item.project_id))
-        pwd_manager = get_pwd_manager(project)
-        return not pwd_manager.password_needed(project, get_user_id_or_ip())
+        if (self._project_access is None or
+                item.project_id not in self._project_access):
+            self._prepare_auth([item])
+        return self._project_access[item.project_id]
 
     def _sign_item(self, item):
         project_id = item['project_id']
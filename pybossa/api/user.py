@@ -37,6 +37,8 @@ class UserAPI(APIBase):
     """
 
     __class__ = User
+    fields_select_requires = ('email_addr', 'admin', 'subadmin', 'pro',
+                              'enabled', 'info', 'privacy_mode')
 
     # Define private and public fields available through the API
     # (maybe should be defined in the model?) There are fields like password hash
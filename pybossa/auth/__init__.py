@@ -17,7 +17,7 @@
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 
 import inspect
-from flask import abort
+from flask import abort, g, has_app_context
 from flask.ext.login import current_user
 from pybossa.core import announcement_repo, task_repo, project_repo, result_repo
 from pybossa.core import project_stats_repo
@@ -93,6 +93,17 @@ def ensure_authorized_to(action, resource, **kwargs):
 
 
 def _authorizer_for(resource_name):
+    if not has_app_context():
+        return _create_authorizer(resource_name)
+    authorizers = getattr(g, '_authorizers', None)
+    if authorizers is None:
+        authorizers = g._authorizers = {}
+    if resource_name not in authorizers:
+        authorizers[resource_name] = _create_authorizer(resource_name)
+    return authorizers[resource_name]
+
+
+def _create_authorizer(resource_name):
     kwargs = {}
     if resource_name in ('project', 'taskrun'):
         kwargs.update({'task_repo': task_repo})
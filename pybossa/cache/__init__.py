@@ -24,10 +24,18 @@ It exports:
     * memoize: for caching functions using its arguments as part of the key
     * delete_cached: to remove a cached value
     * delete_memoized: to remove a cached value from the memoize decorator
+    * serialize/deserialize: to encode the values stored in Redis
+    * get_cache_stats: to get the hits, misses and timings of cached functions
+    * cache_disabled: to bypass the cache in the current thread or greenlet
+    * get_cache_group_generation: to validate responses built from a group
 
 """
 import os
+import time
+import zlib
 import hashlib
+import threading
+from contextlib import contextmanager
 from functools import wraps
 from pybossa.core import sentinel
 from pybossa.sentinel import keys, scan_iter
@@ -37,6 +45,11 @@ try:
 except ImportError:  # pragma: no cover
     import pickle
 
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
 try:
     import settings_local as settings
 except ImportError:  # pragma: no cover
@@ -49,6 +62,122 @@ HALF_HOUR = 30 * 60
 FIVE_MINUTES = 5 * 60
 ONE_WEEK = 7 * ONE_DAY
 
+# In-process hits/misses/time/bytes per cached function, see record_cache_stat
+_cache_stats = {}
+_stats_lock = threading.Lock()
+_stats_flushed_at = [time.time()]
+
+# Thread (or greenlet, when monkey patched) local cache bypass flag
+_local = threading.local()
+
+# Serialized values start with a header: a magic prefix that can't begin a
+# legacy (protocol 0) pickle, a format version, the codec and the compression.
+SERIALIZER_MAGIC = '\x00pb'
+SERIALIZER_VERSION = '1'
+CODEC_PICKLE = 'p'
+CODEC_MSGPACK = 'm'
+COMPRESSION_NONE = '-'
+COMPRESSION_ZLIB = 'z'
+HEADER_LENGTH = len(SERIALIZER_MAGIC) + 3
+
+
+def _msgpack_dumps(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+def _pickle_dumps(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+CODECS = {
+    CODEC_PICKLE: (_pickle_dumps, pickle.loads),
+    CODEC_MSGPACK: (_msgpack_dumps, _msgpack_loads)
+}
+
+
+def get_serializer_codec():
+    """Return the codec configured in CACHE_SERIALIZER."""
+    name = getattr(settings, 'CACHE_SERIALIZER', 'pickle')
+    if name == 'msgpack' and msgpack is not None:
+        return CODEC_MSGPACK
+    return CODEC_PICKLE
+
+
+def serialize(value):
+    """
+    Serialize a value for storing it in Redis.
+
+    Values bigger than CACHE_COMPRESSION_THRESHOLD bytes are compressed.
+    Values msgpack can't encode (e.g. datetimes) fall back to pickle.
+
+    """
+    codec = get_serializer_codec()
+    try:
+        data = CODECS[codec][0](value)
+    except TypeError:
+        codec = CODEC_PICKLE
+        data = CODECS[codec][0](value)
+    compression = COMPRESSION_NONE
+    threshold = getattr(settings, 'CACHE_COMPRESSION_THRESHOLD', 1024)
+    if threshold is not None and len(data) > threshold:
+        level = getattr(settings, 'CACHE_COMPRESSION_LEVEL', 6)
+        compressed = zlib.compress(data, level)
+        if len(compressed) < len(data):
+            data = compressed
+            compression = COMPRESSION_ZLIB
+    return SERIALIZER_MAGIC + SERIALIZER_VERSION + codec + compression + data
+
+
+def deserialize(data):
+    """
+    Deserialize a value stored in Redis by serialize.
+
+    Values stored without header are legacy pickles and loaded as such.
+
+    """
+    if not data.startswith(SERIALIZER_MAGIC):
+        return pickle.loads(data)
+    header = data[len(SERIALIZER_MAGIC):HEADER_LENGTH]
+    version, codec, compression = header[0], header[1], header[2]
+    if version != SERIALIZER_VERSION or codec not in CODECS:
+        raise ValueError('Unknown cache serializer header: %r' % header)
+    payload = data[HEADER_LENGTH:]
+    if compression == COMPRESSION_ZLIB:
+        payload = zlib.decompress(payload)
+    return CODECS[codec][1](payload)
+
+
+def is_cache_disabled():
+    """
+    Return True if the cache is disabled for the whole process, through the
+    PYBOSSA_REDIS_CACHE_DISABLED environment variable, or for the current
+    thread by cache_disabled.
+
+    """
+    return (getattr(_local, 'cache_disabled', False) or
+            os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is not None)
+
+
+@contextmanager
+def cache_disabled():
+    """
+    Context manager that disables the cache in the current thread.
+
+    Cached functions called within it are computed and their values stored,
+    refreshing the cache. Other threads keep using the cache.
+
+    """
+    previous = getattr(_local, 'cache_disabled', False)
+    _local.cache_disabled = True
+    try:
+        yield
+    finally:
+        _local.cache_disabled = previous
+
 
 def get_key_to_hash(*args, **kwargs):
     """Return key to hash for *args and **kwargs."""
@@ -73,7 +202,8 @@ def get_cache_group_key(key):
     return '{}:memoize_cache_group:{}'.format(settings.REDIS_KEYPREFIX, key)
 
 
-def add_key_to_cache_groups(key_to_add, cache_group_keys_arg, *args, **kwargs):
+def _get_cache_group_keys(cache_group_keys_arg, *args, **kwargs):
+    group_keys = []
     for cache_group_key_arg in (cache_group_keys_arg or []):
         cache_group_key = None
         if isinstance(cache_group_key_arg, list):
@@ -85,8 +215,13 @@ def add_key_to_cache_groups(key_to_add, cache_group_keys_arg, *args, **kwargs):
         elif cache_group_key_arg is not None:
             raise Exception('Invalid cache_group_key_arg: {}'.format(cache_group_key_arg))
         else:
-            return
-        key = get_cache_group_key(cache_group_key)
+            break
+        group_keys.append(get_cache_group_key(cache_group_key))
+    return group_keys
+
+
+def add_key_to_cache_groups(key_to_add, cache_group_keys_arg, *args, **kwargs):
+    for key in _get_cache_group_keys(cache_group_keys_arg, *args, **kwargs):
         sentinel.master.sadd(key, key_to_add)
 
 
@@ -94,6 +229,175 @@ def delete_cache_group(cache_group_key):
     key = get_cache_group_key(cache_group_key)
     keys_to_delete = list(sentinel.slave.smembers(key)) + [key]
     sentinel.master.delete(*keys_to_delete)
+    bump_cache_group_generation(cache_group_key)
+
+
+def get_cache_group_generation_key(key):
+    return '{}:cache_group_generation:{}'.format(settings.REDIS_KEYPREFIX, key)
+
+
+def get_cache_group_generation(cache_group_key):
+    """Return a counter that changes every time the cache group is deleted.
+
+    It is read from the master so that a response is never validated
+    against a generation that a replica has not caught up with yet.
+    """
+    key = get_cache_group_generation_key(cache_group_key)
+    generation = sentinel.master.get(key)
+    if generation is None:
+        # Seed from the clock so a flushed counter does not repeat values
+        sentinel.master.setnx(key, int(time.time() * 1000))
+        generation = sentinel.master.get(key)
+    return int(generation)
+
+
+def bump_cache_group_generation(cache_group_key):
+    sentinel.master.incr(get_cache_group_generation_key(cache_group_key))
+
+
+def get_cache_stats_key(name=None):
+    """Return the Redis key holding the stats of a cached function."""
+    if name is None:
+        return '%s:cache_stats' % settings.REDIS_KEYPREFIX
+    return '%s:cache_stats:%s' % (settings.REDIS_KEYPREFIX, name)
+
+
+def record_cache_stat(name, hit, elapsed=0, size=0):
+    """
+    Record a lookup of a cached function in the in-process aggregates.
+
+    Aggregates are flushed to Redis every CACHE_STATS_FLUSH_INTERVAL seconds.
+
+    """
+    if not getattr(settings, 'CACHE_STATS_ENABLED', True):
+        return
+    with _stats_lock:
+        stats = _cache_stats.setdefault(name, dict(hits=0, misses=0,
+                                                   time=0.0, bytes=0))
+        if hit:
+            stats['hits'] += 1
+        else:
+            stats['misses'] += 1
+            stats['time'] += elapsed
+        stats['bytes'] += size
+    interval = getattr(settings, 'CACHE_STATS_FLUSH_INTERVAL', 60)
+    if time.time() - _stats_flushed_at[0] >= interval:
+        flush_cache_stats()
+
+
+def flush_cache_stats():
+    """Add the in-process aggregates to the stats stored in Redis."""
+    with _stats_lock:
+        pending = dict(_cache_stats)
+        _cache_stats.clear()
+        _stats_flushed_at[0] = time.time()
+    if not pending:
+        return
+    pipeline = sentinel.master.pipeline()
+    for name, stats in pending.iteritems():
+        key = get_cache_stats_key(name)
+        pipeline.sadd(get_cache_stats_key(), name)
+        pipeline.hincrby(key, 'hits', stats['hits'])
+        pipeline.hincrby(key, 'misses', stats['misses'])
+        pipeline.hincrbyfloat(key, 'time', stats['time'])
+        pipeline.hincrby(key, 'bytes', stats['bytes'])
+    pipeline.execute()
+
+
+def get_cache_stats():
+    """Return the stats of every cached function, sorted by name."""
+    names = sorted(sentinel.slave.smembers(get_cache_stats_key()))
+    pipeline = sentinel.slave.pipeline()
+    for name in names:
+        pipeline.hgetall(get_cache_stats_key(name))
+    cache_stats = []
+    for name, stats in zip(names, pipeline.execute()):
+        hits = int(stats.get('hits', 0))
+        misses = int(stats.get('misses', 0))
+        total_time = float(stats.get('time', 0))
+        total_bytes = int(stats.get('bytes', 0))
+        lookups = hits + misses
+        cache_stats.append(dict(
+            name=name, hits=hits, misses=misses,
+            hit_ratio=float(hits) / lookups if lookups else 0,
+            avg_time=total_time / misses if misses else 0,
+            avg_bytes=total_bytes / lookups if lookups else 0))
+    return cache_stats
+
+
+def reset_cache_stats():
+    """Remove the stats of every cached function."""
+    with _stats_lock:
+        _cache_stats.clear()
+    key = get_cache_stats_key()
+    names = sentinel.slave.smembers(key)
+    keys_to_delete = [get_cache_stats_key(name) for name in names] + [key]
+    sentinel.master.delete(*keys_to_delete)
+
+
+def _get_cached_or_compute(name, key, timeout, cache_group_keys, f, args,
+                           kwargs):
+    """Return the cached value for key, or compute it and store it."""
+    if not is_cache_disabled():
+        output = sentinel.slave.get(key)
+        if output:
+            record_cache_stat(name, hit=True, size=len(output))
+            return deserialize(output)
+        start = time.time()
+        value = f(*args, **kwargs)
+        elapsed = time.time() - start
+        output = serialize(value)
+        sentinel.master.setex(key, timeout, output)
+        add_key_to_cache_groups(key, cache_group_keys, *args, **kwargs)
+        record_cache_stat(name, hit=False, elapsed=elapsed, size=len(output))
+        return value
+    value = f(*args, **kwargs)
+    sentinel.master.setex(key, timeout, serialize(value))
+    add_key_to_cache_groups(key, cache_group_keys, *args, **kwargs)
+    return value
+
+
+def _get_many_cached_or_compute(name, keys, timeout, cache_group_keys, f,
+                                batch, args_list):
+    """
+    Return the cached values for keys, fetched with a single MGET.
+
+    The misses are computed with one call to batch, if given, or with one
+    call to f per miss, and stored with a single pipeline.
+
+    """
+    values = [None] * len(keys)
+    misses = range(len(keys))
+    cache_enabled = not is_cache_disabled()
+    if cache_enabled and keys:
+        misses = []
+        for i, output in enumerate(sentinel.slave.mget(keys)):
+            if output:
+                record_cache_stat(name, hit=True, size=len(output))
+                values[i] = deserialize(output)
+            else:
+                misses.append(i)
+    if not misses:
+        return values
+    miss_args = [args_list[i] for i in misses]
+    start = time.time()
+    if batch is not None:
+        computed = batch(miss_args)
+    else:
+        computed = [f(*args) for args in miss_args]
+    elapsed = (time.time() - start) / len(misses)
+    pipeline = sentinel.master.pipeline()
+    for i, value in zip(misses, computed):
+        output = serialize(value)
+        pipeline.setex(keys[i], timeout, output)
+        for group_key in _get_cache_group_keys(cache_group_keys, *args_list[i]):
+            pipeline.sadd(group_key, keys[i])
+        if cache_enabled:
+            record_cache_stat(name, hit=False, elapsed=elapsed,
+                              size=len(output))
+        values[i] = value
+    pipeline.execute()
+    return values
 
 
 def cache(key_prefix, timeout=300, cache_group_keys=None):
@@ -109,28 +413,24 @@ def cache(key_prefix, timeout=300, cache_group_keys=None):
         @wraps(f)
         def wrapper(*args, **kwargs):
             key = "%s::%s" % (settings.REDIS_KEYPREFIX, key_prefix)
-            if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
-                output = sentinel.slave.get(key)
-                if output:
-                    return pickle.loads(output)
-                output = f(*args, **kwargs)
-                sentinel.master.setex(key, timeout, pickle.dumps(output))
-                add_key_to_cache_groups(key, cache_group_keys, *args, **kwargs)
-                return output
-            output = f(*args, **kwargs)
-            sentinel.master.setex(key, timeout, pickle.dumps(output))
-            add_key_to_cache_groups(key, cache_group_keys, *args, **kwargs)
-            return output
+            return _get_cached_or_compute(key_prefix, key, timeout,
+                                          cache_group_keys, f, args, kwargs)
         return wrapper
     return decorator
 
 
-def memoize(timeout=300, cache_group_keys=None):
+def memoize(timeout=300, cache_group_keys=None, batch=None):
     """
     Decorator for caching functions using its arguments as part of the key.
 
     Returns the cached value, or the function if the cache is disabled
 
+    The decorated function gets a many(args_list) method returning the values
+    for a list of positional arguments (tuples, or single values for
+    functions of one argument) with a single MGET. If batch is given, it is
+    called with the list of arguments tuples that missed the cache and must
+    return their values in the same order.
+
     """
     if timeout is None:
         timeout = 300
@@ -140,18 +440,20 @@ def memoize(timeout=300, cache_group_keys=None):
             key = "%s:%s_args:" % (settings.REDIS_KEYPREFIX, f.__name__)
             key_to_hash = get_key_to_hash(*args, **kwargs)
             key = get_hash_key(key, key_to_hash)
-            if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
-                output = sentinel.slave.get(key)
-                if output:
-                    return pickle.loads(output)
-                output = f(*args, **kwargs)
-                sentinel.master.setex(key, timeout, pickle.dumps(output))
-                add_key_to_cache_groups(key, cache_group_keys, *args, **kwargs)
-                return output
-            output = f(*args, **kwargs)
-            sentinel.master.setex(key, timeout, pickle.dumps(output))
-            add_key_to_cache_groups(key, cache_group_keys, *args, **kwargs)
-            return output
+            return _get_cached_or_compute(f.__name__, key, timeout,
+                                          cache_group_keys, f, args, kwargs)
+
+        def many(args_list):
+            args_list = [args if isinstance(args, tuple) else (args,)
+                         for args in args_list]
+            prefix = "%s:%s_args:" % (settings.REDIS_KEYPREFIX, f.__name__)
+            keys = [get_hash_key(prefix, get_key_to_hash(*args))
+                    for args in args_list]
+            return _get_many_cached_or_compute(f.__name__, keys, timeout,
+                                               cache_group_keys, f, batch,
+                                               args_list)
+
+        wrapper.many = many
         return wrapper
     return decorator
 
@@ -177,18 +479,8 @@ def memoize_essentials(timeout=300, essentials=None, cache_group_keys=None):
             key += get_key_to_hash(*essential_args) + ":"
             key_to_hash = get_key_to_hash(*args, **kwargs)
             key = get_hash_key(key, key_to_hash)
-            if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
-                output = sentinel.slave.get(key)
-                if output:
-                    return pickle.loads(output)
-                output = f(*args, **kwargs)
-                sentinel.master.setex(key, timeout, pickle.dumps(output))
-                add_key_to_cache_groups(key, cache_group_keys, *args, **kwargs)
-                return output
-            output = f(*args, **kwargs)
-            sentinel.master.setex(key, timeout, pickle.dumps(output))
-            add_key_to_cache_groups(key, cache_group_keys, *args, **kwargs)
-            return output
+            return _get_cached_or_compute(f.__name__, key, timeout,
+                                          cache_group_keys, f, args, kwargs)
         return wrapper
     return decorator
 
@@ -200,7 +492,7 @@ def delete_cached(key):
     Returns True if success or no cache is enabled
 
     """
-    if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
+    if not is_cache_disabled():
         key = "%s::%s" % (settings.REDIS_KEYPREFIX, key)
         return bool(sentinel.master.delete(key))
     return True
@@ -213,7 +505,7 @@ def delete_memoized(function, *args, **kwargs):
     Returns True if success or no cache is enabled
 
     """
-    if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
+    if not is_cache_disabled():
         key = "%s:%s_args:" % (settings.REDIS_KEYPREFIX, function.__name__)
         if args or kwargs:
             key_to_hash = get_key_to_hash(*args, **kwargs)
@@ -233,7 +525,7 @@ def delete_memoized_essential(function, *args, **kwargs):
     Returns True if success or no cache is enabled
 
     """
-    if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
+    if not is_cache_disabled():
         key = "%s:%s_args:" % (settings.REDIS_KEYPREFIX, function.__name__)
         if args or kwargs:
             key += get_key_to_hash(*args, **kwargs)
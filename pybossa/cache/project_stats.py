@@ -20,15 +20,18 @@ from flask import current_app
 from sqlalchemy.sql import text
 from pybossa.core import db
 from pybossa.cache import memoize, ONE_DAY, FIVE_MINUTES, ONE_HOUR
+from pybossa.cache import bump_cache_group_generation
 import pybossa.cache.projects as cached_projects
 from pybossa.model.project_stats import ProjectStats
 from flask.ext.babel import gettext
 
-import operator
 import time
 import datetime
 import os
 
+import numpy as np
+import pandas as pd
+
 
 session = db.slave_session
 
@@ -43,102 +46,137 @@ def n_tasks(project_id):
     return projects.n_tasks(project_id)
 
 
-@memoize(timeout=ONE_HOUR)
-def stats_users(project_id, period=None):
-    """Return users's stats for a given project_id."""
-    users = {}
-    auth_users = []
-    anon_users = []
+ROLLUP_WATERMARK = 'task_run_rollup:%s'
 
-    # Get Authenticated Users
-    params = dict(project_id=project_id)
-    sql = text('''SELECT task_run.user_id AS user_id,
-               COUNT(task_run.id) as n_tasks FROM task_run
-               WHERE task_run.user_id IS NOT NULL AND
-               task_run.user_ip IS NULL AND
-               task_run.project_id=:project_id
-               GROUP BY task_run.user_id ORDER BY n_tasks DESC
-               LIMIT 10;''')\
-        .execution_options(stream=True)
-    if period:
-        sql = text('''SELECT task_run.user_id AS user_id,
-                   COUNT(task_run.id) as n_tasks FROM task_run
-                   WHERE task_run.user_id IS NOT NULL AND
-                   task_run.user_ip IS NULL AND
-                   task_run.project_id=:project_id AND
-                   TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                   >= NOW() - :period ::INTERVAL
-                   GROUP BY task_run.user_id ORDER BY n_tasks DESC
-                   LIMIT 10;''')\
-            .execution_options(stream=True)
-        params['period'] = period
-
-    results = session.execute(sql, params)
+ROLLUP_PERIOD = "DATE_TRUNC('day', hour) >= NOW() - :period ::INTERVAL"
 
-    for row in results:
-        auth_users.append([row.user_id, row.n_tasks])
-
-    sql = text('''SELECT count(distinct(task_run.user_id)) AS user_id
-               FROM task_run WHERE task_run.user_id IS NOT NULL AND
-               task_run.user_ip IS NULL AND
-               task_run.project_id=:project_id;''')
-    if period:
-        sql = text('''SELECT count(distinct(task_run.user_id)) AS user_id
-                   FROM task_run WHERE task_run.user_id IS NOT NULL AND
-                   task_run.user_ip IS NULL AND
-                   task_run.project_id=:project_id AND
-                   TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                   >= NOW() - :period ::INTERVAL
-                   ;''')
-
-    results = session.execute(sql, params)
-    for row in results:
-        users['n_auth'] = row[0]
-
-    # Get all Anonymous Users
-    sql = text('''SELECT task_run.user_ip AS user_ip,
-               COUNT(task_run.id) as n_tasks FROM task_run
-               WHERE task_run.user_ip IS NOT NULL AND
-               task_run.user_id IS NULL AND
-               task_run.project_id=:project_id
-               GROUP BY task_run.user_ip ORDER BY n_tasks DESC;''')\
-        .execution_options(stream=True)
-
-    if period:
-        sql = text('''SELECT task_run.user_ip AS user_ip,
-                   COUNT(task_run.id) as n_tasks FROM task_run
-                   WHERE task_run.user_ip IS NOT NULL AND
-                   task_run.user_id IS NULL AND
-                   task_run.project_id=:project_id AND
-                   TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                   >= NOW() - :period ::INTERVAL
-                   GROUP BY task_run.user_ip ORDER BY n_tasks DESC;''')\
-            .execution_options(stream=True)
-
-    results = session.execute(sql, params)
+#: Age after which a task run is assumed committed when other transactions
+#: are writing task runs, so the watermark can move past its id.
+ROLLUP_SETTLE = '10 minutes'
 
-    for row in results:
-        anon_users.append([row.user_ip, row.n_tasks])
-
-    sql = text('''SELECT COUNT(DISTINCT(task_run.user_ip)) AS user_ip
-               FROM task_run WHERE task_run.user_ip IS NOT NULL AND
-               task_run.user_id IS NULL AND
-               task_run.project_id=:project_id;''')
-    if period:
-        sql = text('''SELECT COUNT(DISTINCT(task_run.user_ip)) AS user_ip
-                   FROM task_run WHERE task_run.user_ip IS NOT NULL AND
-                   task_run.user_id IS NULL AND
-                   task_run.project_id=:project_id AND
-                   TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                   >= NOW() - :period ::INTERVAL
-                   ;''')
-
-    results = session.execute(sql, params)
 
-    for row in results:
-        users['n_anon'] = row[0]
+def _apply_task_run_rollup(project_id, last_id, new_last_id):
+    """Fold task runs with last_id < id <= new_last_id into the rollup."""
+    params = dict(project_id=project_id, last_id=last_id,
+                  new_last_id=new_last_id)
+    sql = text('''
+               INSERT INTO task_run_rollup
+               (project_id, hour, user_id, user_ip, n_task_runs, n_tasks)
+               SELECT :project_id,
+               DATE_TRUNC('hour', finish_time_ts AT TIME ZONE 'UTC') AS h,
+               COALESCE(user_id, 0) AS u_id, COALESCE(user_ip, '') AS u_ip,
+               COUNT(id), 0
+               FROM task_run WHERE project_id=:project_id
+               AND id > :last_id AND id <= :new_last_id
+               AND finish_time_ts IS NOT NULL
+               GROUP BY h, u_id, u_ip
+               ON CONFLICT (project_id, hour, user_id, user_ip) DO UPDATE
+               SET n_task_runs = task_run_rollup.n_task_runs
+                                 + EXCLUDED.n_task_runs;
+               ''')
+    db.session.execute(sql, params)
+
+    # A task is counted in the bucket of its latest task run, so move the
+    # touched tasks from the bucket they had at last_id to the new one.
+    sql = text('''
+               WITH touched AS (
+                   SELECT DISTINCT task_run.task_id FROM task_run, task
+                   WHERE task_run.task_id=task.id
+                   AND task.project_id=:project_id
+                   AND task_run.project_id=:project_id
+                   AND task_run.id > :last_id
+                   AND task_run.id <= :new_last_id),
+               latest AS (
+                   SELECT DISTINCT ON (task_run.task_id)
+                   DATE_TRUNC('hour', finish_time_ts AT TIME ZONE 'UTC') AS h,
+                   COALESCE(user_id, 0) AS u_id,
+                   COALESCE(user_ip, '') AS u_ip
+                   FROM task_run, touched
+                   WHERE task_run.task_id=touched.task_id
+                   AND task_run.id <= :up_to
+                   AND finish_time_ts IS NOT NULL
+                   ORDER BY task_run.task_id, finish_time_ts DESC,
+                   task_run.id DESC)
+               INSERT INTO task_run_rollup
+               (project_id, hour, user_id, user_ip, n_task_runs, n_tasks)
+               SELECT :project_id, h, u_id, u_ip, 0, :sign * COUNT(*)
+               FROM latest GROUP BY h, u_id, u_ip
+               ON CONFLICT (project_id, hour, user_id, user_ip) DO UPDATE
+               SET n_tasks = task_run_rollup.n_tasks + EXCLUDED.n_tasks;
+               ''')
+    if last_id:
+        db.session.execute(sql, dict(params, up_to=last_id, sign=-1))
+    db.session.execute(sql, dict(params, up_to=new_last_id, sign=1))
+
+
+def reset_task_run_rollup(conn, project_id):
+    """Make the next update rebuild the task_run_rollup of a project, after
+    its task runs were deleted."""
+    sql = text('''UPDATE rollup_watermark SET last_id=0
+               WHERE name=:name;''')
+    conn.execute(sql, dict(name=ROLLUP_WATERMARK % project_id))
+
+
+def _settled_task_run_id(project_id):
+    """Return the highest id up to which the task runs of a project are all
+    committed.
+
+    Ids are taken before their task runs commit, so a task run still being
+    written can get an id below the ones already visible. The sequence is
+    read before looking for other transactions writing task runs: if there
+    are none, every id it had handed out is final. Otherwise only the task
+    runs older than ROLLUP_SETTLE are taken as settled.
+    """
+    sql = text('''SELECT last_value FROM task_run_id_seq;''')
+    last_value = db.session.execute(sql).scalar()
+    sql = text('''SELECT EXISTS (SELECT 1 FROM pg_locks
+               WHERE relation = 'task_run'::regclass
+               AND mode = 'RowExclusiveLock'
+               AND pid <> pg_backend_pid());''')
+    if db.session.execute(sql).scalar():
+        sql = text('''SELECT COALESCE(MAX(id), 0) FROM task_run
+                   WHERE project_id=:project_id
+                   AND created_ts < NOW() - CAST(:settle AS INTERVAL);''')
+    else:
+        sql = text('''SELECT COALESCE(MAX(id), 0) FROM task_run
+                   WHERE project_id=:project_id AND id <= :last_value;''')
+    return db.session.execute(sql, dict(project_id=project_id,
+                                        last_value=last_value,
+                                        settle=ROLLUP_SETTLE)).scalar()
 
-    return users, anon_users, auth_users
+
+def update_task_run_rollup(project_id):
+    """Bring the hourly task_run_rollup of a project up to date and return
+    its watermark.
+
+    Only the settled task runs newer than the stored watermark are
+    aggregated, so a task run committing late is never left behind it. A
+    watermark set back to 0 by reset_task_run_rollup rebuilds the rollup
+    from scratch. Only the stats jobs call it, through update_stats.
+    """
+    name = ROLLUP_WATERMARK % project_id
+    sql = text('''INSERT INTO rollup_watermark (name, last_id)
+               VALUES (:name, 0) ON CONFLICT (name) DO NOTHING;''')
+    db.session.execute(sql, dict(name=name))
+    sql = text('''SELECT last_id FROM rollup_watermark WHERE name=:name
+               FOR UPDATE;''')
+    last_id = db.session.execute(sql, dict(name=name)).scalar()
+
+    new_last_id = _settled_task_run_id(project_id)
+
+    if last_id == 0 or new_last_id < last_id:
+        sql = text('''DELETE FROM task_run_rollup
+                   WHERE project_id=:project_id;''')
+        db.session.execute(sql, dict(project_id=project_id))
+        last_id = 0
+
+    if new_last_id > last_id:
+        _apply_task_run_rollup(project_id, last_id, new_last_id)
+    sql = text('''UPDATE rollup_watermark SET last_id=:last_id
+               WHERE name=:name;''')
+    db.session.execute(sql, dict(name=name, last_id=new_last_id))
+    db.session.commit()
+    return new_last_id
 
 
 def convert_period_to_days(period):
@@ -159,107 +197,35 @@ def convert_period_to_days(period):
     return int_period
 
 
-@memoize(timeout=ONE_HOUR)
-def stats_dates(project_id, period='15 day'):
-    """Return statistics with dates for a project."""
-    dates = {}
-    dates_anon = {}
-    dates_auth = {}
-
-    n_tasks(project_id)
-
-    params = dict(project_id=project_id, period=period)
-
-    # Get all completed tasks
-    sql = text('''
-               WITH myquery AS (
-               SELECT task.id, coalesce(ct, 0) as n_task_runs, task.n_answers
-               FROM task LEFT OUTER JOIN
-               (SELECT task_id, COUNT(id) AS ct FROM task_run
-               WHERE project_id=:project_id AND
-               TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-               >= NOW() - :period :: INTERVAL
-               GROUP BY task_id) AS log_counts
-               ON task.id=log_counts.task_id
-               WHERE task.project_id=:project_id ORDER BY id ASC)
-               select myquery.id, max(task_run.finish_time) as day
-               from task_run, myquery where task_run.task_id=myquery.id
-               and
-               TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-               >= NOW() - :period :: INTERVAL
-               group by myquery.id order by day;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        day = row.day[:10]
-        if day in dates.keys():
-            dates[day] += 1
-        else:
-            dates[day] = 1
-
-    # No completed tasks in the last period
-    def _fill_empty_days(days, obj):
-        if len(days) < convert_period_to_days(period):
-            base = datetime.datetime.today()
-            for x in range(0, convert_period_to_days(period)):
-                tmp_date = base - datetime.timedelta(days=x)
-                if tmp_date.strftime('%Y-%m-%d') not in days:
-                    obj[tmp_date.strftime('%Y-%m-%d')] = 0
-        return obj
-
-    dates = _fill_empty_days(dates.keys(), dates)
-
-    # Get all answers per date for auth
-    sql = text('''
-                WITH myquery AS (
-                    SELECT TO_DATE(finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    as d, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_ip IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY d)
-                SELECT to_char(d, 'YYYY-MM-DD') as d, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        dates_auth[row.d] = row.count
-
-    dates_auth = _fill_empty_days(dates_auth.keys(), dates_auth)
-
-    # Get all answers per date for anon
-    sql = text('''
-                WITH myquery AS (
-                    SELECT TO_DATE(finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    as d, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_id IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY d)
-               SELECT to_char(d, 'YYYY-MM-DD') as d, count  from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        dates_anon[row.d] = row.count
-
-    dates_anon = _fill_empty_days(dates_anon.keys(), dates_anon)
+def _fill_empty_days(period, obj):
+    """Add the days of the period without activity to obj."""
+    n_days = convert_period_to_days(period) if period else 0
+    if len(obj) < n_days:
+        days = pd.date_range(end=datetime.date.today(), periods=n_days)
+        days = pd.Index(days.strftime('%Y-%m-%d')).union(obj.keys())
+        series = _series(obj, days)
+        obj = dict(zip(series.index, series.values.tolist()))
+    return obj
 
-    return dates, dates_anon, dates_auth
 
+def _stats_dimensions(project_id, period=None, read_session=None):
+    """Return the users, dates and hours stats of a project.
 
-@memoize(timeout=ONE_HOUR)
-def stats_hours(project_id, period='2 week'):
-    """Return statistics of a project per hours."""
+    All of them come from a single GROUPING SETS query over the rollup: one
+    set per day, one per hour of the day and one per contributor. The
+    rollup is kept up to date by update_stats, which reads it through the
+    session that wrote it.
+    """
+    read_session = read_session or session
+    users = dict(n_auth=0, n_anon=0)
+    auth_users = []
+    anon_users = []
+    dates = {}
+    dates_anon = {}
+    dates_auth = {}
     hours = {}
     hours_anon = {}
     hours_auth = {}
-    max_hours = 0
-    max_hours_anon = 0
-    max_hours_auth = 0
 
     # initialize hours keys
     for i in range(0, 24):
@@ -268,129 +234,143 @@ def stats_hours(project_id, period='2 week'):
         hours_auth[str(i).zfill(2)] = 0
 
     params = dict(project_id=project_id, period=period)
-    # Get hour stats for all users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT h, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-
+    period_filter = 'AND %s' % ROLLUP_PERIOD if period else ''
+
+    sql = text('''SELECT TO_CHAR(hour, 'YYYY-MM-DD') AS d,
+               TO_CHAR(hour, 'HH24') AS h, user_id, user_ip,
+               SUM(n_tasks) AS n_tasks,
+               SUM(n_task_runs) AS n_task_runs,
+               COALESCE(SUM(n_task_runs) FILTER (WHERE user_id = 0), 0)
+               AS n_anon,
+               COALESCE(SUM(n_task_runs) FILTER (WHERE user_ip = ''), 0)
+               AS n_auth
+               FROM task_run_rollup WHERE project_id=:project_id %s
+               GROUP BY GROUPING SETS ((d), (h), (user_id, user_ip));'''
+               % period_filter).execution_options(stream=True)
+    results = read_session.execute(sql, params)
+
+    seen, seen_anon, seen_auth = set(), set(), set()
     for row in results:
-        hours[row.h] = row.count
+        if row.d is not None:
+            if row.n_tasks:
+                dates[row.d] = row.n_tasks
+            if row.n_anon:
+                dates_anon[row.d] = row.n_anon
+            if row.n_auth:
+                dates_auth[row.d] = row.n_auth
+        elif row.h is not None:
+            if row.n_task_runs:
+                hours[row.h] = row.n_task_runs
+                seen.add(row.h)
+            if row.n_anon:
+                hours_anon[row.h] = row.n_anon
+                seen_anon.add(row.h)
+            if row.n_auth:
+                hours_auth[row.h] = row.n_auth
+                seen_auth.add(row.h)
+        elif row.n_task_runs:
+            if row.user_id != 0 and row.user_ip == '':
+                auth_users.append([row.user_id, row.n_task_runs])
+            elif row.user_id == 0 and row.user_ip != '':
+                anon_users.append([row.user_ip, row.n_task_runs])
+
+    users['n_auth'] = len(auth_users)
+    users['n_anon'] = len(anon_users)
+    auth_users = sorted(auth_users, key=lambda u: u[1], reverse=True)[:10]
+    anon_users = sorted(anon_users, key=lambda u: u[1], reverse=True)
+
+    dates = _fill_empty_days(period, dates)
+    dates_anon = _fill_empty_days(period, dates_anon)
+    dates_auth = _fill_empty_days(period, dates_auth)
+
+    # Maximum per hour, None when there were no answers in the period
+    def _max(obj, keys):
+        return max(obj[h] for h in keys) if keys else None
+
+    return ((users, anon_users, auth_users),
+            (dates, dates_anon, dates_auth),
+            (hours, hours_anon, hours_auth, _max(hours, seen),
+             _max(hours_anon, seen_anon), _max(hours_auth, seen_auth)))
 
-    # Get maximum stats for all users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id  AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT max(count) from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        max_hours = row.max
 
-    # Get hour stats for Anonymous users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_id IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT h, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
+@memoize(timeout=ONE_HOUR)
+def stats_users(project_id, period=None):
+    """Return users's stats for a given project_id."""
+    return _stats_dimensions(project_id, period)[0]
 
-    for row in results:
-        hours_anon[row.h] = row.count
 
-    # Get maximum stats for Anonymous users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_id IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT max(count) from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        max_hours_anon = row.max
+@memoize(timeout=ONE_HOUR)
+def stats_dates(project_id, period='15 day'):
+    """Return statistics with dates for a project."""
+    return _stats_dimensions(project_id, period)[1]
 
-    # Get hour stats for Auth users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_ip IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT h, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
 
-    for row in results:
-        hours_auth[row.h] = row.count
+@memoize(timeout=ONE_HOUR)
+def stats_hours(project_id, period='2 week'):
+    """Return statistics of a project per hours."""
+    return _stats_dimensions(project_id, period)[2]
 
-    # Get hour stats for Anon users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_ip IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT max(count) from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        max_hours_auth = row.max
 
-    return hours, hours_anon, hours_auth, max_hours, max_hours_anon, \
-        max_hours_auth
+def _project_counters(project_id):
+    """Return the project counters stored in ProjectStats in one query."""
+    sql = text('''
+               WITH tasks AS (
+                   SELECT COUNT(id) AS n_tasks,
+                   COUNT(id) FILTER (WHERE state = 'completed')
+                   AS n_completed_tasks
+                   FROM task WHERE project_id=:project_id),
+               task_runs AS (
+                   SELECT COUNT(id) AS n_task_runs,
+                   COUNT(DISTINCT user_id) FILTER (WHERE user_ip IS NULL)
+                   AS n_registered_volunteers,
+                   COUNT(DISTINCT user_ip) FILTER (WHERE user_id IS NULL)
+                   AS n_anonymous_volunteers,
+                   MAX(finish_time) AS last_activity,
+                   AVG(finish_time_ts - created_ts) AS average_time
+                   FROM task_run WHERE project_id=:project_id),
+               results AS (
+                   SELECT COUNT(id) AS n_results FROM result
+                   WHERE project_id=:project_id
+                   AND info IS NOT NULL
+                   AND cast(info AS TEXT) != 'null'
+                   AND cast(info AS TEXT) != ''),
+               blogposts AS (
+                   SELECT COUNT(id) AS n_blogposts FROM blogpost
+                   WHERE project_id=:project_id)
+               SELECT * FROM tasks, task_runs, results, blogposts;
+               ''')
+    row = session.execute(sql, dict(project_id=project_id)).first()
+    overall_progress = 0
+    if row.n_tasks:
+        overall_progress = (row.n_completed_tasks * 100) / row.n_tasks
+    average_time = 0
+    if row.average_time:
+        average_time = row.average_time.total_seconds()
+    return dict(n_tasks=row.n_tasks,
+                n_task_runs=row.n_task_runs,
+                n_results=row.n_results,
+                n_volunteers=(row.n_registered_volunteers +
+                              row.n_anonymous_volunteers),
+                n_completed_tasks=row.n_completed_tasks,
+                average_time=average_time,
+                overall_progress=overall_progress,
+                n_blogposts=row.n_blogposts,
+                last_activity=row.last_activity)
+
+
+def _js_times(days):
+    """Return the JavaScript timestamps (miliseconds since EPOCH at local
+    midnight) of an array of YYYY-MM-DD days."""
+    return np.array([time.mktime(time.strptime(d, '%Y-%m-%d')) * 1000
+                     for d in days], dtype=np.int64)
+
+
+def _series(obj, index=None):
+    """Return a dict of counts as an int Series, optionally reindexed."""
+    series = pd.Series(obj, dtype=np.int64)
+    if index is not None:
+        series = series.reindex(index, fill_value=0).astype(np.int64)
+    return series.sort_index()
 
 
 @memoize(timeout=ONE_HOUR)
@@ -402,30 +382,24 @@ def stats_format_dates(project_id, dates, dates_anon, dates_auth):
     dayNewAnonStats = dict(label=gettext("Anonymous"), values=[])
     dayNewAuthStats = dict(label=gettext("Authenticated"), values=[])
 
-    answer_dates = sorted(list(set(dates_anon.keys() + dates_auth.keys())))
-    total = 0
-
-    for d in sorted(dates.keys()):
-        # JavaScript expects miliseconds since EPOCH
-        # Total tasks completed per day
-        total = total + dates[d]
-        dayCompletedTasks['values'].append(
-            [int(time.mktime(time.strptime(d, "%Y-%m-%d")) * 1000), total])
-
-    for d in answer_dates:
-        anon_ans = dates_anon[d] if d in dates_anon.keys() else 0
-        auth_ans = dates_auth[d] if d in dates_auth.keys() else 0
-        total_ans = anon_ans + auth_ans
-
-        # New answers per day
-        dayNewStats['values'].append(
-            [int(time.mktime(time.strptime(d, "%Y-%m-%d")) * 1000), total_ans])
-        # Anonymous answers per day
-        dayNewAnonStats['values'].append(
-            [int(time.mktime(time.strptime(d, "%Y-%m-%d")) * 1000), anon_ans])
-        # Authenticated answers per day
-        dayNewAuthStats['values'].append(
-            [int(time.mktime(time.strptime(d, "%Y-%m-%d")) * 1000), auth_ans])
+    # Total tasks completed per day
+    completed = _series(dates).cumsum()
+    dayCompletedTasks['values'] = np.column_stack(
+        [_js_times(completed.index), completed.values]).tolist()
+
+    answer_dates = pd.Index(dates_anon.keys()).union(dates_auth.keys())
+    anon = _series(dates_anon, answer_dates)
+    auth = _series(dates_auth, answer_dates)
+    js_times = _js_times(answer_dates)
+    # New answers per day
+    dayNewStats['values'] = np.column_stack(
+        [js_times, (anon + auth).values]).tolist()
+    # Anonymous answers per day
+    dayNewAnonStats['values'] = np.column_stack(
+        [js_times, anon.values]).tolist()
+    # Authenticated answers per day
+    dayNewAuthStats['values'] = np.column_stack(
+        [js_times, auth.values]).tolist()
 
     return dayNewStats, dayNewAnonStats, dayNewAuthStats, \
         dayCompletedTasks
@@ -445,29 +419,23 @@ def stats_format_hours(project_id, hours, hours_anon, hours_auth,
     hourNewAnonStats['max'] = max_hours_anon
     hourNewAuthStats['max'] = max_hours_auth
 
-    for h in sorted(hours.keys()):
-        # New answers per hour
-        if (hours[h] != 0):
-            hourNewStats['values'].append([int(h), hours[h],
-                                           (hours[h] * 5) / max_hours])
-        else:
-            hourNewStats['values'].append([int(h), hours[h], 0])
-
-        # New Anonymous answers per hour
-        if h in hours_anon.keys():
-            if (hours_anon[h] != 0):
-                tmph = (hours_anon[h] * 5) / max_hours
-                hourNewAnonStats['values'].append([int(h), hours_anon[h], tmph])
-            else:
-                hourNewAnonStats['values'].append([int(h), hours_anon[h], 0])
-
-        # New Authenticated answers per hour
-        if h in hours_auth.keys():
-            if (hours_auth[h] != 0):
-                tmph = (hours_auth[h] * 5) / max_hours
-                hourNewAuthStats['values'].append([int(h), hours_auth[h], tmph])
-            else:
-                hourNewAuthStats['values'].append([int(h), hours_auth[h], 0])
+    index = sorted(hours.keys())
+    hour_numbers = np.array([int(h) for h in index], dtype=np.int64)
+
+    def _values(counts):
+        # Bubble size relative to the busiest hour of all users
+        counts = counts.values
+        sizes = np.zeros_like(counts)
+        if max_hours:
+            sizes = np.where(counts != 0, (counts * 5) // max_hours, 0)
+        return np.column_stack([hour_numbers, counts, sizes]).tolist()
+
+    # New answers per hour
+    hourNewStats['values'] = _values(_series(hours, index))
+    # New Anonymous answers per hour
+    hourNewAnonStats['values'] = _values(_series(hours_anon, index))
+    # New Authenticated answers per hour
+    hourNewAuthStats['values'] = _values(_series(hours_auth, index))
     return hourNewStats, hourNewAnonStats, hourNewAuthStats
 
 
@@ -495,20 +463,17 @@ def stats_format_users(project_id, users, anon_users, auth_users, geo=False):
     for u in anon_users:
         top5_anon.append(dict(ip=u[0], tasks=u[1]))
 
+    found = {}
+    if auth_users:
+        sql = text('''SELECT id, name, fullname, restrict from "user"
+                   where id = ANY(:ids) and restrict=false;''')
+        results = session.execute(sql, dict(ids=[u[0] for u in auth_users]))
+        found = dict((row.id, row) for row in results)
     for u in auth_users:
-        sql = text('''SELECT name, fullname, restrict from "user"
-                   where id=:id and restrict=false;''')
-        results = session.execute(sql, dict(id=u[0]))
-        fullname = None
-        name = None
-        restrict = None
-        for row in results:
-            fullname = row.fullname
-            name = row.name
-            restrict = row.restrict
-        if (fullname and name and restrict):
-            top10_auth.append(dict(name=name,
-                                   fullname=fullname,
+        row = found.get(u[0])
+        if (row and row.fullname and row.name and row.restrict):
+            top10_auth.append(dict(name=row.name,
+                                   fullname=row.fullname,
                                    tasks=u[1]))
 
     userAnonStats['top5'] = top5_anon[0:5]
@@ -520,15 +485,20 @@ def stats_format_users(project_id, users, anon_users, auth_users, geo=False):
 
 def update_stats(project_id, period='2 week'):
     """Update the stats of a given project."""
-    hours, hours_anon, hours_auth, max_hours, \
-        max_hours_anon, max_hours_auth = stats_hours(project_id, period)
-    users, anon_users, auth_users = stats_users(project_id, period)
-    dates, dates_anon, dates_auth = stats_dates(project_id, period)
-
-
-    sum(dates.values())
-
-    sorted(dates.iteritems(), key=operator.itemgetter(0))
+    last_id = update_task_run_rollup(project_id)
+    # The task runs past the watermark are folded in a savepoint that is
+    # rolled back once read, so they are aggregated again on every update
+    # until they settle.
+    savepoint = db.session.begin_nested()
+    sql = text('''SELECT COALESCE(MAX(id), 0) FROM task_run
+               WHERE project_id=:project_id;''')
+    max_id = db.session.execute(sql, dict(project_id=project_id)).scalar()
+    if max_id > last_id:
+        _apply_task_run_rollup(project_id, last_id, max_id)
+    (users, anon_users, auth_users), (dates, dates_anon, dates_auth), \
+        (hours, hours_anon, hours_auth, max_hours, max_hours_anon,
+         max_hours_auth) = _stats_dimensions(project_id, period, db.session)
+    savepoint.rollback()
 
     dates_stats = stats_format_dates(project_id, dates,
                                      dates_anon, dates_auth)
@@ -543,40 +513,17 @@ def update_stats(project_id, period='2 week'):
                 users_stats=users_stats)
     ps = session.query(ProjectStats).filter_by(project_id=project_id).first()
 
-    n_tasks = cached_projects.n_tasks(project_id)
-    n_task_runs = cached_projects.n_task_runs(project_id)
-    n_results = cached_projects.n_results(project_id)
-    overall_progress = cached_projects.overall_progress(project_id)
-    last_activity = cached_projects.last_activity(project_id)
-    n_volunteers = cached_projects.n_volunteers(project_id)
-    n_completed_tasks = cached_projects.n_completed_tasks(project_id)
-    average_time = cached_projects.average_contribution_time(project_id)
-    n_blogposts = cached_projects.n_blogposts(project_id)
+    counters = _project_counters(project_id)
 
     if ps is None:
-        ps = ProjectStats(project_id=project_id, info=data,
-                          n_tasks=n_tasks,
-                          n_task_runs=n_task_runs,
-                          n_results=n_results,
-                          n_volunteers=n_volunteers,
-                          n_completed_tasks=n_completed_tasks,
-                          average_time=average_time,
-                          overall_progress=overall_progress,
-                          n_blogposts=n_blogposts,
-                          last_activity=last_activity)
+        ps = ProjectStats(project_id=project_id, info=data, **counters)
         db.session.add(ps)
     else:
         ps.info = data
-        ps.n_tasks = n_tasks
-        ps.n_task_runs = n_task_runs
-        ps.overall_progress = overall_progress
-        ps.last_activity = last_activity
-        ps.n_results = n_results
-        ps.n_completed_tasks = n_completed_tasks
-        ps.n_volunteers = n_volunteers
-        ps.average_time = average_time
-        ps.n_blogposts = n_blogposts
+        for key, value in counters.iteritems():
+            setattr(ps, key, value)
     db.session.commit()
+    bump_cache_group_generation(project_id)
     return dates_stats, hours_stats, users_stats
 
 
@@ -19,14 +19,24 @@
 from sqlalchemy.sql import text
 from pybossa.core import db, timeouts
 from pybossa.model.project import Project
-from pybossa.util import pretty_date, static_vars, convert_utc_to_est
+from pybossa.util import pretty_date, static_vars
 from pybossa.cache import memoize, cache, delete_memoized, delete_cached, \
     memoize_essentials, delete_memoized_essential, delete_cache_group
-from pybossa.cache.task_browse_helpers import get_task_filters, allowed_fields
+from pybossa.traffic import mark_project_stats_dirty
+from pybossa.cache.task_browse_helpers import get_task_filters, \
+    get_task_order, get_task_seek, encode_cursor, get_filters_key, \
+    allowed_fields
+import json
 
 
 session = db.slave_session
 
+#: Filtered browse tasks counts stop counting past this number of tasks.
+BROWSE_TASKS_COUNT_CAP = 10000
+#: Timezone and to_char format of the dates shown in the browse tasks view.
+BROWSE_TASKS_TIMEZONE = 'America/New_York'
+BROWSE_TASKS_DATE_FORMAT = 'MM-DD-YY HH24:MI'
+
 
 @cache(timeout=timeouts.get('STATS_FRONTPAGE_TIMEOUT'),
        key_prefix="front_page_top_projects")
@@ -57,79 +67,118 @@ def get_top(n=4):
                     cache_group_keys=[[0]])
 @static_vars(allowed_fields=allowed_fields)
 def browse_tasks(project_id, args):
-    """Cache browse tasks view for a project."""
+    """Cache browse tasks view for a project.
+
+    When args holds a cursor the page starts right after the row the cursor
+    was taken from, using a seek predicate on the sort keys instead of an
+    OFFSET. Every task carries the cursor that continues after it.
+    """
     filters, filter_params = get_task_filters(args)
+    order_by, keys = get_task_order(args)
+    keys = keys or []
+    offset = args.get('offset') or 0
+    seek = ''
+    if keys and args.get('cursor') is not None:
+        seek, seek_params = get_task_seek(keys, args['cursor'])
+        filter_params.update(seek_params)
+        offset = 0
+    key_columns = ''.join(', {} AS cursor_{}'.format(column, ix)
+                          for ix, (column, _) in enumerate(keys))
+    # dates are shown in the browse timezone and the completion is capped
+    # at 100%, both computed by the query for the rows of the page
     sql = text('''
-               SELECT COUNT(*) OVER() as total_count, task.id,
-               coalesce(ct, 0) as n_task_runs, task.n_answers, ft,
-               priority_0, task.created
+               SELECT task.id,
+               coalesce(ct, 0) as n_task_runs, task.n_answers,
+               priority_0,
+               to_char(ft_ts AT TIME ZONE :timezone, :date_format)
+                 AS finish_time,
+               to_char(task.created_ts AT TIME ZONE :timezone, :date_format)
+                 AS created_date,
+               CASE WHEN coalesce(task.n_answers, 0) = 0 THEN 0.0
+                 ELSE LEAST(coalesce(ct, 0) / task.n_answers, 1.0)
+               END AS pct_status{0}
                FROM task LEFT OUTER JOIN
                (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
-               MAX(finish_time) as ft FROM task_run
+               MAX(finish_time) as ft, MAX(finish_time_ts) as ft_ts
+               FROM task_run
                WHERE project_id=:project_id GROUP BY task_id) AS log_counts
                ON task.id=log_counts.task_id
-               WHERE task.project_id=:project_id''' + filters +
-               " ORDER BY %s" % (args.get('order_by') or 'id ASC') +
+               WHERE task.project_id=:project_id'''
+               .format(key_columns) + filters + seek +
+               " ORDER BY %s" % order_by +
                " LIMIT :limit OFFSET :offset"
                )
 
     limit = args.get('records_per_page') or 10
-    offset = args.get('offset') or 0
 
     results = session.execute(sql, dict(project_id=project_id,
                                         limit=limit,
                                         offset=offset,
+                                        timezone=BROWSE_TASKS_TIMEZONE,
+                                        date_format=BROWSE_TASKS_DATE_FORMAT,
                                         **filter_params))
 
     tasks = []
-    total_count = 0
     for row in results:
-        # TODO: use Jinja filters to format date
-        def format_date(date):
-            if date is not None:
-                return convert_utc_to_est(date).strftime('%m-%d-%y %H:%M')
-        finish_time = format_date(row.ft)
-        created = format_date(row.created)
         task = dict(id=row.id, n_task_runs=row.n_task_runs,
                     n_answers=row.n_answers, priority_0=row.priority_0,
-                    finish_time=finish_time, created=created)
-        if total_count == 0:
-            total_count = row.total_count
-        task['pct_status'] = _pct_status(row.n_task_runs, row.n_answers)
+                    finish_time=row.finish_time, created=row.created_date,
+                    pct_status=row.pct_status)
+        if keys:
+            task['cursor'] = encode_cursor(
+                [row['cursor_{}'.format(ix)] for ix in range(len(keys))])
         tasks.append(task)
+    # a page past the last one reports no tasks at all
+    total_count = browse_tasks_count(project_id, args)[0] if tasks else 0
     return total_count, tasks
 
 
-def task_count(project_id, filters):
-    """Return the count of tasks in a project matching the given filters."""
+def browse_tasks_count(project_id, args):
+    """Return the number of tasks shown by the browse tasks view.
+
+    Returns a (count, exact) tuple. Without filters this is the cached
+    n_tasks of the project. Filtered counts are cached per project and
+    filters, so paging or sorting does not count again, and stop at
+    BROWSE_TASKS_COUNT_CAP tasks, in which case exact is False.
+    """
+    filters_key = get_filters_key(args)
+    if filters_key == '{}':
+        return n_tasks(project_id), True
+    return _filtered_task_count(project_id, filters_key)
+
+
+@memoize_essentials(timeout=timeouts.get('BROWSE_TASKS_TIMEOUT'),
+                    essentials=[0], cache_group_keys=[[0]])
+def _filtered_task_count(project_id, filters_key):
+    """Return the capped count of tasks matching the filters in
+    filters_key, as a (count, exact) tuple."""
+    count = _count_tasks(project_id, json.loads(filters_key),
+                         limit=BROWSE_TASKS_COUNT_CAP + 1)
+    if count > BROWSE_TASKS_COUNT_CAP:
+        return BROWSE_TASKS_COUNT_CAP, False
+    return count, True
+
+
+def _count_tasks(project_id, filters, limit=None):
     conditions, filter_params = get_task_filters(filters)
     sql = text('''
-               SELECT COUNT(*) OVER() as total_count, task.id,
-               coalesce(ct, 0) as n_task_runs, task.n_answers, ft,
-               priority_0, task.created
-               FROM task LEFT OUTER JOIN
+               SELECT COUNT(*) FROM (
+               SELECT 1 FROM task LEFT OUTER JOIN
                (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
                MAX(finish_time) as ft FROM task_run
                WHERE project_id=:project_id GROUP BY task_id) AS log_counts
                ON task.id=log_counts.task_id
-               WHERE task.project_id=:project_id {} LIMIT 1'''
+               WHERE task.project_id=:project_id {} LIMIT :limit
+               ) AS matching'''
                .format(conditions))
 
-    results = session.execute(sql, dict(project_id=project_id,
-                                        **filter_params))
-
-    row = results.first()
-    return row.total_count if row else 0
+    return session.scalar(sql, dict(project_id=project_id, limit=limit,
+                                    **filter_params))
 
 
-def _pct_status(n_task_runs, n_answers):
-    """Return percentage status."""
-    if n_answers != 0 and n_answers is not None:
-        if n_task_runs > n_answers:
-            return float(1)
-        else:
-            return float(n_task_runs) / n_answers
-    return float(0)
+def task_count(project_id, filters):
+    """Return the count of tasks in a project matching the given filters."""
+    return _count_tasks(project_id, filters)
 
 
 @memoize(timeout=timeouts.get('APP_TIMEOUT'))
@@ -142,7 +191,60 @@ def first_task_id(project_id):
     return session.scalar(sql, dict(project_id=project_id)) or 0
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'), cache_group_keys=[[0]])
+def _values_by_project(sql, args_list, default=0):
+    """Return the values of a grouped per project query for args_list.
+
+    The query gets the list of project ids as :project_ids and must return
+    project_id and value columns.
+    """
+    project_ids = [args[0] for args in args_list]
+    results = session.execute(sql, dict(project_ids=project_ids))
+    values = dict((row.project_id, row.value) for row in results)
+    return [values.get(project_id, default) for project_id in project_ids]
+
+
+def _n_tasks_many(args_list):
+    sql = text('''SELECT project_id, COUNT(id) AS value FROM task
+                  WHERE project_id = ANY(:project_ids)
+                  GROUP BY project_id;''')
+    return _values_by_project(sql, args_list)
+
+
+def _n_completed_tasks_many(args_list):
+    sql = text('''SELECT project_id, COUNT(id) AS value FROM task
+                  WHERE project_id = ANY(:project_ids)
+                  AND state=\'completed\'
+                  GROUP BY project_id;''')
+    return _values_by_project(sql, args_list)
+
+
+def _n_registered_volunteers_many(args_list):
+    sql = text('''SELECT project_id, COUNT(DISTINCT(user_id)) AS value
+                  FROM task_run
+                  WHERE user_id IS NOT NULL AND user_ip IS NULL
+                  AND project_id = ANY(:project_ids)
+                  GROUP BY project_id;''')
+    return _values_by_project(sql, args_list)
+
+
+def _n_anonymous_volunteers_many(args_list):
+    sql = text('''SELECT project_id, COUNT(DISTINCT(user_ip)) AS value
+                  FROM task_run
+                  WHERE user_ip IS NOT NULL AND user_id IS NULL
+                  AND project_id = ANY(:project_ids)
+                  GROUP BY project_id;''')
+    return _values_by_project(sql, args_list)
+
+
+def _last_activity_many(args_list):
+    sql = text('''SELECT project_id, MAX(finish_time) AS value FROM task_run
+                  WHERE project_id = ANY(:project_ids)
+                  GROUP BY project_id;''')
+    return _values_by_project(sql, args_list, default=None)
+
+
+@memoize(timeout=timeouts.get('APP_TIMEOUT'), cache_group_keys=[[0]],
+         batch=_n_tasks_many)
 def n_tasks(project_id):
     """Return number of tasks of a project."""
     sql = text('''SELECT COUNT(task.id) AS n_tasks FROM task
@@ -154,7 +256,8 @@ def n_tasks(project_id):
     return n_tasks
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'), cache_group_keys=[[0]])
+@memoize(timeout=timeouts.get('APP_TIMEOUT'), cache_group_keys=[[0]],
+         batch=_n_completed_tasks_many)
 def n_completed_tasks(project_id):
     """Return number of completed tasks of a project."""
     sql = text('''SELECT COUNT(task.id) AS n_completed_tasks FROM task
@@ -185,7 +288,8 @@ def n_results(project_id):
     return n_results
 
 
-@memoize(timeout=timeouts.get('REGISTERED_USERS_TIMEOUT'), cache_group_keys=[[0]])
+@memoize(timeout=timeouts.get('REGISTERED_USERS_TIMEOUT'), cache_group_keys=[[0]],
+         batch=_n_registered_volunteers_many)
 def n_registered_volunteers(project_id):
     """Return number of registered users that have participated in a project."""
     sql = text('''SELECT COUNT(DISTINCT(task_run.user_id))
@@ -201,7 +305,8 @@ def n_registered_volunteers(project_id):
     return n_registered_volunteers
 
 
-@memoize(timeout=timeouts.get('ANON_USERS_TIMEOUT'), cache_group_keys=[[0]])
+@memoize(timeout=timeouts.get('ANON_USERS_TIMEOUT'), cache_group_keys=[[0]],
+         batch=_n_anonymous_volunteers_many)
 def n_anonymous_volunteers(project_id):
     """Return number of anonymous users that have participated in a project."""
     sql = text('''SELECT COUNT(DISTINCT(task_run.user_ip))
@@ -263,7 +368,8 @@ def overall_progress(project_id):
         return 0
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'), cache_group_keys=[[0]])
+@memoize(timeout=timeouts.get('APP_TIMEOUT'), cache_group_keys=[[0]],
+         batch=_last_activity_many)
 def last_activity(project_id):
     """Return last activity, date, from a project."""
     sql = text('''SELECT finish_time FROM task_run WHERE project_id=:project_id
@@ -280,8 +386,7 @@ def last_activity(project_id):
 @memoize(timeout=timeouts.get('APP_TIMEOUT'))
 def average_contribution_time(project_id):
     sql = text('''SELECT
-        AVG(to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24-MI-SS.US') -
-            to_timestamp(created, 'YYYY-MM-DD"T"HH24-MI-SS.US')) AS average_time
+        AVG(finish_time_ts - created_ts) AS average_time
         FROM task_run
         WHERE project_id=:project_id;''')
 
@@ -294,6 +399,31 @@ def average_contribution_time(project_id):
         return 0
 
 
+def get_listing_stats(project_ids):
+    """Return the stats shown in project listings for several projects.
+
+    The cache lookups are batched and the values missing in the cache are
+    computed with one grouped query per stat.
+    """
+    n_tasks_values = n_tasks.many(project_ids)
+    n_completed_values = n_completed_tasks.many(project_ids)
+    n_anon_values = n_anonymous_volunteers.many(project_ids)
+    n_registered_values = n_registered_volunteers.many(project_ids)
+    last_activity_values = last_activity.many(project_ids)
+    stats = {}
+    for i, project_id in enumerate(project_ids):
+        progress = 0
+        if n_tasks_values[i] != 0:
+            progress = (n_completed_values[i] * 100) / n_tasks_values[i]
+        stats[project_id] = dict(
+            last_activity=pretty_date(last_activity_values[i]),
+            last_activity_raw=last_activity_values[i],
+            overall_progress=progress,
+            n_tasks=n_tasks_values[i],
+            n_volunteers=n_anon_values[i] + n_registered_values[i])
+    return stats
+
+
 def n_blogposts(project_id):
     """Return number of blogposts of a project."""
     sql = text('''
@@ -334,19 +464,16 @@ def get_all_featured(category=None):
            AND "user".restrict=false
            GROUP BY project.id, "user".id;''')
 
-    results = session.execute(sql)
+    results = session.execute(sql).fetchall()
+    stats = get_listing_stats([row.id for row in results])
     projects = []
     for row in results:
         project = dict(id=row.id, name=row.name, short_name=row.short_name,
                        created=row.created, description=row.description,
                        updated=row.updated,
-                       last_activity=pretty_date(last_activity(row.id)),
-                       last_activity_raw=last_activity(row.id),
                        owner=row.owner,
-                       overall_progress=overall_progress(row.id),
-                       n_tasks=n_tasks(row.id),
-                       n_volunteers=n_volunteers(row.id),
-                       info=row.info)
+                       info=row.info,
+                       **stats[row.id])
         projects.append(Project().to_public_json(project))
     return projects
 
@@ -394,7 +521,8 @@ def get_all_draft(category=None):
            AND "user".restrict=false
            AND project.published=false;''')
 
-    results = session.execute(sql)
+    results = session.execute(sql).fetchall()
+    stats = get_listing_stats([row.id for row in results])
     projects = []
     for row in results:
         project = dict(id=row.id, name=row.name, short_name=row.short_name,
@@ -402,12 +530,8 @@ def get_all_draft(category=None):
                        updated=row.updated,
                        description=row.description,
                        owner=row.owner,
-                       last_activity=pretty_date(last_activity(row.id)),
-                       last_activity_raw=last_activity(row.id),
-                       overall_progress=overall_progress(row.id),
-                       n_tasks=n_tasks(row.id),
-                       n_volunteers=n_volunteers(row.id),
-                       info=row.info)
+                       info=row.info,
+                       **stats[row.id])
         projects.append(Project().to_public_json(project))
     return projects
 
@@ -463,6 +587,8 @@ def get_all(category):
            GROUP BY project.id, "user".id ORDER BY project.name;''')
 
     results = session.execute(sql, dict(category=category))
+    results = results.fetchall()
+    stats = get_listing_stats([row.id for row in results])
     projects = []
     for row in results:
         project = dict(id=row.id,
@@ -472,12 +598,8 @@ def get_all(category):
                        description=row.description,
                        owner=row.owner,
                        featured=row.featured,
-                       last_activity=pretty_date(last_activity(row.id)),
-                       last_activity_raw=last_activity(row.id),
-                       overall_progress=overall_progress(row.id),
-                       n_tasks=n_tasks(row.id),
-                       n_volunteers=n_volunteers(row.id),
-                       info=row.info)
+                       info=row.info,
+                       **stats[row.id])
         projects.append(Project().to_public_json(project))
     return projects
 
@@ -539,6 +661,8 @@ def text_search(search_text, show_unpublished=True, show_hidden=True):
           'AND project.published=true' if not show_unpublished else '',
           'AND coalesce(project.hidden, false)=false' if not show_hidden else ''))
     results = session.execute(sql, dict(search_text=search_text))
+    results = results.fetchall()
+    stats = get_listing_stats([row.id for row in results])
     projects = []
     for row in results:
         project = dict(id=row.id,
@@ -548,12 +672,8 @@ def text_search(search_text, show_unpublished=True, show_hidden=True):
                        description=row.description,
                        owner=row.owner,
                        featured=row.featured,
-                       last_activity=pretty_date(last_activity(row.id)),
-                       last_activity_raw=last_activity(row.id),
-                       overall_progress=overall_progress(row.id),
-                       n_tasks=n_tasks(row.id),
-                       n_volunteers=n_volunteers(row.id),
-                       info=row.info)
+                       info=row.info,
+                       **stats[row.id])
         projects.append(Project().to_public_json(project))
     return projects
 
@@ -591,6 +711,16 @@ def get_project_data(project_id):
     return session.execute(sql, dict(project_id=project_id)).first()
 
 
+def get_projects_data(project_ids):
+    """Return the get_project_data rows for several projects"""
+    if not project_ids:
+        return []
+    sql = text('''SELECT id, short_name, info, owners_ids FROM project
+                WHERE id = ANY(:project_ids);''')
+
+    return session.execute(sql, dict(project_ids=list(project_ids))).fetchall()
+
+
 def reset():
     """Clean the cache"""
     delete_cached("index_front_page")
@@ -608,6 +738,7 @@ def reset():
 def delete_browse_tasks(project_id):
     """Reset browse_tasks value in cache"""
     delete_memoized_essential(browse_tasks, project_id)
+    delete_memoized_essential(_filtered_task_count, project_id)
 
 
 def delete_n_tasks(project_id):
@@ -662,9 +793,10 @@ def clean(project_id):
 
 
 def clean_project(project_id, category=None):
-    """Clean cache for a specific project"""
+    """Clean cache for a specific project and flag its stats as outdated"""
     project = db.session.query(Project).get(project_id)
     delete_cache_group(project_id)
+    mark_project_stats_dirty(project_id)
     if project:
         delete_cache_group(project.category.short_name)
         delete_cache_group('get_all_draft')
@@ -680,8 +812,7 @@ def get_project_report_projectdata(project_id):
             (SELECT MIN(finish_time) FROM task_run WHERE project_id = p.id) AS first_task_submission,
             (SELECT MAX(finish_time) FROM task_run WHERE project_id = p.id) AS last_task_submission,
             (SELECT MAX(n_answers) FROM task WHERE project_id = p.id) AS redundancy,
-            (SELECT coalesce(AVG(to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24-MI-SS.US') -
-            to_timestamp(created, 'YYYY-MM-DD"T"HH24-MI-SS.US')), interval '0s') FROM task_run WHERE project_id=p.id)
+            (SELECT coalesce(AVG(finish_time_ts - created_ts), interval '0s') FROM task_run WHERE project_id=p.id)
             AS average_time
             FROM project p
             WHERE p.id=:project_id;
@@ -16,6 +16,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 """Cache module for site statistics."""
+from datetime import date
 from functools import wraps
 from sqlalchemy.sql import text
 from flask import current_app
@@ -100,8 +101,8 @@ def get_top5_projects_24_hours():
     sql = text('''SELECT project.id, project.name, project.short_name, project.info,
                COUNT(task_run.project_id) AS n_answers FROM project, task_run
                WHERE project.id=task_run.project_id
-               AND DATE(task_run.finish_time) > NOW() - INTERVAL '24 hour'
-               AND DATE(task_run.finish_time) <= NOW()
+               AND task_run.finish_time_ts > NOW() - INTERVAL '24 hour'
+               AND task_run.finish_time_ts <= NOW()
                GROUP BY project.id
                ORDER BY n_answers DESC LIMIT 5;''')
 
@@ -122,8 +123,8 @@ def get_top5_users_24_hours():
                "user".restrict,
                COUNT(task_run.project_id) AS n_answers FROM "user", task_run
                WHERE "user".restrict=false AND "user".id=task_run.user_id
-               AND DATE(task_run.finish_time) > NOW() - INTERVAL '24 hour'
-               AND DATE(task_run.finish_time) <= NOW()
+               AND task_run.finish_time_ts > NOW() - INTERVAL '24 hour'
+               AND task_run.finish_time_ts <= NOW()
                GROUP BY "user".id
                ORDER BY n_answers DESC LIMIT 5;''')
 
@@ -137,6 +138,74 @@ def get_top5_users_24_hours():
     return top5_users_24_hours
 
 
+def update_site_activity(rebuild=False):
+    """Bring the daily site_activity rollup up to date.
+
+    The last day in the rollup (usually still in progress when it was
+    aggregated) and the following days are aggregated again from the task
+    and task_run tables. With rebuild the whole history is aggregated.
+    A completed task is counted on the day of the task run that completed
+    it, so later task runs do not count it again.
+    """
+    start = None
+    if not rebuild:
+        sql = text('''SELECT MAX(day) FROM site_activity;''')
+        start = db.session.execute(sql).scalar()
+    start = start or date.min
+    sql = text('''DELETE FROM site_activity WHERE day >= :start;''')
+    db.session.execute(sql, dict(start=start))
+    sql = text('''
+        WITH recent_tasks AS (
+            SELECT DISTINCT task_id FROM task_run
+            WHERE finish_time_ts >= CAST(:start AS TIMESTAMP) AT TIME ZONE 'UTC'),
+        answers AS (
+            SELECT task.project_id, task.n_answers,
+                   DATE(task_run.finish_time_ts AT TIME ZONE 'UTC') AS day,
+                   ROW_NUMBER() OVER (PARTITION BY task.id
+                                      ORDER BY task_run.finish_time_ts,
+                                               task_run.id) AS n_answer,
+                   COUNT(*) OVER (PARTITION BY task.id) AS n_task_runs
+            FROM recent_tasks JOIN task ON task.id = recent_tasks.task_id
+            JOIN task_run ON task_run.task_id = task.id
+            WHERE task.state = 'completed'),
+        completed_tasks AS (
+            SELECT project_id, day FROM answers
+            WHERE n_answer = LEAST(n_answers, n_task_runs)
+            AND day >= :start)
+        INSERT INTO site_activity (day, project_id, user_id, n_task_runs,
+                                   task_run_seconds, n_timed_task_runs,
+                                   n_tasks_created, n_completed_tasks)
+        SELECT day, project_id, user_id, SUM(n_task_runs),
+               SUM(task_run_seconds), SUM(n_timed_task_runs),
+               SUM(n_tasks_created), SUM(n_completed_tasks)
+        FROM (
+            SELECT DATE(finish_time_ts AT TIME ZONE 'UTC') AS day, project_id,
+                   COALESCE(user_id, 0) AS user_id,
+                   COUNT(id) AS n_task_runs,
+                   COALESCE(SUM(EXTRACT(EPOCH FROM
+                                        finish_time_ts - created_ts)), 0)
+                   AS task_run_seconds,
+                   COUNT(created_ts) AS n_timed_task_runs,
+                   0 AS n_tasks_created, 0 AS n_completed_tasks
+            FROM task_run
+            WHERE finish_time_ts >= CAST(:start AS TIMESTAMP) AT TIME ZONE 'UTC'
+            GROUP BY 1, 2, 3
+            UNION ALL
+            SELECT DATE(created_ts AT TIME ZONE 'UTC'), project_id, 0, 0, 0, 0,
+                   COUNT(id), 0
+            FROM task
+            WHERE created_ts >= CAST(:start AS TIMESTAMP) AT TIME ZONE 'UTC'
+            GROUP BY 1, 2
+            UNION ALL
+            SELECT day, project_id, 0, 0, 0, 0, 0, COUNT(*)
+            FROM completed_tasks GROUP BY 1, 2) AS activity
+        GROUP BY day, project_id, user_id;
+        ''')
+    db.session.execute(sql, dict(start=start))
+    db.session.commit()
+    return start
+
+
 def allow_all_time(func):
     @wraps(func)
     def wrapper(days=30):
@@ -152,9 +221,7 @@ def number_of_created_jobs(days=30):
     """Number of created jobs"""
     sql = text('''
         SELECT COUNT(id) FROM project
-        WHERE
-        clock_timestamp() - to_timestamp(created, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-            < interval ':days days';
+        WHERE created_ts > clock_timestamp() - interval ':days days';
     ''')
     return session.execute(sql, dict(days=days)).scalar()
 
@@ -164,15 +231,8 @@ def number_of_created_jobs(days=30):
 def number_of_active_jobs(days=30):
     """Number of jobs with submissions"""
     sql = text('''
-        WITH activity AS (SELECT project.id as id,
-               MAX(task_run.finish_time) as last_activity
-            FROM project LEFT JOIN task_run
-            ON project.id = task_run.project_id
-            GROUP BY project.id)
-        SELECT COUNT(id) FROM activity
-        WHERE clock_timestamp() -
-              to_timestamp(last_activity, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-            < interval ':days days';
+        SELECT COUNT(DISTINCT project_id) FROM site_activity
+        WHERE day > (now() AT TIME ZONE 'UTC')::date - :days AND n_task_runs > 0;
         ''')
     return session.execute(sql, dict(days=days)).scalar()
 
@@ -182,10 +242,9 @@ def number_of_active_jobs(days=30):
 def number_of_created_tasks(days=30):
     """Number of created tasks"""
     sql = text('''
-        SELECT count(id) FROM task
-        WHERE
-        clock_timestamp() - to_timestamp(created, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-            < interval ':days days';
+        SELECT CAST(COALESCE(SUM(n_tasks_created), 0) AS BIGINT)
+        FROM site_activity
+        WHERE day > (now() AT TIME ZONE 'UTC')::date - :days;
         ''')
     return session.execute(sql, dict(days=days)).scalar()
 
@@ -195,14 +254,9 @@ def number_of_created_tasks(days=30):
 def number_of_completed_tasks(days=30):
     """Number of completed tasks"""
     sql = text('''
-        WITH completed AS (SELECT task.id FROM task JOIN task_run
-            ON task.id = task_run.task_id
-            WHERE task.state = 'completed'
-            GROUP BY task.id
-            HAVING clock_timestamp() -
-                   to_timestamp(MAX(finish_time), 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                   < interval ':days days')
-        SELECT count(id) FROM completed;
+        SELECT CAST(COALESCE(SUM(n_completed_tasks), 0) AS BIGINT)
+        FROM site_activity
+        WHERE day > (now() AT TIME ZONE 'UTC')::date - :days;
         ''')
     return session.execute(sql, dict(days=days)).scalar()
 
@@ -212,11 +266,9 @@ def number_of_completed_tasks(days=30):
 def number_of_active_users(days=30):
     """Number of active users"""
     sql = text('''
-        WITH active_users AS (SELECT DISTINCT(user_id) as id FROM task_run
-            WHERE clock_timestamp() -
-                  to_timestamp(task_run.finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                  < interval ':days days')
-        SELECT COUNT(id) FROM active_users;
+        SELECT COUNT(DISTINCT user_id) FROM site_activity
+        WHERE day > (now() AT TIME ZONE 'UTC')::date - :days AND user_id != 0
+        AND n_task_runs > 0;
     ''')
     return session.execute(sql, dict(days=days)).scalar()
 
@@ -229,9 +281,8 @@ def categories_with_new_projects(days=30):
         WITH active_categories AS(
             SELECT category.id as id FROM category JOIN project
             ON category.id = project.category_id
-            WHERE clock_timestamp() -
-                  to_timestamp(project.created, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                  < interval ':days days'
+            WHERE project.created_ts
+                  > clock_timestamp() - interval ':days days'
             GROUP BY category.id)
         SELECT COUNT(id) from active_categories;
     ''')
@@ -244,14 +295,13 @@ def avg_time_to_complete_task(days=30):
     """Average time to complete a task"""
     sql = text('''SELECT
         to_char(
-            AVG(to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24-MI-SS.US') -
-                to_timestamp(created, 'YYYY-MM-DD"T"HH24-MI-SS.US')),
+            SUM(task_run_seconds) / NULLIF(SUM(n_timed_task_runs), 0)
+            * INTERVAL '1 second',
             'MI"m" SS"s"'
         )
         AS average_time
-        FROM task_run WHERE clock_timestamp() -
-            to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24-MI-SS.US')
-            < interval ':days days';''')
+        FROM site_activity
+        WHERE day > (now() AT TIME ZONE 'UTC')::date - :days;''')
     return session.execute(sql, dict(days=days)).scalar() or 'N/A'
 
 
@@ -260,12 +310,11 @@ def avg_task_per_job(days=0):
     """Average number of tasks per job"""
     sql = text('''
         SELECT AVG(ct) FROM (SELECT
-            project.id, count(task.id) AS ct
-            FROM project LEFT OUTER JOIN task
-            ON project.id = task.project_id
-            WHERE to_timestamp(task.created, 'YYYY-MM-DD"T"HH24-MI-SS.US') <
-                clock_timestamp() - interval ':days days'
-            GROUP BY project.id) as t;
+            project_id, SUM(n_tasks_created) AS ct
+            FROM site_activity
+            WHERE day <= (now() AT TIME ZONE 'UTC')::date - :days
+            GROUP BY project_id
+            HAVING SUM(n_tasks_created) > 0) as t;
         ''')
     return session.execute(sql, dict(days=days)).scalar()
 
@@ -275,14 +324,14 @@ def tasks_per_category(days=0):
     """Average number of tasks per category"""
     sql = text('''
         SELECT AVG(ct) FROM (SELECT
-            category.id, count(task.id) AS ct
-            FROM category LEFT OUTER JOIN project
+            category.id, SUM(site_activity.n_tasks_created) AS ct
+            FROM category JOIN project
             ON project.category_id = category.id
-            LEFT OUTER JOIN task
-            ON task.project_id = project.id
-            WHERE to_timestamp(task.created, 'YYYY-MM-DD"T"HH24-MI-SS.US') <
-                  clock_timestamp() - interval ':days days'
-            GROUP BY category.id) as t;
+            JOIN site_activity
+            ON site_activity.project_id = project.id
+            WHERE site_activity.day <= (now() AT TIME ZONE 'UTC')::date - :days
+            GROUP BY category.id
+            HAVING SUM(site_activity.n_tasks_created) > 0) as t;
     ''')
     return session.execute(sql, dict(days=days)).scalar() or 'N/A'
 
@@ -302,7 +351,7 @@ def project_chart():
         )
         SELECT date, count(project.id) as num_created FROM
         dates LEFT JOIN project ON
-            to_timestamp(project.created, 'YYYY-MM-DD"T"HH24:MI:SS.US') < dates.date
+            project.created_ts < dates.date
         GROUP BY date ORDER  BY date ASC;
         ''')
     rows = session.execute(sql).fetchall()
@@ -341,11 +390,12 @@ def task_chart():
     Fetch data for a monthly chart of the number of tasks
     """
     sql = text('''
-        SELECT  count(id),
-        date_trunc('month', to_timestamp(created, 'YYYY-MM-DD"T"HH24:MI:SS.US'::text))
+        SELECT  CAST(SUM(n_tasks_created) AS BIGINT),
+        date_trunc('month', day)
         AS created_monthly
-        FROM task
+        FROM site_activity
         GROUP BY created_monthly
+        HAVING SUM(n_tasks_created) > 0
         ORDER BY created_monthly ASC
         LIMIT 24;
         ''')
@@ -361,11 +411,12 @@ def submission_chart():
     Fetch data for a monthly chart of the number of submissions
     """
     sql = text('''
-        SELECT  count(id),
-        date_trunc('month', to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US'::text))
+        SELECT  CAST(SUM(n_task_runs) AS BIGINT),
+        date_trunc('month', day)
         AS task_run_monthly
-        FROM task_run
+        FROM site_activity
         GROUP BY task_run_monthly
+        HAVING SUM(n_task_runs) > 0
         ORDER BY task_run_monthly ASC
         LIMIT 24;
         ''')
@@ -1,11 +1,32 @@
 from werkzeug.exceptions import BadRequest
+from sqlalchemy.sql import text
 from collections import defaultdict
 from pybossa.util import (convert_est_to_utc,
     get_user_pref_db_clause)
 import re
 import json
+import base64
+import hashlib
 import app_settings
 
+#: Arguments read by get_task_filters; the browse tasks counts depend only
+#: on these, not on the page or the order.
+task_filter_keys = ['task_id', 'hide_completed', 'pcomplete_from',
+                    'pcomplete_to', 'priority_from', 'priority_to',
+                    'created_from', 'created_to', 'ftime_from', 'ftime_to',
+                    'state', 'filter_by_field', 'filter_by_upref']
+range_filter_keys = ['pcomplete_from', 'pcomplete_to',
+                     'priority_from', 'priority_to']
+
+
+def get_filters_key(args):
+    """Return a stable string for the filtering arguments in args."""
+    filters = dict((key, args[key]) for key in task_filter_keys
+                   if args.get(key) is not None and
+                   (key in range_filter_keys or args[key]))
+    return json.dumps(filters, sort_keys=True)
+
+
 def get_task_filters(args):
     """
     build the WHERE part of the query using the filter parameters
@@ -71,6 +92,8 @@ def _escape_like_param(string):
     return string
 
 
+# Every operator is an ILIKE on the expression indexed by the trigram
+# indexes of the searchable columns, so all of them can use the index.
 op_to_query = {
     'starts with': dict(
         query="COALESCE(task.info->>'{}', '') ilike :{} escape '\\'",
@@ -81,9 +104,9 @@ op_to_query = {
         value="%{}%",
         escape=_escape_like_param),
     'equals': dict(
-        query="lower(COALESCE(task.info->>'{}', '')) = lower(:{})",
+        query="COALESCE(task.info->>'{}', '') ilike :{} escape '\\'",
         value="{}",
-        escape=lambda x: x)
+        escape=_escape_like_param)
 }
 
 
@@ -130,19 +153,118 @@ def is_valid_searchable_column(column_name):
 
 
 def get_searchable_columns(project_id):
-    from pybossa.core import task_repo
-    tasks = task_repo.filter_tasks_by(project_id=project_id,
-                                      limit=1,
-                                      desc=True)
-    if not tasks:
-        return []
-
-    info = tasks[0].info
-    if not isinstance(info, dict):
-        return []
+    """Return the keys found in the info of any task of the project that
+    can be used to filter the tasks."""
+    columns = set(row['path'] for row in get_task_info_keys(project_id)
+                  if row['depth'] == 0)
+    return sorted(column for column in columns
+                  if is_valid_searchable_column(column))
 
-    columns = [key for key in info if is_valid_searchable_column(key)]
-    return sorted(columns)
+
+def get_task_info_keys(project_id):
+    """
+    Return the catalog of the keys found in the info of the tasks of a
+    project, as a list of dicts with path, json_type, depth and n_tasks
+    """
+    from pybossa.core import db
+    sql = text('''SELECT path, json_type, depth, n_tasks
+               FROM task_info_key
+               WHERE project_id = :project_id AND n_tasks > 0
+               ORDER BY path, json_type''')
+    results = db.slave_session.execute(sql, dict(project_id=project_id))
+    return [dict(row) for row in results]
+
+
+json_types = [(dict, 'object'), (list, 'array'), (bool, 'boolean'),
+              ((int, long, float), 'number'), (basestring, 'string')]
+
+
+def get_info_key_types(info, parent='', depth=0):
+    """
+    Yield the (path, json_type, depth) of every key of a task info dict,
+    nested keys included, matching the task_info_key catalog rows
+    """
+    if not isinstance(info, dict):
+        return
+    for key, value in info.iteritems():
+        path = parent + key
+        json_type = next((name for types, name in json_types
+                          if isinstance(value, types)), 'null')
+        yield path, json_type, depth
+        for nested in get_info_key_types(value, path + '__', depth + 1):
+            yield nested
+
+
+def update_task_info_keys(conn, project_id, info, delta):
+    """Add delta to the catalog counts of the keys of a task info."""
+    key_types = list(get_info_key_types(info))
+    if not key_types:
+        return
+    paths, types, depths = zip(*key_types)
+    sql = text('''INSERT INTO task_info_key
+               (project_id, path, json_type, depth, n_tasks)
+               SELECT :project_id, key_type.path, key_type.json_type,
+                      key_type.depth, :delta
+               FROM unnest(CAST(:paths AS TEXT[]), CAST(:types AS TEXT[]),
+                           CAST(:depths AS INTEGER[]))
+                    AS key_type(path, json_type, depth)
+               ON CONFLICT (project_id, path, json_type) DO UPDATE
+               SET n_tasks = task_info_key.n_tasks + EXCLUDED.n_tasks''')
+    conn.execute(sql, dict(project_id=project_id, delta=delta,
+                           paths=list(paths), types=list(types),
+                           depths=list(depths)))
+
+
+def rebuild_task_info_keys(project_id):
+    """Rebuild the catalog of task info keys of a project from its tasks,
+    after tasks were deleted or updated in bulk."""
+    from pybossa.core import db
+    sql = text('''
+        DELETE FROM task_info_key WHERE project_id = :project_id;
+        WITH RECURSIVE info_key(path, depth, value) AS (
+            SELECT e.key, 0, e.value
+            FROM task CROSS JOIN LATERAL jsonb_each(
+                CASE WHEN jsonb_typeof(task.info) = 'object'
+                THEN task.info ELSE '{}' END) AS e
+            WHERE task.project_id = :project_id
+            UNION ALL
+            SELECT info_key.path || '__' || e.key, info_key.depth + 1,
+                   e.value
+            FROM info_key CROSS JOIN LATERAL jsonb_each(
+                CASE WHEN jsonb_typeof(info_key.value) = 'object'
+                THEN info_key.value ELSE '{}' END) AS e
+        )
+        INSERT INTO task_info_key (project_id, path, json_type, depth,
+                                   n_tasks)
+        SELECT :project_id, path, jsonb_typeof(value), MIN(depth), COUNT(*)
+        FROM info_key GROUP BY path, jsonb_typeof(value);
+        ''')
+    db.session.execute(sql, dict(project_id=project_id))
+    db.session.commit()
+
+
+info_index_prefix = 'task_info_trgm_'
+
+
+def get_info_index_name(project_id, column_name):
+    """Return the name of the trigram index of a searchable column."""
+    digest = hashlib.md5(column_name.encode('utf-8')).hexdigest()[:12]
+    return '{}{}_{}'.format(info_index_prefix, project_id, digest)
+
+
+def get_info_index_sql(project_id, column_name):
+    """
+    Return the statement creating the trigram index of a searchable column.
+    The index covers the expression the task info filters are built on and
+    only the tasks of the project.
+    """
+    if not is_valid_searchable_column(column_name):
+        raise ValueError('invalid searchable column: {}'.format(column_name))
+    return (u"CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON task "
+            u"USING gin ((COALESCE(info->>'{}', '')) gin_trgm_ops) "
+            u"WHERE project_id = {:d}"
+            .format(get_info_index_name(project_id, column_name),
+                    column_name, project_id))
 
 
 allowed_fields = {
@@ -155,6 +277,85 @@ allowed_fields = {
 }
 
 
+def get_task_order(args):
+    """
+    build the ORDER BY part of the browse tasks query
+    return the ORDER BY clause and the list of (column, direction) keys
+    that identify a row in that order, or None if the order can not be
+    used for keyset pagination
+    """
+    order_by_fields = args.get('order_by_fields')
+    if order_by_fields is None and args.get('order_by'):
+        return args['order_by'], None
+    keys = _get_seek_keys(order_by_fields or [])
+    order_by = ', '.join('{} {}'.format(column, direction)
+                         for column, direction in keys)
+    return order_by, keys
+
+
+def _get_seek_keys(order_by_fields):
+    keys = []
+    for field, direction in order_by_fields:
+        keys.append((allowed_fields[field], direction))
+        if field == 'task_id':
+            return keys
+    keys.append(('id', 'asc'))
+    return keys
+
+
+def get_task_seek(keys, values):
+    """
+    build the keyset predicate that selects the rows following the row
+    with the given key values, in the order given by keys
+    return the part of the WHERE clause and the dictionary of bound parameters
+    """
+    params = {}
+    pieces = []
+    equal_to = []
+    for ix, ((column, direction), value) in enumerate(zip(keys, values)):
+        param_name = 'cursor_{}'.format(ix)
+        nullable = column != 'id'
+        if value is None:
+            after = '{} IS NOT NULL'.format(column) \
+                if direction == 'desc' else None
+            equal = '{} IS NULL'.format(column)
+        else:
+            params[param_name] = value
+            op = '<' if direction == 'desc' else '>'
+            after = '{} {} :{}'.format(column, op, param_name)
+            if nullable and direction == 'asc':
+                after = '({} OR {} IS NULL)'.format(after, column)
+            equal = '{} = :{}'.format(column, param_name)
+        if after:
+            pieces.append(' AND '.join(equal_to + [after]))
+        equal_to.append(equal)
+    if not pieces:
+        return ' AND FALSE', params
+
+    seek = ' OR '.join('({})'.format(piece) for piece in pieces)
+    column, direction = keys[0]
+    if values[0] is not None and direction == 'desc':
+        # redundant bound on the leading key so an index can be used
+        seek = '{} <= :cursor_0 AND ({})'.format(column, seek)
+    return ' AND ({})'.format(seek), params
+
+
+def encode_cursor(values):
+    """Return an opaque browse tasks cursor for the given key values."""
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+
+def decode_cursor(cursor):
+    """Return the key values of an opaque browse tasks cursor."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        raise ValueError('invalid cursor: {}'.format(cursor))
+    if not isinstance(values, list):
+        raise ValueError('invalid cursor: {}'.format(cursor))
+    return values
+
+
 def parse_tasks_browse_args(args):
     """
     Parse querystring arguments
@@ -215,14 +416,19 @@ def parse_tasks_browse_args(args):
     parsed_args['order_by_dict'] = dict()
     if args.get('order_by'):
         parsed_args['order_by'] = args['order_by'].strip().lower()
+        parsed_args['order_by_fields'] = []
         for clause in parsed_args['order_by'].split(','):
             order_by_field = clause.split(' ')
             if len(order_by_field) != 2 or order_by_field[0] not in allowed_fields:
                 raise ValueError('order_by value sent by the user is invalid: %s'.format(args['order_by']))
+            if order_by_field[1] not in ('asc', 'desc'):
+                raise ValueError('order_by direction is invalid: {}'
+                                 .format(args['order_by']))
             if order_by_field[0] in parsed_args["order_by_dict"]:
                 raise ValueError('order_by field is duplicated: %s'
                                  .format(args['order_by']))
             parsed_args["order_by_dict"][order_by_field[0]] = order_by_field[1]
+            parsed_args['order_by_fields'].append(tuple(order_by_field))
 
         for key, value in allowed_fields.iteritems():
             parsed_args["order_by"] = parsed_args["order_by"].replace(key, value)
@@ -240,6 +446,14 @@ def parse_tasks_browse_args(args):
             raise ValueError('invalid task state: %s'.format(args['state']))
         parsed_args['state'] = args['state']
 
+    if args.get('cursor'):
+        cursor = decode_cursor(args['cursor'])
+        keys = _get_seek_keys(parsed_args.get('order_by_fields', []))
+        if len(cursor) != len(keys):
+            raise ValueError('cursor does not match order_by: {}'
+                             .format(args['cursor']))
+        parsed_args['cursor'] = cursor
+
     return parsed_args
 
 def validate_user_preferences(user_pref):
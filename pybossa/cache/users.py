@@ -20,13 +20,14 @@ from sqlalchemy.sql import text
 from sqlalchemy.exc import ProgrammingError
 from pybossa.core import db, timeouts
 from pybossa.cache import cache, memoize, delete_memoized, ONE_DAY, ONE_WEEK
-from pybossa.util import pretty_date, exists_materialized_view
+from pybossa.util import pretty_date
 from pybossa.model.user import User
 from pybossa.cache.projects import overall_progress, n_tasks, n_volunteers
 from pybossa.cache.projects import n_total_tasks
 from pybossa.model.project import Project
 from pybossa.leaderboard.data import get_leaderboard as gl
 from pybossa.leaderboard.jobs import leaderboard as lb
+from pybossa.leaderboard.scores import scores_built, get_rank_and_score
 import json
 from pybossa.util import get_user_pref_db_clause
 from pybossa.data_access import data_access_levels
@@ -37,6 +38,8 @@ session = db.slave_session
 
 def get_leaderboard(n, user_id=None, window=0, info=None):
     """Return the top n users with their rank."""
+    if info is None and not scores_built():
+        lb()
     try:
         return gl(top_users=n, user_id=user_id, window=window, info=info)
     except ProgrammingError:
@@ -49,11 +52,8 @@ def get_leaderboard(n, user_id=None, window=0, info=None):
 def n_projects_contributed(user_id):
     """Return number of projects user has contributed to."""
     sql = text('''
-                WITH projects_contributed AS
-                    (SELECT DISTINCT project_id FROM task_run
-                    WHERE user_id =:user_id)
-                SELECT COUNT(*) AS total_projects_contributed
-                FROM projects_contributed;
+                SELECT n_projects AS total_projects_contributed
+                FROM user_stats WHERE user_id=:user_id;
                 ''')
     results = session.execute(sql, dict(user_id=user_id))
     total_projects_contributed = 0
@@ -70,13 +70,13 @@ def get_user_summary(name):
                "user".api_key, "user".twitter_user_id, "user".facebook_user_id,
                "user".google_user_id, "user".info, "user".admin,
                "user".locale,
-               "user".email_addr, COUNT(task_run.user_id) AS n_answers,
+               "user".email_addr,
+               COALESCE(user_stats.n_answers, 0) AS n_answers,
                "user".valid_email, "user".confirmation_email_sent,
-               max(task_run.finish_time) AS last_task_submission_on
+               user_stats.last_submission_on AS last_task_submission_on
                FROM "user"
-               LEFT OUTER JOIN task_run ON "user".id=task_run.user_id
-               WHERE "user".name=:name
-               GROUP BY "user".id;
+               LEFT OUTER JOIN user_stats ON "user".id=user_stats.user_id
+               WHERE "user".name=:name;
                ''')
     results = session.execute(sql, dict(name=name))
     user = dict()
@@ -117,27 +117,21 @@ def public_get_user_summary(name):
 @memoize(timeout=timeouts.get('USER_TIMEOUT'))
 def rank_and_score(user_id):
     """Return rank and score for a user."""
-    if exists_materialized_view(db, 'users_rank') is False:
+    if not scores_built():
         lb()
-    sql = text('''SELECT * from users_rank WHERE id=:user_id''')
-    results = session.execute(sql, dict(user_id=user_id))
-    rank_and_score = dict(rank=None, score=None)
-    for row in results:
-        rank_and_score['rank'] = row.rank
-        rank_and_score['score'] = row.score
-    return rank_and_score
+    rank, score = get_rank_and_score(user_id)
+    return dict(rank=rank, score=score)
 
 
 def projects_contributed(user_id, order_by='name'):
     """Return projects that user_id has contributed to."""
     sql = text('''
-               WITH projects_contributed as
-                    (SELECT project_id, MAX(finish_time) as last_contribution  FROM task_run
-                     WHERE user_id=:user_id GROUP BY project_id)
                SELECT project.id, project.name as name, project.short_name, project.owner_id,
-               project.description, project.info, project.owners_ids
-               FROM project, projects_contributed
-               WHERE project.id=projects_contributed.project_id ORDER BY {} DESC;
+               project.description, project.info, project.owners_ids,
+               user_project_stats.last_submission_on AS last_contribution
+               FROM project, user_project_stats
+               WHERE project.id=user_project_stats.project_id
+               AND user_project_stats.user_id=:user_id ORDER BY {} DESC;
                '''.format(order_by))
     results = session.execute(sql, dict(user_id=user_id))
     projects_contributed = []
@@ -294,9 +288,9 @@ def get_users_page(page, per_page=24):
     offset = (page - 1) * per_page
     sql = text('''SELECT "user".id, "user".name,
                "user".fullname, "user".email_addr,
-               "user".created, "user".info, COUNT(task_run.id) AS task_runs
-               FROM task_run, "user"
-               WHERE "user".id=task_run.user_id GROUP BY "user".id
+               "user".created, "user".info, user_stats.n_answers AS task_runs
+               FROM user_stats, "user"
+               WHERE "user".id=user_stats.user_id AND user_stats.n_answers > 0
                ORDER BY "user".created DESC LIMIT :limit OFFSET :offset''')
     results = session.execute(sql, dict(limit=per_page, offset=offset))
     accounts = []
@@ -313,6 +307,52 @@ def get_users_page(page, per_page=24):
     return accounts
 
 
+def rebuild_user_stats(user_ids=None, project_id=None):
+    """Compute the user_stats and user_project_stats from the task runs.
+
+    All the users are rebuilt unless they are narrowed down to user_ids, or
+    to the users that contributed to project_id. The latter is used after
+    the task runs of a project are deleted in bulk.
+    """
+    params = {}
+    conditions = ''
+    if project_id is not None:
+        sql = text('''SELECT user_id FROM user_project_stats
+                   WHERE project_id=:project_id;''')
+        user_ids = [row.user_id for row in
+                    db.session.execute(sql, dict(project_id=project_id))]
+    if user_ids is not None:
+        user_ids = [user_id for user_id in user_ids if user_id is not None]
+        if not user_ids:
+            return
+        conditions = 'AND user_id = ANY(:user_ids)'
+        params['user_ids'] = user_ids
+    sql = '''DELETE FROM user_project_stats WHERE TRUE {};'''
+    db.session.execute(text(sql.format(conditions)), params)
+    sql = '''DELETE FROM user_stats WHERE TRUE {};'''
+    db.session.execute(text(sql.format(conditions)), params)
+    sql = '''
+          INSERT INTO user_project_stats (user_id, project_id, n_answers,
+                                          last_submission_on)
+          SELECT user_id, project_id, COUNT(id), MAX(finish_time)
+          FROM task_run WHERE user_id IS NOT NULL {}
+          GROUP BY user_id, project_id;
+          '''
+    db.session.execute(text(sql.format(conditions)), params)
+    sql = '''
+          INSERT INTO user_stats (user_id, n_answers, n_projects,
+                                  first_submission_on, last_submission_on,
+                                  total_time)
+          SELECT user_id, COUNT(id), COUNT(DISTINCT project_id),
+          MIN(finish_time), MAX(finish_time),
+          COALESCE(SUM(EXTRACT(EPOCH FROM finish_time_ts - created_ts)), 0)
+          FROM task_run WHERE user_id IS NOT NULL {}
+          GROUP BY user_id;
+          '''
+    db.session.execute(text(sql.format(conditions)), params)
+    db.session.commit()
+
+
 def delete_user_summary_id(oid):
     """Delete from cache the user summary."""
     user = db.session.query(User).get(oid)
@@ -349,77 +389,82 @@ def get_user_preferences(user_id):
     return get_user_pref_db_clause(user_pref)
 
 
-@memoize(timeout=timeouts.get('USER_TIMEOUT'))
 def get_users_for_report():
-    """Return information for all users to generate report."""
+    """Yield information for all users to generate report.
+
+    The counters come from user_stats and the rows are read through a
+    server-side cursor, so the report is streamed instead of built in
+    memory.
+    """
+    total_tasks = n_total_tasks()
     sql = text("""
                 SELECT u.id AS u_id, name, fullname, email_addr, u.created, admin, enabled, locale,
                 subadmin, user_pref->'languages' AS languages, user_pref->'locations' AS locations,
                 u.info->'metadata'->'work_hours_from' AS work_hours_from, u.info->'metadata'->'work_hours_to' AS work_hours_to,
                 u.info->'metadata'->'timezone' AS timezone, u.info->'metadata'->'user_type' AS type_of_user,
                 u.info->'metadata'->'review' AS additional_comments,
-                MIN(finish_time) AS first_submission_date,
-                MAX(finish_time) AS last_submission_date,
-                (SELECT COUNT(id) FROM task_run WHERE user_id = u.id)AS completed_tasks,
-                (SELECT coalesce(AVG(to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24-MI-SS.US') -
-                to_timestamp(created, 'YYYY-MM-DD"T"HH24-MI-SS.US')), interval '0s')
-                FROM task_run WHERE user_id = u.id) AS avg_time_per_task, u.consent, u.restrict
-                FROM task_run t RIGHT JOIN "user" u ON t.user_id = u.id
+                us.first_submission_on AS first_submission_date,
+                us.last_submission_on AS last_submission_date,
+                COALESCE(us.n_answers, 0) AS completed_tasks,
+                COALESCE(us.n_projects, 0) AS total_projects_contributed,
+                COALESCE(us.total_time / NULLIF(us.n_answers, 0), 0)
+                AS avg_time_per_task, u.consent, u.restrict
+                FROM "user" u LEFT JOIN user_stats us ON us.user_id = u.id
                 WHERE u.restrict=False and u.email_addr not like 'del-%@del.com'
-                GROUP BY user_id, u.id;
-               """)
+                ORDER BY u.id;
+               """).execution_options(stream_results=True)
     results = session.execute(sql)
-    users_report = [ dict(id=row.u_id, name=row.name, fullname=row.fullname,
-                    email_addr=row.email_addr, created=row.created, locale=row.locale,
-                    admin=row.admin, subadmin=row.subadmin, enabled=row.enabled, languages=row.languages,
-                    locations=row.locations, work_hours_from=row.work_hours_from,
-                    work_hours_to=row.work_hours_to, timezone=row.timezone,
-                    additional_comments=row.additional_comments,
-                    type_of_user=row.type_of_user, first_submission_date=row.first_submission_date,
-                    last_submission_date=row.last_submission_date,
-                    completed_tasks=row.completed_tasks, avg_time_per_task=str(round(row.avg_time_per_task.total_seconds() / 60, 2)),
-                    total_projects_contributed=n_projects_contributed(row.u_id),
-                    percentage_tasks_completed=round(float(row.completed_tasks) * 100 / n_total_tasks(), 2) if n_total_tasks() else 0,
-                    consent=row.consent, restrict=row.restrict)
-                    for row in results]
-    return users_report
+    for row in results:
+        yield dict(id=row.u_id, name=row.name, fullname=row.fullname,
+                   email_addr=row.email_addr, created=row.created, locale=row.locale,
+                   admin=row.admin, subadmin=row.subadmin, enabled=row.enabled, languages=row.languages,
+                   locations=row.locations, work_hours_from=row.work_hours_from,
+                   work_hours_to=row.work_hours_to, timezone=row.timezone,
+                   additional_comments=row.additional_comments,
+                   type_of_user=row.type_of_user, first_submission_date=row.first_submission_date,
+                   last_submission_date=row.last_submission_date,
+                   completed_tasks=row.completed_tasks, avg_time_per_task=str(round(row.avg_time_per_task / 60, 2)),
+                   total_projects_contributed=row.total_projects_contributed,
+                   percentage_tasks_completed=round(float(row.completed_tasks) * 100 / total_tasks, 2) if total_tasks else 0,
+                   consent=row.consent, restrict=row.restrict)
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
 def get_project_report_userdata(project_id):
-    """Return users details who contributed to a particular project."""
+    """Yield details of the users who contributed to a particular project.
+
+    The task runs of the project are aggregated once per contributor and
+    the rows are read through a server-side cursor.
+    """
     if project_id is None:
-        return None
+        return
 
     total_tasks = n_tasks(project_id)
     sql = text(
             '''
-            SELECT id as u_id, name, fullname, email_addr, admin, subadmin, enabled,
+            SELECT u.id as u_id, name, fullname, email_addr, admin, subadmin, enabled,
             user_pref->'languages' AS languages, user_pref->'locations' AS locations,
-            info->'metadata'->'work_hours_from' AS work_hours_from, info->'metadata'->'work_hours_to' AS work_hours_to,
-            info->'metadata'->'timezone' AS timezone, info->'metadata'->'user_type' AS type_of_user,
-            info->'metadata'->'review' AS additional_comments,
-            (SELECT count(id) FROM task_run WHERE user_id = u.id AND project_id=:project_id) AS completed_tasks,
-            ((SELECT count(id) FROM task_run WHERE user_id = u.id AND project_id =:project_id) * 100 / :total_tasks) AS percent_completed_tasks,
-            (SELECT min(finish_time) FROM task_run WHERE user_id = u.id AND project_id=:project_id) AS first_submission_date,
-            (SELECT max(finish_time) FROM task_run WHERE user_id = u.id AND project_id=:project_id) AS last_submission_date,
-            (SELECT coalesce(AVG(to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24-MI-SS.US') -
-            to_timestamp(created, 'YYYY-MM-DD"T"HH24-MI-SS.US')), interval '0s')
-            FROM task_run WHERE user_id = u.id AND project_id=:project_id) AS avg_time_per_task
-            FROM "user" u WHERE id IN
-            (SELECT DISTINCT user_id FROM task_run tr GROUP BY project_id, user_id HAVING project_id=:project_id);
-            ''')
+            u.info->'metadata'->'work_hours_from' AS work_hours_from, u.info->'metadata'->'work_hours_to' AS work_hours_to,
+            u.info->'metadata'->'timezone' AS timezone, u.info->'metadata'->'user_type' AS type_of_user,
+            u.info->'metadata'->'review' AS additional_comments,
+            COUNT(tr.id) AS completed_tasks,
+            (COUNT(tr.id) * 100 / :total_tasks) AS percent_completed_tasks,
+            MIN(tr.finish_time) AS first_submission_date,
+            MAX(tr.finish_time) AS last_submission_date,
+            COALESCE(AVG(tr.finish_time_ts - tr.created_ts), interval '0s')
+            AS avg_time_per_task
+            FROM task_run tr JOIN "user" u ON u.id = tr.user_id
+            WHERE tr.project_id=:project_id
+            GROUP BY u.id ORDER BY u.id;
+            ''').execution_options(stream_results=True)
     results = session.execute(sql, dict(project_id=project_id, total_tasks=total_tasks))
-    users_report = [
-        [row.u_id, row.name, row.fullname, row.email_addr,
-         row.admin, row.subadmin, row.enabled, row.languages,
-         row.locations, row.work_hours_from, row.work_hours_to,
-         row.timezone, row.type_of_user, row.additional_comments,
-         row.completed_tasks, row.percent_completed_tasks,
-         row.first_submission_date, row.last_submission_date,
-         round(row.avg_time_per_task.total_seconds() / 60, 2)]
-         for row in results]
-    return users_report
+    for row in results:
+        yield [row.u_id, row.name, row.fullname, row.email_addr,
+               row.admin, row.subadmin, row.enabled, row.languages,
+               row.locations, row.work_hours_from, row.work_hours_to,
+               row.timezone, row.type_of_user, row.additional_comments,
+               row.completed_tasks, row.percent_completed_tasks,
+               row.first_submission_date, row.last_submission_date,
+               round(row.avg_time_per_task.total_seconds() / 60, 2)]
 
 
 @memoize(timeout=ONE_WEEK)
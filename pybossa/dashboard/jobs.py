@@ -18,6 +18,7 @@
 """Dashboard Jobs module for running background tasks in PYBOSSA server."""
 from sqlalchemy import text
 from pybossa.core import db
+from pybossa.util import refresh_materialized_view, create_unique_index
 
 
 def _exists_materialized_view(view):
@@ -35,10 +36,14 @@ def _exists_materialized_view(view):
 
 
 def _refresh_materialized_view(view):
-    sql = text('REFRESH MATERIALIZED VIEW %s' % view)
+    return refresh_materialized_view(db, view)
+
+
+def _create_materialized_view(view, sql, unique_columns):
     db.session.execute(sql)
+    create_unique_index(db, view, unique_columns)
     db.session.commit()
-    return "Materialized view refreshed"
+    return "Materialized view created"
 
 
 def active_users_week():
@@ -48,19 +53,17 @@ def active_users_week():
     else:
         sql = text('''CREATE MATERIALIZED VIEW dashboard_week_users AS
                    WITH crafters_per_day AS
-                        (select to_date(task_run.finish_time,
-                                        'YYYY-MM-DD\THH24:MI:SS.US') AS day,
+                        (select DATE(task_run.finish_time_ts
+                                     AT TIME ZONE 'UTC') AS day,
                                 user_id, COUNT(task_run.user_id) AS day_crafters
                         FROM task_run
-                        WHERE to_date(task_run.finish_time,
-                                      'YYYY-MM-DD\THH24:MI:SS.US')
+                        WHERE task_run.finish_time_ts
                             >= NOW() - ('1 week'):: INTERVAL
                         GROUP BY day, task_run.user_id)
                    SELECT day, COUNT(crafters_per_day.user_id) AS n_users
                    FROM crafters_per_day GROUP BY day ORDER BY day;''')
-        db.session.execute(sql)
-        db.session.commit()
-        return "Materialized view created"
+        return _create_materialized_view(
+            'dashboard_week_users', sql, ['day'])
 
 
 def active_anon_week():
@@ -70,19 +73,17 @@ def active_anon_week():
     else:
         sql = text('''CREATE MATERIALIZED VIEW dashboard_week_anon AS
                    WITH crafters_per_day AS
-                        (select to_date(task_run.finish_time,
-                                        'YYYY-MM-DD\THH24:MI:SS.US') AS day,
+                        (select DATE(task_run.finish_time_ts
+                                     AT TIME ZONE 'UTC') AS day,
                                 user_ip, COUNT(task_run.user_ip) AS day_crafters
                         FROM task_run
-                        WHERE to_date(task_run.finish_time,
-                                      'YYYY-MM-DD\THH24:MI:SS.US')
+                        WHERE task_run.finish_time_ts
                             >= NOW() - ('1 week'):: INTERVAL
                         GROUP BY day, task_run.user_ip)
                    SELECT day, COUNT(crafters_per_day.user_ip) AS n_users
                    FROM crafters_per_day GROUP BY day ORDER BY day;''')
-        db.session.execute(sql)
-        db.session.commit()
-        return "Materialized view created"
+        return _create_materialized_view(
+            'dashboard_week_anon', sql, ['day'])
 
 
 def draft_projects_week():
@@ -91,20 +92,17 @@ def draft_projects_week():
         return _refresh_materialized_view('dashboard_week_project_draft')
     else:
         sql = text('''CREATE MATERIALIZED VIEW dashboard_week_project_draft AS
-                   SELECT TO_DATE(project.created, 'YYYY-MM-DD\THH24:MI:SS.US') AS day,
+                   SELECT DATE(project.created_ts AT TIME ZONE 'UTC') AS day,
                    project.id, short_name, project.name,
                    owner_id, "user".name AS u_name, "user".email_addr
                    FROM project, "user"
-                   WHERE TO_DATE(project.created,
-                                'YYYY-MM-DD\THH24:MI:SS.US') >= now() -
-                                ('1 week')::INTERVAL
+                   WHERE project.created_ts >= now() - ('1 week')::INTERVAL
                    AND "user".id = project.owner_id
                    AND "user".restrict = false
                    AND project.published = false
                    GROUP BY project.id, "user".name, "user".email_addr;''')
-        db.session.execute(sql)
-        db.session.commit()
-        return "Materialized view created"
+        return _create_materialized_view(
+            'dashboard_week_project_draft', sql, ['id'])
 
 
 def published_projects_week():
@@ -114,7 +112,7 @@ def published_projects_week():
     else:
         sql = text('''CREATE MATERIALIZED VIEW dashboard_week_project_published AS
                    SELECT TO_DATE(auditlog.created, 'YYYY-MM-DD\THH24:MI:SS.US') AS day,
-                   project.id, project.short_name, project.name,
+                   auditlog.id AS auditlog_id, project.id, project.short_name, project.name,
                    owner_id, "user".name AS u_name, "user".email_addr
                    FROM auditlog, project, "user"
                    WHERE TO_DATE(auditlog.created,
@@ -126,9 +124,8 @@ def published_projects_week():
                    AND auditlog.project_id = project.id
                    AND auditlog.attribute = 'published'
                    GROUP BY auditlog.id, "user".name, "user".email_addr, project.id;''')
-        db.session.execute(sql)
-        db.session.commit()
-        return "Materialized view created"
+        return _create_materialized_view(
+            'dashboard_week_project_published', sql, ['auditlog_id'])
 
 
 def update_projects_week():
@@ -137,19 +134,16 @@ def update_projects_week():
         return _refresh_materialized_view('dashboard_week_project_update')
     else:
         sql = text('''CREATE MATERIALIZED VIEW dashboard_week_project_update AS
-                   SELECT TO_DATE(project.updated, 'YYYY-MM-DD\THH24:MI:SS.US') AS day,
+                   SELECT DATE(project.updated_ts AT TIME ZONE 'UTC') AS day,
                    project.id, short_name, project.name,
                    owner_id, "user".name AS u_name, "user".email_addr
                    FROM project, "user"
-                   WHERE TO_DATE(project.updated,
-                                'YYYY-MM-DD\THH24:MI:SS.US') >= now() -
-                                ('1 week')::INTERVAL
+                   WHERE project.updated_ts >= now() - ('1 week')::INTERVAL
                    AND "user".id = project.owner_id
                    AND "user".restrict = false
                    GROUP BY project.id, "user".name, "user".email_addr;''')
-        db.session.execute(sql)
-        db.session.commit()
-        return "Materialized view created"
+        return _create_materialized_view(
+            'dashboard_week_project_update', sql, ['id'])
 
 
 def new_tasks_week():
@@ -158,16 +152,13 @@ def new_tasks_week():
         return _refresh_materialized_view('dashboard_week_new_task')
     else:
         sql = text('''CREATE MATERIALIZED VIEW dashboard_week_new_task AS
-                      SELECT TO_DATE(task.created,
-                                     'YYYY-MM-DD\THH24:MI:SS.US') AS day,
+                      SELECT DATE(task.created_ts AT TIME ZONE 'UTC') AS day,
                       COUNT(task.id) AS day_tasks
-                      FROM task WHERE TO_DATE(task.created,
-                                              'YYYY-MM-DD\THH24:MI:SS.US')
-                                          >= now() - ('1 week'):: INTERVAL
+                      FROM task WHERE task.created_ts
+                                      >= now() - ('1 week'):: INTERVAL
                       GROUP BY day ORDER BY day ASC;''')
-        db.session.execute(sql)
-        db.session.commit()
-        return "Materialized view created"
+        return _create_materialized_view(
+            'dashboard_week_new_task', sql, ['day'])
 
 
 def new_task_runs_week():
@@ -176,16 +167,14 @@ def new_task_runs_week():
         return _refresh_materialized_view('dashboard_week_new_task_run')
     else:
         sql = text('''CREATE MATERIALIZED VIEW dashboard_week_new_task_run AS
-                      SELECT TO_DATE(task_run.finish_time,
-                                     'YYYY-MM-DD\THH24:MI:SS.US') AS day,
+                      SELECT DATE(task_run.finish_time_ts
+                                  AT TIME ZONE 'UTC') AS day,
                       COUNT(task_run.id) AS day_task_runs
-                      FROM task_run WHERE TO_DATE(task_run.finish_time,
-                                              'YYYY-MM-DD\THH24:MI:SS.US')
+                      FROM task_run WHERE task_run.finish_time_ts
                                           >= now() - ('1 week'):: INTERVAL
                       GROUP BY day;''')
-        db.session.execute(sql)
-        db.session.commit()
-        return "Materialized view created"
+        return _create_materialized_view(
+            'dashboard_week_new_task_run', sql, ['day'])
 
 
 def new_users_week():
@@ -202,9 +191,8 @@ def new_users_week():
                                           >= now() - ('1 week'):: INTERVAL
                       AND "user".restrict=false
                       GROUP BY day;''')
-        db.session.execute(sql)
-        db.session.commit()
-        return "Materialized view created"
+        return _create_materialized_view(
+            'dashboard_week_new_users', sql, ['day'])
 
 
 def returning_users_week():
@@ -214,16 +202,14 @@ def returning_users_week():
     else:
         sql = text('''CREATE MATERIALIZED VIEW dashboard_week_returning_users AS
                    WITH data AS (
-                    SELECT user_id, TO_DATE(task_run.finish_time,
-                    'YYYY-MM-DD\THH24:MI:SS.US') AS day
+                    SELECT user_id, DATE(task_run.finish_time_ts
+                    AT TIME ZONE 'UTC') AS day
                    FROM task_run
-                   WHERE TO_DATE(task_run.finish_time,
-                   'YYYY-MM-DD\THH24:MI:SS.US') >= NOW()
+                   WHERE task_run.finish_time_ts >= NOW()
                    - ('1 week')::INTERVAL GROUP BY day, task_run.user_id)
                    SELECT user_id, COUNT(user_id) AS n_days
                    FROM data GROUP BY user_id HAVING(count(user_id) > 1)
                    ORDER by n_days;
                       ''')
-        db.session.execute(sql)
-        db.session.commit()
-        return "Materialized view created"
+        return _create_materialized_view(
+            'dashboard_week_returning_users', sql, ['user_id'])
@@ -63,6 +63,16 @@ REDIS_DB = 0
 
 REDIS_KEYPREFIX = 'pybossa_cache'
 
+# Cached values serializer ('pickle' or 'msgpack') and size in bytes above
+# which serialized values are compressed (None disables compression)
+CACHE_SERIALIZER = 'pickle'
+CACHE_COMPRESSION_THRESHOLD = 1024
+
+# Record hits, misses and timings of cached functions, flushing the in-process
+# counters to Redis every CACHE_STATS_FLUSH_INTERVAL seconds
+CACHE_STATS_ENABLED = True
+CACHE_STATS_FLUSH_INTERVAL = 60
+
 ## Default cache timeouts
 # Project cache
 AVATAR_TIMEOUT = 30 * 24 * 60 * 60
@@ -95,6 +105,9 @@ TEMPLATE_TASKS = {
 LIMIT = 300
 PER = 15 * 60
 
+# Max number of items per API request when streaming application/x-ndjson
+API_NDJSON_MAX_LIMIT = 10000
+
 # Expiration time for password protected project cookies
 PASSWD_COOKIE_TIMEOUT = 60 * 30
 
@@ -143,6 +156,12 @@ STRICT_SLASHES = True
 MINUTE = 60
 TIMEOUT = 10 * MINUTE
 
+# Cache warming: projects/users per warm job, and seconds after which
+# unchanged projects and users are warmed again
+WARM_CACHE_SHARD_SIZE = 10
+WARM_CACHE_MAX_AGE = 60 * MINUTE
+STATS_REFRESH_INTERVAL = 10 * MINUTE
+
 # OneSignal GCM Sender ID
 # DO NOT MODIFY THIS
 GCM_SENDER_ID = "482941778795"
@@ -66,12 +66,13 @@ class ProjectReportCsvExporter(CsvExporter):
                            'Additional Comments', 'Total Tasks Completed', 'Percent Tasks Completed',
                            'First Task Submission', 'Last Task Submission', 'Average Time Per Task']
             writer.writerow(user_section)
-            users_project_data = get_project_report_userdata(id)
-            if users_project_data:
-                writer.writerow(user_header)
-                for user_data in users_project_data:
-                    writer.writerow(user_data)
-            else:
+            n_users = 0
+            for user_data in get_project_report_userdata(id):
+                if not n_users:
+                    writer.writerow(user_header)
+                writer.writerow(user_data)
+                n_users += 1
+            if not n_users:
                 writer.writerow(['No user data'])
 
             return self._get_csv(out, writer)
@@ -60,15 +60,64 @@ TASK_FIELDS = [
 
 session = db.slave_session
 
+#: Number of rows fetched at a time when exporting from the browse tasks
+#: view.
+EXPORT_CHUNK_SIZE = 1000
+
 
 def _field_mapreducer(fields, prefix=''):
     return ',\n'.join(field.format(prefix) for field in fields)
 
 
+def get_field_names(fields, prefix=''):
+    """Return the names the columns of fields are selected as."""
+    return [field.split(' AS ')[1].format(prefix) for field in fields]
+
+
+def get_task_user_pref_keys(project_id):
+    """Return the paths of the keys found in the user_pref of the tasks of
+    a project, nested keys joined with '__' like the task info catalog."""
+    sql = text('''
+               WITH RECURSIVE pref_key(path, value) AS (
+                   SELECT e.key, e.value
+                   FROM task CROSS JOIN LATERAL jsonb_each(
+                       CASE WHEN jsonb_typeof(task.user_pref) = 'object'
+                       THEN task.user_pref ELSE '{}' END) AS e
+                   WHERE task.project_id = :project_id
+                   UNION ALL
+                   SELECT pref_key.path || '__' || e.key, e.value
+                   FROM pref_key CROSS JOIN LATERAL jsonb_each(
+                       CASE WHEN jsonb_typeof(pref_key.value) = 'object'
+                       THEN pref_key.value ELSE '{}' END) AS e
+               )
+               SELECT DISTINCT path FROM pref_key
+               ''')
+    results = session.execute(sql, dict(project_id=project_id))
+    return [row.path for row in results]
+
+
+def _streamed_rows(sql, params, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the rows of sql reading them through a server side cursor,
+    chunk_size rows at a time, so the query runs only once and the rows
+    are never all held in memory.
+    """
+    conn = session.connection().execution_options(stream_results=True)
+    results = conn.execute(sql, params)
+    while True:
+        rows = results.fetchmany(chunk_size)
+        if not rows:
+            return
+        for row in rows:
+            yield row
+
+
 def browse_tasks_export(obj, project_id, expanded, filters):
     """Export tasks from the browse tasks view for a project
     using the same filters that are selected by the user
     in the UI.
+
+    Rows are read lazily through a server side cursor, so the returned
+    iterable can only be consumed once.
     """
     conditions, filter_params = get_task_filters(filters)
     if obj == 'task':
@@ -86,6 +135,7 @@ def browse_tasks_export(obj, project_id, expanded, filters):
                        ON task.id = log_counts.task_id
                      WHERE project_id = :project_id
                      {1}
+                     ORDER BY task.id
                    '''.format(_field_mapreducer(TASK_FIELDS, ''),
                               conditions)
                   )
@@ -111,6 +161,7 @@ def browse_tasks_export(obj, project_id, expanded, filters):
                           ON task_run.user_id = "user".id
                         WHERE task_run.project_id = :project_id
                         {3}
+                        ORDER BY task_run.id
                       '''.format(_field_mapreducer(TASKRUN_FIELDS, ''),
                                  _field_mapreducer(TASK_FIELDS, 'task__'),
                                  _field_mapreducer(USER_FIELDS, 'user__'),
@@ -133,13 +184,14 @@ def browse_tasks_export(obj, project_id, expanded, filters):
                           ON task_run.task_id = log_counts.task_id
                         WHERE task_run.project_id = :project_id
                         {1}
+                        ORDER BY task_run.id
                       '''.format(_field_mapreducer(TASKRUN_FIELDS, ''),
                                  conditions)
                      )
     else:
         return
 
-    return session.execute(sql, dict(project_id=project_id, **filter_params))
+    return _streamed_rows(sql, dict(project_id=project_id, **filter_params))
 
 
 def browse_tasks_export_count(obj, project_id, expanded, filters):
@@ -23,7 +23,9 @@ from pybossa.uploader import local
 from pybossa.exporter.csv_export import CsvExporter
 from pybossa.core import uploader, task_repo
 from pybossa.util import UnicodeWriter
-from export_helpers import browse_tasks_export
+from pybossa.cache.task_browse_helpers import get_task_info_keys
+from export_helpers import (browse_tasks_export, get_field_names,
+                            get_task_user_pref_keys, TASK_FIELDS)
 
 
 class TaskCsvExporter(CsvExporter):
@@ -158,7 +160,9 @@ class TaskCsvExporter(CsvExporter):
             return
 
         objs = query_filter(project_id=project_id, yielded=True)
-        headers = self._get_all_headers(objs, expanded)
+        headers = self._get_all_headers(
+            objs, expanded,
+            info_headers=self._get_info_headers(project_id, table, expanded))
         writer.writerow(headers)
 
         for obj in objs:
@@ -168,15 +172,21 @@ class TaskCsvExporter(CsvExporter):
 
     def _get_csv_with_filters(self, out, writer, table, project_id,
                               expanded, filters):
-        objs = browse_tasks_export(table, project_id, expanded, filters)
-        rows = [obj for obj in objs]
-
-        headers = self._get_all_headers(objs=rows,
-                                        expanded=expanded,
-                                        table=table,
-                                        from_obj=False)
+        info_headers = self._get_info_headers(project_id, table, expanded)
+        if info_headers is None:
+            # the keys of the rows have to be walked first, so the rows are
+            # read twice but never all held in memory
+            objs = browse_tasks_export(table, project_id, expanded, filters)
+            headers = self._get_all_headers(
+                objs=objs,
+                expanded=expanded,
+                table=table,
+                from_obj=False)
+        else:
+            headers = self._get_catalog_headers(project_id, info_headers)
         writer.writerow(headers)
 
+        rows = browse_tasks_export(table, project_id, expanded, filters)
         for row in rows:
             row = self.process_filtered_row(dict(row))
             writer.writerow(self._format_csv_row(row, headers))
@@ -184,7 +194,31 @@ class TaskCsvExporter(CsvExporter):
         out.seek(0)
         yield out.read()
 
-    def _get_all_headers(self, objs, expanded, table=None, from_obj=True):
+    @staticmethod
+    def _get_info_headers(project_id, table, expanded):
+        """Return the headers of the task info keys of a project, read
+        from its catalog, or None when they have to be found in the rows.
+        """
+        if table != 'task' or expanded:
+            return None
+        return ['task__info__{}'.format(row['path'])
+                for row in get_task_info_keys(project_id)]
+
+    @staticmethod
+    def _get_catalog_headers(project_id, info_headers):
+        """Return the headers of a task export without reading its rows:
+        the task columns, the info keys of the catalog and the user_pref
+        keys of the project tasks.
+        """
+        headers = set(info_headers)
+        headers.update('task__{}'.format(name)
+                       for name in get_field_names(TASK_FIELDS))
+        headers.update('task__user_pref__{}'.format(path)
+                       for path in get_task_user_pref_keys(project_id))
+        return sorted(headers)
+
+    def _get_all_headers(self, objs, expanded, table=None, from_obj=True,
+                         info_headers=None):
         """Construct headers to **guarantee** that all headers
         for all tasks are included, regardless of whether
         or not all tasks were imported with the same headers.
@@ -197,25 +231,35 @@ class TaskCsvExporter(CsvExporter):
         :param from_obj: does ``objs`` iterable contain
             domain objects. If it does then different methods
             can be used.
+        :param info_headers: headers of the ``info`` keys taken
+            from the project catalog. When given, the ``info`` of
+            the rows is not walked.
         """
-        headers = set()
+        headers = set(info_headers or [])
+        skip_info = info_headers is not None
 
         if from_obj:
             obj_name = objs[0].__class__.__name__.lower()
             for obj in objs:
-                headers.update(self._get_headers_from_row(obj, obj_name, expanded))
+                headers.update(self._get_headers_from_row(obj, obj_name,
+                                                          expanded, skip_info))
         else:
             for obj in objs:
+                obj = dict(obj)
+                if skip_info:
+                    obj['info'] = None
                 headers.update(self.get_keys(obj, table))
 
         headers = sorted(list(headers))
         return headers
 
-    def _get_headers_from_row(self, obj, obj_name, expanded):
+    def _get_headers_from_row(self, obj, obj_name, expanded, skip_info=False):
         if expanded:
             obj_dict = self.merge_objects(obj)
         else:
             obj_dict = obj.dictize()
+        if skip_info:
+            obj_dict['info'] = None
 
         headers = self.get_keys(obj_dict, obj_name)
         return headers
@@ -18,10 +18,7 @@
 import json
 from time import time
 from pybossa.core import sentinel
-try:
-    import cPickle as pickle
-except ImportError:  # pragma: no cover
-    import pickle
+from pybossa.cache import serialize, deserialize
 
 from flask import current_app
 
@@ -30,7 +27,7 @@ FEED_KEY = 'pybossa_feed'
 def update_feed(obj):
     """Add domain object to update feed in Redis."""
     pipeline = sentinel.master.pipeline()
-    serialized_object = pickle.dumps(obj)
+    serialized_object = serialize(obj)
     pipeline.zadd(FEED_KEY, time(), serialized_object)
     pipeline.execute()
 
@@ -40,7 +37,7 @@ def get_update_feed():
     feed = []
     for u in data:
         try:
-            tmp = pickle.loads(u[0])
+            tmp = deserialize(u[0])
             tmp['updated'] = u[1]
             if tmp.get('info') and type(tmp.get('info')) == unicode:
                 tmp['info'] = json.loads(tmp['info'])
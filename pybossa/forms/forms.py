@@ -184,6 +184,12 @@ class TaskTimeoutForm(Form):
                                   message=lazy_gettext(msg))])
 
 
+class SearchableColumnsForm(Form):
+    columns = SelectMultipleField(lazy_gettext('Task info fields to index '
+                                               'for searching'),
+                                  choices=[])
+
+
 class TaskSchedulerForm(Form):
     _translate_names = lambda variant: (variant[0], lazy_gettext(variant[1]))
     _choices = map(_translate_names, sched_variants())
@@ -36,6 +36,9 @@ MINUTE = 60
 IMPORT_TASKS_TIMEOUT = (20 * MINUTE)
 TASK_DELETE_TIMEOUT = (60 * MINUTE)
 EXPORT_TASKS_TIMEOUT = (10 * MINUTE)
+SEARCHABLE_INDEXES_TIMEOUT = (120 * MINUTE)
+# first key of the advisory lock held while syncing the indexes of a project
+SEARCHABLE_INDEXES_LOCK = 1301
 from pybossa.core import uploader
 from pybossa.exporter.json_export import JsonExporter
 
@@ -192,14 +195,18 @@ def project_export(_id):
 
 
 def get_project_jobs(queue):
-    """Return a list of jobs based on user type."""
-    from pybossa.core import project_repo
+    """Return a list of jobs based on user type.
+
+    Pro users' projects are refreshed on every run; for the rest only the
+    projects with new contributions since their last refresh (and not
+    refreshed in the last STATS_REFRESH_INTERVAL seconds) get a job.
+    """
     from pybossa.cache import projects as cached_projects
     timeout = current_app.config.get('TIMEOUT')
     if queue == 'super':
         projects = cached_projects.get_from_pro_user()
     elif queue == 'high':
-        projects = (p.dictize() for p in project_repo.get_all())
+        projects = _get_dirty_projects()
     else:
         projects = []
     for project in projects:
@@ -212,6 +219,21 @@ def get_project_jobs(queue):
         yield job
 
 
+def _get_dirty_projects():
+    """Return id and short_name of the projects whose stats are outdated."""
+    from sqlalchemy.sql import text
+    from pybossa.core import db
+    from pybossa.traffic import pop_dirty_projects
+    interval = current_app.config.get('STATS_REFRESH_INTERVAL', 10 * 60)
+    project_ids = pop_dirty_projects(interval)
+    if not project_ids:
+        return []
+    sql = text('''SELECT id, short_name FROM project
+               WHERE id = ANY(:project_ids) ORDER BY id;''')
+    results = db.slave_session.execute(sql, dict(project_ids=project_ids))
+    return [dict(id=row.id, short_name=row.short_name) for row in results]
+
+
 def create_dict_jobs(data, function, timeout, queue='low'):
     """Create a dict job."""
     for d in data:
@@ -230,10 +252,8 @@ def get_inactive_users_jobs(queue='quaterly'):
     # First users that have participated once but more than 3 months ago
     sql = text('''SELECT user_id FROM task_run
                WHERE user_id IS NOT NULL
-               AND to_date(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-               >= NOW() - '12 month'::INTERVAL
-               AND to_date(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-               < NOW() - '3 month'::INTERVAL
+               AND task_run.finish_time_ts >= NOW() - '12 month'::INTERVAL
+               AND task_run.finish_time_ts < NOW() - '3 month'::INTERVAL
                GROUP BY user_id ORDER BY user_id;''')
     results = db.slave_session.execute(sql)
 
@@ -267,7 +287,10 @@ def get_inactive_users_jobs(queue='quaterly'):
 
 def get_dashboard_jobs(queue='low'):  # pragma: no cover
     """Return dashboard jobs."""
+    from pybossa.cache.site_stats import update_site_activity
     timeout = current_app.config.get('TIMEOUT')
+    yield dict(name=update_site_activity, args=[], kwargs={},
+               timeout=timeout, queue=queue)
     yield dict(name=dashboard.active_users_week, args=[], kwargs={},
                timeout=timeout, queue=queue)
     yield dict(name=dashboard.active_anon_week, args=[], kwargs={},
@@ -392,63 +415,147 @@ def warm_up_stats():  # pragma: no cover
     return True
 
 
-@with_cache_disabled
 def warm_cache():  # pragma: no cover
-    """Background job to warm cache."""
-    from pybossa.core import create_app
-    app = create_app(run_as_server=False)
-    projects_cached = []
+    """Background job to warm cache.
+
+    Enqueues warm_projects and warm_users jobs with shards of the projects
+    and users shown in the most visited pages, busiest projects first.
+    Projects and users whose data didn't change since they were warmed
+    less than WARM_CACHE_MAX_AGE seconds ago are skipped.
+    """
     import pybossa.cache.projects as cached_projects
     import pybossa.cache.categories as cached_cat
     import pybossa.cache.users as cached_users
-    import pybossa.cache.project_stats as stats
+    from pybossa.cache import cache_disabled
     from pybossa.util import rank
-    from pybossa.core import user_repo
+    from pybossa.traffic import (get_project_traffic, decay_project_traffic,
+                                 get_top_traffic_projects)
+
+    project_ids = []
+
+    def add_projects(ids):
+        for _id in ids:
+            if _id not in project_ids:
+                project_ids.append(_id)
+
+    to_cache = 3 * current_app.config['APPS_PER_PAGE']
+    add_projects(get_top_traffic_projects(to_cache))
+    # The listings are recomputed and stored again, refreshing the cache
+    with cache_disabled():
+        # Cache top projects
+        add_projects(p['id'] for p in cached_projects.get_top())
+        # Cache 3 pages
+        add_projects(p['id'] for p in
+                     rank(cached_projects.get_all_featured('featured'))[:to_cache])
+        # Categories
+        for c in cached_cat.get_used():
+            add_projects(p['id'] for p in
+                         rank(cached_projects.get_all(c['short_name']))[:to_cache])
+        users = cached_users.get_leaderboard(current_app.config['LEADERBOARD'])
+
+    traffic = get_project_traffic(project_ids)
+    project_ids.sort(key=lambda _id: traffic[_id], reverse=True)
+    decay_project_traffic()
+    projects = _get_changed(project_ids, _get_project_fingerprints(project_ids),
+                            'project')
 
-    def warm_project(_id, short_name, featured=False):
-        if _id not in projects_cached:
-            #cached_projects.get_project(short_name)
-            #cached_projects.n_tasks(_id)
-            #n_task_runs = cached_projects.n_task_runs(_id)
-            #cached_projects.overall_progress(_id)
-            #cached_projects.last_activity(_id)
-            #cached_projects.n_completed_tasks(_id)
-            #cached_projects.n_volunteers(_id)
-            #cached_projects.browse_tasks(_id)
-            #if n_task_runs >= 1000 or featured:
-            #    # print ("Getting stats for %s as it has %s task runs" %
-            #    #        (short_name, n_task_runs))
-            stats.update_stats(_id)
-            projects_cached.append(_id)
-
-    # Cache top projects
-    projects = cached_projects.get_top()
-    for p in projects:
-        warm_project(p['id'], p['short_name'])
-
-    # Cache 3 pages
-    to_cache = 3 * app.config['APPS_PER_PAGE']
-    projects = rank(cached_projects.get_all_featured('featured'))[:to_cache]
-    for p in projects:
-        warm_project(p['id'], p['short_name'], featured=True)
-
-    # Categories
-    categories = cached_cat.get_used()
-    for c in categories:
-        projects = rank(cached_projects.get_all(c['short_name']))[:to_cache]
-        for p in projects:
-            warm_project(p['id'], p['short_name'])
     # Users
-    users = cached_users.get_leaderboard(app.config['LEADERBOARD'])
-    for user in users:
-        # print "Getting stats for %s" % user['name']
-        print user_repo
-        u = user_repo.get_by_name(user['name'])
-        cached_users.get_user_summary(user['name'])
+    names = [user['name'] for user in users]
+    users = _get_changed(names, _get_user_fingerprints(names), 'user')
+
+    shard_size = current_app.config.get('WARM_CACHE_SHARD_SIZE', 10)
+    timeout = current_app.config.get('TIMEOUT')
+    for function, items in ((warm_projects, projects), (warm_users, users)):
+        for i in range(0, len(items), shard_size):
+            enqueue_job(dict(name=function, args=[items[i:i + shard_size]],
+                             kwargs={}, timeout=timeout, queue='super'))
+    return True
+
+
+def _get_warm_cache_key(kind, _id):
+    from pybossa.cache import settings
+    return '%s:warm_cache:%s:%s' % (settings.REDIS_KEYPREFIX, kind, _id)
+
+
+def _get_changed(ids, fingerprints, kind):
+    """Return (id, fingerprint) pairs of the items whose fingerprint differs
+    from the one stored when they were last warmed."""
+    from pybossa.core import sentinel
+    if not ids:
+        return []
+    stored = sentinel.slave.mget([_get_warm_cache_key(kind, _id)
+                                  for _id in ids])
+    return [(_id, fingerprints.get(_id, '')) for _id, last in zip(ids, stored)
+            if last is None or last != fingerprints.get(_id, '')]
+
+
+def _set_warmed(_id, fingerprint, kind):
+    from pybossa.core import sentinel
+    max_age = current_app.config.get('WARM_CACHE_MAX_AGE', 60 * 60)
+    sentinel.master.setex(_get_warm_cache_key(kind, _id), max_age,
+                          fingerprint)
+
+
+def _get_project_fingerprints(project_ids):
+    """Return a string per project that changes when its stats may change."""
+    from sqlalchemy.sql import text
+    from pybossa.core import db
+    sql = text('''SELECT project.id, project.updated,
+               (SELECT MAX(task.id) FROM task
+                WHERE task.project_id=project.id) AS last_task,
+               (SELECT MAX(task_run.id) FROM task_run
+                WHERE task_run.project_id=project.id) AS last_task_run
+               FROM project WHERE project.id = ANY(:project_ids);''')
+    results = db.slave_session.execute(sql, dict(project_ids=project_ids))
+    return dict((row.id, '%s:%s:%s' % (row.updated, row.last_task,
+                                       row.last_task_run))
+                for row in results)
+
+
+def _get_user_fingerprints(names):
+    """Return a string per user that changes when its summary may change."""
+    from sqlalchemy.sql import text
+    from pybossa.core import db
+    sql = text('''SELECT "user".name,
+               (SELECT MAX(task_run.id) FROM task_run
+                WHERE task_run.user_id="user".id) AS last_task_run,
+               (SELECT MAX(project.updated) FROM project
+                WHERE project.owner_id="user".id) AS last_project_update
+               FROM "user" WHERE "user".name = ANY(:names);''')
+    results = db.slave_session.execute(sql, dict(names=names))
+    return dict((row.name, '%s:%s' % (row.last_task_run,
+                                      row.last_project_update))
+                for row in results)
+
+
+@with_cache_disabled
+def warm_projects(projects):  # pragma: no cover
+    """Background job to refresh the stats of a shard of projects."""
+    import pybossa.cache.project_stats as stats
+    from pybossa.traffic import claim_stats_refresh
+    interval = current_app.config.get('STATS_REFRESH_INTERVAL', 10 * 60)
+    ready = claim_stats_refresh([_id for _id, _ in projects], interval)
+    for _id, fingerprint in projects:
+        if _id in ready:
+            stats.update_stats(_id)
+            _set_warmed(_id, fingerprint, 'project')
+    return True
+
+
+@with_cache_disabled
+def warm_users(users):  # pragma: no cover
+    """Background job to refresh the cached data of a shard of users."""
+    import pybossa.cache.users as cached_users
+    from pybossa.core import user_repo
+    for name, fingerprint in users:
+        u = user_repo.get_by_name(name)
+        if u is None:
+            continue
+        cached_users.get_user_summary(name)
         cached_users.projects_contributed_cached(u.id)
         cached_users.published_projects_cached(u.id)
         cached_users.draft_projects_cached(u.id)
-
+        _set_warmed(name, fingerprint, 'user')
     return True
 
 
@@ -457,8 +564,8 @@ def get_non_updated_projects():
     from sqlalchemy.sql import text
     from pybossa.model.project import Project
     from pybossa.core import db
-    sql = text('''SELECT id FROM project WHERE TO_DATE(updated,
-                'YYYY-MM-DD\THH24:MI:SS.US') <= NOW() - '3 month':: INTERVAL
+    sql = text('''SELECT id FROM project
+               WHERE updated_ts <= NOW() - '3 month':: INTERVAL
                AND contacted != True AND published = True
                AND project.id NOT IN
                (SELECT task.project_id FROM task
@@ -538,7 +645,10 @@ def delete_bulk_tasks(data):
     from sqlalchemy.sql import text
     from pybossa.core import db
     import pybossa.cache.projects as cached_projects
-    from pybossa.cache.task_browse_helpers import get_task_filters
+    from pybossa.cache.task_browse_helpers import (get_task_filters,
+                                                   rebuild_task_info_keys)
+    from pybossa.cache.project_stats import reset_task_run_rollup
+    from pybossa.cache.users import rebuild_user_stats
 
     project_id = data['project_id']
     project_name = data['project_name']
@@ -628,6 +738,10 @@ def delete_bulk_tasks(data):
                "deleted from project {0} as requested by {1}"
                .format(project_name, current_user_fullname))
     db.bulkdel_session.execute(sql, dict(project_id=project_id, **params))
+    reset_task_run_rollup(db.session, project_id)
+    db.session.commit()
+    rebuild_user_stats(project_id=project_id)
+    rebuild_task_info_keys(project_id)
     cached_projects.clean_project(project_id)
     subject = 'Tasks deletion from %s' % project_name
     body = 'Hello,\n\n' + msg + '\n\nThe %s team.'\
@@ -681,9 +795,7 @@ def _num_tasks_imported(project_id):
     sql = text('''
         SELECT COUNT(*) FROM task WHERE
         project_id=:project_id AND
-            clock_timestamp()
-                - to_timestamp(task.created, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-            < INTERVAL ':seconds seconds'
+            task.created_ts > clock_timestamp() - INTERVAL ':seconds seconds'
         ''')
     params = dict(seconds=IMPORT_TASKS_TIMEOUT + 10, project_id=project_id)
     return db.session.execute(sql, params).scalar()
@@ -1187,3 +1299,53 @@ def delete_file(fname, container):
     """Delete file."""
     from pybossa.core import uploader
     return uploader.delete_file(fname, container)
+
+
+def sync_searchable_indexes(project_id):
+    """Create and drop the trigram indexes of a project task info fields so
+    they match the searchable columns chosen in its settings.
+
+    Indexes are built and dropped concurrently, outside of a transaction,
+    so tasks can still be written meanwhile. The jobs of a project are
+    serialized with an advisory lock, so an invalid index can only be left
+    by an interrupted build; it is dropped and built again.
+    """
+    from sqlalchemy.sql import text
+    from pybossa.core import db, project_repo
+    from pybossa.cache.task_browse_helpers import (info_index_prefix,
+                                                   get_info_index_name,
+                                                   get_info_index_sql)
+    prefix = '{}{}_'.format(info_index_prefix, project_id)
+    sql = text('''SELECT c.relname AS name, i.indisvalid AS valid
+               FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+               WHERE i.indrelid = 'task'::regclass''')
+    lock = dict(namespace=SEARCHABLE_INDEXES_LOCK, project_id=project_id)
+    conn = db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+    try:
+        conn.execute(text('SELECT pg_advisory_lock(:namespace, :project_id)'),
+                     lock)
+        # read the settings once the lock is held, so the last job wins
+        project = project_repo.get(project_id)
+        columns = project.info.get('searchable_columns', []) if project else []
+        # end the read transaction, a concurrent build would wait for it
+        db.session.commit()
+        wanted = dict((get_info_index_name(project_id, column), column)
+                      for column in columns)
+        existing = dict((row.name, row.valid) for row in conn.execute(sql)
+                        if row.name.startswith(prefix))
+        n_dropped = n_created = 0
+        for name, valid in existing.iteritems():
+            if name not in wanted or not valid:
+                conn.execute(text('DROP INDEX CONCURRENTLY IF EXISTS %s'
+                                  % name))
+                n_dropped += 1
+        for name, column in wanted.iteritems():
+            if not existing.get(name):
+                conn.execute(text(get_info_index_sql(project_id, column)))
+                n_created += 1
+    finally:
+        conn.execute(text('SELECT pg_advisory_unlock(:namespace, :project_id)'),
+                     lock)
+        conn.close()
+    return ('Searchable indexes of project %s: %s created, %s dropped'
+            % (project_id, n_created, n_dropped))
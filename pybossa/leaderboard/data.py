@@ -19,39 +19,33 @@
 from sqlalchemy import text
 from pybossa.core import db
 from pybossa.model.user import User
+from pybossa.leaderboard.scores import get_ranked_users, get_rank_and_score
 
 u = User()
 
 
 def get_leaderboard(top_users=20, user_id=None, window=0, info=None):
     """Return a list of top_users and if user_id return its position."""
+    if info is None:
+        return get_scores_leaderboard(top_users, user_id, window)
     materialized_view = "users_rank_%s" % info
-    sql = text('''SELECT * from users_rank WHERE rank <= :top_users 
-               ORDER BY rank;''')
-    if info:
-        sql = text('''SELECT * from {} WHERE rank <= :top_users 
-                    ORDER BY rank;'''.format(materialized_view))
+    sql = text('''SELECT * from {} WHERE rank <= :top_users
+               ORDER BY rank;'''.format(materialized_view))
 
     results = db.session.execute(sql, dict(top_users=top_users))
     top_users = [format_user(user) for user in results]
 
     if user_id:
-        sql = text('''SELECT * from users_rank where id=:user_id;''')
-        if info:
-            sql = text('''SELECT * from {} where
-                       id=:user_id;'''.format(materialized_view))
+        sql = text('''SELECT * from {} where
+                   id=:user_id;'''.format(materialized_view))
         results = db.session.execute(sql, dict(user_id=user_id))
         user = None
         for row in results:
             user = format_user(row)
         if user and window != 0:
-            sql = text('''SELECT * from users_rank
+            sql = text('''SELECT * from {}
                        WHERE rank >= :low AND rank <= :top order by rank;
-                       ''')
-            if info:
-                sql = text('''SELECT * from {} 
-                           WHERE rank >= :low AND rank <= :top order by rank;
-                           '''.format(materialized_view))
+                       '''.format(materialized_view))
             low = user['rank'] - window
             top = user['rank'] + window
             results = db.session.execute(sql, dict(user_id=user_id,
@@ -66,10 +60,31 @@ def get_leaderboard(top_users=20, user_id=None, window=0, info=None):
     return top_users
 
 
-def format_user(user):
+def get_scores_leaderboard(top_users=20, user_id=None, window=0):
+    """Return the default leaderboard from the scores sorted set."""
+    ranking = get_ranked_users(1, top_users)
+    if user_id:
+        rank, score = get_rank_and_score(user_id)
+        if rank is not None and window != 0:
+            ranking += get_ranked_users(rank - window, rank + window)
+        elif rank is not None:
+            ranking.append((rank, user_id, score))
+    if not ranking:
+        return []
+    sql = text('''SELECT id, name, fullname, email_addr, info, created,
+               restrict FROM "user" WHERE id = ANY(:ids)
+               AND restrict=false;''')
+    ids = list(set(_id for _, _id, _ in ranking))
+    users = dict((row.id, row) for row in
+                 db.slave_session.execute(sql, dict(ids=ids)))
+    return [format_user(users[_id], rank=rank, score=score)
+            for rank, _id, score in ranking if _id in users]
+
+
+def format_user(user, rank=None, score=None):
     """Return an User object."""
     user = dict(
-        rank=user.rank,
+        rank=user.rank if rank is None else rank,
         id=user.id,
         name=user.name,
         fullname=user.fullname,
@@ -77,6 +92,6 @@ def format_user(user):
         info=user.info,
         created=user.created,
         restrict=user.restrict,
-        score=user.score)
+        score=user.score if score is None else score)
     tmp = u.to_public_json(data=user)
     return tmp
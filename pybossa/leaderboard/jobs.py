@@ -19,33 +19,30 @@
 from sqlalchemy import text
 from pybossa.core import db
 from pybossa.util import exists_materialized_view, refresh_materialized_view
+from pybossa.leaderboard.scores import rebuild_scores
 
 
 def leaderboard(info=None):
-    """Create or update leaderboard materialized view."""
-    materialized_view = 'users_rank'
-    materialized_view_idx = 'users_rank_idx'
-    if info:
-        materialized_view = 'users_rank_%s' % info
-        materialized_view_idx = 'users_rank_%s_idx' % info
+    """Create or update a leaderboard.
+
+    The default leaderboard lives in Redis and is only reconciled here with
+    the task runs. The info leaderboards use a materialized view.
+    """
+    if info is None:
+        n_users = rebuild_scores()
+        return "Leaderboard scores rebuilt for %s users" % n_users
+
+    materialized_view = 'users_rank_%s' % info
+    materialized_view_idx = 'users_rank_%s_idx' % info
 
     if exists_materialized_view(db, materialized_view):
         return refresh_materialized_view(db, materialized_view)
     else:
         sql = '''
                    CREATE MATERIALIZED VIEW {} AS WITH scores AS (
-                        SELECT "user".*, COUNT(task_run.user_id) AS score
-                        FROM "user" LEFT JOIN task_run
-                        ON task_run.user_id="user".id where
-                        "user".restrict=false GROUP BY "user".id
-                    ) SELECT *, row_number() OVER (ORDER BY score DESC) as rank FROM scores;
-              '''.format(materialized_view)
-        if info:
-            sql = '''
-                       CREATE MATERIALIZED VIEW {} AS WITH scores AS (
-                            SELECT "user".*, COALESCE(CAST("user".info->>'{}' AS INTEGER), 0) AS score
-                            FROM "user" where "user".restrict=false ORDER BY score DESC) SELECT *, row_number() OVER (ORDER BY score DESC) as rank FROM scores;
-                  '''.format(materialized_view, info)
+                        SELECT "user".*, COALESCE(CAST("user".info->>'{}' AS INTEGER), 0) AS score
+                        FROM "user" where "user".restrict=false ORDER BY score DESC) SELECT *, row_number() OVER (ORDER BY score DESC) as rank FROM scores;
+              '''.format(materialized_view, info)
         db.session.execute(sql)
         db.session.commit()
         sql = '''
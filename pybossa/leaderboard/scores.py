@@ -0,0 +1,114 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""Leaderboard scores kept in a Redis sorted set.
+
+Every contribution of a public user increments its score, so the default
+leaderboard is read with ZREVRANGE and ZREVRANK instead of ranking all the
+users in the DB. The set is periodically rebuilt from the task runs by the
+leaderboard job, which fixes any drift (deleted task runs, restricted users).
+Increments are also journaled in a side set, so the ones made while a
+rebuild reads the DB are merged into the rebuilt set instead of being lost.
+"""
+from sqlalchemy import text
+from pybossa.core import db, sentinel
+from pybossa.cache import settings
+
+SCORES_KEY = '%s:leaderboard_scores' % settings.REDIS_KEYPREFIX
+SCORES_BUILT_KEY = '%s:leaderboard_scores_built' % settings.REDIS_KEYPREFIX
+SCORES_JOURNAL_KEY = ('%s:leaderboard_scores_journal'
+                      % settings.REDIS_KEYPREFIX)
+CHUNK_SIZE = 1000
+
+
+def increment_user_score(user_id, amount=1):
+    """Add a new contribution to the score of a user."""
+    pipeline = sentinel.master.pipeline()
+    pipeline.zincrby(SCORES_KEY, user_id, amount)
+    pipeline.zincrby(SCORES_JOURNAL_KEY, user_id, amount)
+    pipeline.execute()
+
+
+def scores_built():
+    """Return True if the scores have been loaded from the DB."""
+    return bool(sentinel.slave.exists(SCORES_BUILT_KEY))
+
+
+def rebuild_scores():
+    """Load the scores of all the public users from the task runs.
+
+    The task runs are read from the master in a REPEATABLE READ
+    transaction. Its snapshot is taken before the journal is emptied, so
+    only the increments made after the snapshot are added on top of the
+    rebuilt scores.
+    """
+    sql = text('''SELECT "user".id, COUNT(task_run.id) AS score
+               FROM "user" LEFT JOIN task_run
+               ON task_run.user_id="user".id
+               WHERE "user".restrict=false GROUP BY "user".id;''')
+    tmp_key = '%s:rebuild' % SCORES_KEY
+    pipeline = sentinel.master.pipeline()
+    pipeline.delete(tmp_key)
+    n_users = 0
+    conn = db.engine.connect().execution_options(
+        isolation_level='REPEATABLE READ')
+    try:
+        with conn.begin():
+            # The first statement of the transaction takes its snapshot
+            conn.execute(text('SELECT 1;'))
+            sentinel.master.delete(SCORES_JOURNAL_KEY)
+            results = conn.execute(sql)
+            while True:
+                rows = results.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                members = []
+                for row in rows:
+                    members.extend([row.score, row.id])
+                pipeline.zadd(tmp_key, *members)
+                n_users += len(rows)
+    finally:
+        conn.close()
+    pipeline.zunionstore(SCORES_KEY, [tmp_key, SCORES_JOURNAL_KEY])
+    pipeline.delete(tmp_key, SCORES_JOURNAL_KEY)
+    pipeline.set(SCORES_BUILT_KEY, 1)
+    pipeline.execute()
+    return n_users
+
+
+def get_rank_and_score(user_id):
+    """Return the 1-based rank and the score of a user, or Nones if the
+    user has no score."""
+    pipeline = sentinel.slave.pipeline()
+    pipeline.zrevrank(SCORES_KEY, user_id)
+    pipeline.zscore(SCORES_KEY, user_id)
+    rank, score = pipeline.execute()
+    if rank is None:
+        return None, None
+    return rank + 1, int(score)
+
+
+def get_ranked_users(first_rank, last_rank):
+    """Return a list of (rank, user_id, score) between two 1-based ranks."""
+    first_rank = max(first_rank, 1)
+    if last_rank < first_rank:
+        return []
+    rows = sentinel.slave.zrevrange(SCORES_KEY, first_rank - 1,
+                                    last_rank - 1, withscores=True,
+                                    score_cast_func=int)
+    return [(rank, int(user_id), score)
+            for rank, (user_id, score) in enumerate(rows, first_rank)]
@@ -19,7 +19,10 @@
 import datetime
 import uuid
 
+from sqlalchemy import event, DDL, Index
 from sqlalchemy.orm import class_mapper
+from sqlalchemy.schema import Column, FetchedValue
+from sqlalchemy.types import TIMESTAMP
 
 import logging
 
@@ -29,9 +32,13 @@ log = logging.getLogger(__name__)
 
 class DomainObject(object):
 
-    def dictize(self):
+    def dictize(self, fields=None):
         out = {}
         for col in self.__table__.c:
+            if fields is not None and col.name not in fields:
+                continue
+            if col.info.get('timestamp_shadow'):
+                continue
             obj = getattr(self, col.name)
             if isinstance(obj, datetime.datetime):
                 obj = obj.isoformat()
@@ -95,6 +102,62 @@ def make_timestamp():
     return now.isoformat()
 
 
+TIMESTAMPTZ_FUNCTION = '''
+CREATE OR REPLACE FUNCTION iso_to_timestamptz(value TEXT)
+RETURNS TIMESTAMPTZ AS $$
+BEGIN
+    RETURN value::TIMESTAMP AT TIME ZONE 'UTC';
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql STABLE;'''
+
+
+def timestamp_shadow():
+    """Return a <column>_ts TIMESTAMPTZ column, filled by the trigger of
+    add_timestamp_shadows. It is left out of dictize."""
+    return Column(TIMESTAMP(timezone=True), server_default=FetchedValue(),
+                  server_onupdate=FetchedValue(),
+                  info=dict(timestamp_shadow=True))
+
+
+def timestamp_shadows_ddl(table, columns):
+    """Return the statements of the trigger that keeps the <column>_ts
+    TIMESTAMPTZ copies of the ISO text timestamp columns of a table in sync.
+
+    The migration that added the shadow columns has its own copy of them.
+    """
+    trigger = '%s_timestamps' % table
+    assignments = ' '.join('NEW.%s_ts := iso_to_timestamptz(NEW.%s);'
+                           % (column, column) for column in columns)
+    return [TIMESTAMPTZ_FUNCTION,
+            '''CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$
+            BEGIN %s RETURN NEW; END;
+            $$ LANGUAGE plpgsql;''' % (trigger, assignments),
+            '''CREATE TRIGGER %s BEFORE INSERT OR UPDATE OF %s
+            ON %s FOR EACH ROW EXECUTE PROCEDURE %s();'''
+            % (trigger, ', '.join(columns), table, trigger)]
+
+
+def timestamp_shadow_index_name(table, index):
+    return '%s_%s_idx' % (table, '_'.join(index))
+
+
+def add_timestamp_shadows(model, columns, indexes=()):
+    """Keep the timestamp shadow columns of a model in sync and index them.
+
+    The text columns stay the source of truth; a trigger fills the
+    <column>_ts copies so time windows can be queried with index range
+    scans instead of wrapping every row in TO_DATE().
+    """
+    table = model.__tablename__
+    for index in indexes:
+        Index(timestamp_shadow_index_name(table, index),
+              *[getattr(model, column) for column in index])
+    ddl = '\n'.join(timestamp_shadows_ddl(table, columns))
+    event.listen(model.__table__, 'after_create', DDL(ddl))
+
+
 def make_uuid():
     return str(uuid.uuid4())
 
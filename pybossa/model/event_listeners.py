@@ -19,7 +19,9 @@ from datetime import datetime
 from flask import current_app
 
 from rq import Queue
-from sqlalchemy import event
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.sql import text
 
 from flask import url_for
 
@@ -37,14 +39,39 @@ from pybossa.model.counter import Counter
 from pybossa.core import result_repo, db
 from pybossa.jobs import webhook, notify_blog_users
 from pybossa.jobs import push_notification
+from pybossa.jobs import sync_searchable_indexes, SEARCHABLE_INDEXES_TIMEOUT
 from pybossa.cache import projects as cached_projects
 
 from pybossa.core import sentinel
 from pybossa.sched import Schedulers
+from pybossa.traffic import mark_project_stats_dirty
+from pybossa.leaderboard.scores import increment_user_score
+from pybossa.cache.task_browse_helpers import update_task_info_keys
+from pybossa.cache.project_stats import reset_task_run_rollup
 
 webhook_queue = Queue('high', connection=sentinel.master)
 mail_queue = Queue('email', connection=sentinel.master)
 webpush_queue = Queue('webpush', connection=sentinel.master)
+task_queue = Queue('medium', connection=sentinel.master)
+
+AFTER_COMMIT = 'after_commit_callbacks'
+
+
+def call_after_commit(target, func, *args):
+    """Call func(*args) once the session holding target commits."""
+    session = object_session(target)
+    session.info.setdefault(AFTER_COMMIT, []).append((func, args))
+
+
+@event.listens_for(Session, 'after_commit')
+def run_after_commit_callbacks(session):
+    for func, args in session.info.pop(AFTER_COMMIT, []):
+        func(*args)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_after_commit_callbacks(session):
+    session.info.pop(AFTER_COMMIT, None)
 
 
 @event.listens_for(Blogpost, 'after_insert')
@@ -160,6 +187,8 @@ def add_user_contributed_to_feed(conn, user_id, project_obj):
             tmp['action_updated'] = 'UserContribution'
         if tmp:
             update_feed(tmp)
+            return True
+    return False
 
 
 def is_task_completed(conn, task_id, project_id):
@@ -228,6 +257,44 @@ def create_result(conn, project_id, task_id):
         return r.id
 
 
+def update_user_stats(conn, target):
+    """Add a new task run to the contribution counters of its user."""
+    if target.user_id is None:
+        return
+    sql_query = text('''
+        WITH project_stats AS (
+            INSERT INTO user_project_stats (user_id, project_id, n_answers,
+                                            last_submission_on)
+            VALUES (:user_id, :project_id, 1, :finish_time)
+            ON CONFLICT (user_id, project_id) DO UPDATE SET
+                n_answers = user_project_stats.n_answers + 1,
+                last_submission_on = GREATEST(
+                    user_project_stats.last_submission_on,
+                    EXCLUDED.last_submission_on)
+            RETURNING (xmax = 0) AS new_project)
+        INSERT INTO user_stats (user_id, n_answers, n_projects,
+                                first_submission_on, last_submission_on,
+                                total_time)
+        SELECT :user_id, 1, CASE WHEN new_project THEN 1 ELSE 0 END,
+               :finish_time, :finish_time,
+               COALESCE(EXTRACT(EPOCH FROM
+                                iso_to_timestamptz(:finish_time) -
+                                iso_to_timestamptz(:created)), 0)
+        FROM project_stats
+        ON CONFLICT (user_id) DO UPDATE SET
+            n_answers = user_stats.n_answers + 1,
+            n_projects = user_stats.n_projects + EXCLUDED.n_projects,
+            first_submission_on = LEAST(user_stats.first_submission_on,
+                                        EXCLUDED.first_submission_on),
+            last_submission_on = GREATEST(user_stats.last_submission_on,
+                                          EXCLUDED.last_submission_on),
+            total_time = user_stats.total_time + EXCLUDED.total_time;
+        ''')
+    conn.execute(sql_query, user_id=target.user_id,
+                 project_id=target.project_id,
+                 finish_time=target.finish_time, created=target.created)
+
+
 @event.listens_for(TaskRun, 'after_insert')
 def on_taskrun_submit(mapper, conn, target):
     """Update the task.state when n_answers condition is met."""
@@ -248,7 +315,10 @@ def on_taskrun_submit(mapper, conn, target):
     project_public.update(Project().to_public_json(tmp))
     project_public['action_updated'] = 'TaskCompleted'
 
-    add_user_contributed_to_feed(conn, target.user_id, project_public)
+    if add_user_contributed_to_feed(conn, target.user_id, project_public):
+        call_after_commit(target, increment_user_score, target.user_id)
+    update_user_stats(conn, target)
+    mark_project_stats_dirty(target.project_id)
     if is_task_completed(conn, target.task_id, target.project_id) and _published:
         update_task_state(conn, target.task_id)
         update_feed(project_public)
@@ -296,6 +366,32 @@ def create_zero_counter(mapper, conn, target):
     conn.execute(sql_query)
 
 
+@event.listens_for(Task, 'after_insert')
+def add_task_info_keys(mapper, conn, target):
+    """Count the info keys of a new task in the project catalog."""
+    update_task_info_keys(conn, target.project_id, target.info, 1)
+
+
+@event.listens_for(Task, 'before_update')
+def update_task_info_keys_on_update(mapper, conn, target):
+    """Move the catalog counts when the info of a task is replaced."""
+    if not inspect(target).attrs.info.history.has_changes():
+        return
+    # the previous value may have been expired, so it is read from the row
+    sql = text('SELECT project_id, info FROM task WHERE id = :id')
+    for row in conn.execute(sql, id=target.id):
+        update_task_info_keys(conn, row.project_id, row.info, -1)
+        update_task_info_keys(conn, row.project_id, target.info, 1)
+
+
+@event.listens_for(Task, 'before_delete')
+def remove_task_info_keys(mapper, conn, target):
+    """Uncount the info keys of a deleted task."""
+    sql = text('SELECT project_id, info FROM task WHERE id = :id')
+    for row in conn.execute(sql, id=target.id):
+        update_task_info_keys(conn, row.project_id, row.info, -1)
+
+
 @event.listens_for(Task, 'after_delete')
 def delete_task_counter(mapper, conn, target):
     sql_query = ("delete from counter where project_id=%s and task_id=%s"
@@ -311,9 +407,78 @@ def increase_task_counter(mapper, conn, target):
     conn.execute(sql_query)
 
 
+@event.listens_for(Task, 'after_delete')
+@event.listens_for(TaskRun, 'after_delete')
+def reset_rollup_on_delete(mapper, conn, target):
+    reset_task_run_rollup(conn, target.project_id)
+
+
 @event.listens_for(TaskRun, 'after_delete')
 def decrease_task_counter(mapper, conn, target):
     sql_query = ("insert into counter(created, project_id, task_id, n_task_runs) \
                  VALUES (TIMESTAMP '%s', %s, %s, -1)"
                  % (make_timestamp(), target.project_id, target.task_id))
     conn.execute(sql_query)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def decrease_user_stats(mapper, conn, target):
+    """Remove a deleted task run from the contribution counters of its user.
+
+    The first and last submissions are only looked up again when the
+    deleted task run was the one holding them.
+    """
+    if target.user_id is None:
+        return
+    params = dict(user_id=target.user_id, project_id=target.project_id,
+                  finish_time=target.finish_time, created=target.created)
+    sql_query = text('''
+        DELETE FROM user_project_stats
+        WHERE user_id=:user_id AND project_id=:project_id
+        AND n_answers <= 1;
+        ''')
+    left_project = conn.execute(sql_query, **params).rowcount > 0
+    if not left_project:
+        sql_query = text('''
+            UPDATE user_project_stats SET n_answers = n_answers - 1,
+                last_submission_on = CASE
+                    WHEN last_submission_on = :finish_time THEN
+                        (SELECT MAX(finish_time) FROM task_run
+                         WHERE user_id=:user_id AND project_id=:project_id)
+                    ELSE last_submission_on END
+            WHERE user_id=:user_id AND project_id=:project_id;
+            ''')
+        conn.execute(sql_query, **params)
+    sql_query = text('''
+        UPDATE user_stats SET n_answers = GREATEST(n_answers - 1, 0),
+            n_projects = GREATEST(n_projects - :left_project, 0),
+            total_time = GREATEST(total_time -
+                COALESCE(EXTRACT(EPOCH FROM
+                                 iso_to_timestamptz(:finish_time) -
+                                 iso_to_timestamptz(:created)), 0), 0),
+            first_submission_on = CASE
+                WHEN first_submission_on = :finish_time THEN
+                    (SELECT MIN(finish_time) FROM task_run
+                     WHERE user_id=:user_id)
+                ELSE first_submission_on END,
+            last_submission_on = CASE
+                WHEN last_submission_on = :finish_time THEN
+                    (SELECT MAX(finish_time) FROM task_run
+                     WHERE user_id=:user_id)
+                ELSE last_submission_on END
+        WHERE user_id=:user_id;
+        ''')
+    conn.execute(sql_query, left_project=int(left_project), **params)
+
+
+def enqueue_sync_searchable_indexes(project_id):
+    task_queue.enqueue_call(func=sync_searchable_indexes,
+                            args=(project_id,),
+                            timeout=SEARCHABLE_INDEXES_TIMEOUT)
+
+
+@event.listens_for(Project, 'after_delete')
+def drop_searchable_indexes(mapper, conn, target):
+    """Drop the searchable columns indexes of a deleted project."""
+    if (target.info or {}).get('searchable_columns'):
+        call_after_commit(target, enqueue_sync_searchable_indexes, target.id)
@@ -25,7 +25,8 @@ from flask import current_app
 
 from pybossa.core import db, signer
 from pybossa.contributions_guard import ContributionsGuard
-from pybossa.model import DomainObject, make_timestamp, make_uuid
+from pybossa.model import DomainObject, make_timestamp, make_uuid, \
+    add_timestamp_shadows, timestamp_shadow
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
 from pybossa.model.category import Category
@@ -44,6 +45,10 @@ class Project(db.Model, DomainObject):
     created = Column(Text, default=make_timestamp)
     #: UTC timestamp when the project is updated (or any of its relationships)
     updated = Column(Text, default=make_timestamp, onupdate=make_timestamp)
+    #: created as a TIMESTAMPTZ, filled by a trigger.
+    created_ts = timestamp_shadow()
+    #: updated as a TIMESTAMPTZ, filled by a trigger.
+    updated_ts = timestamp_shadow()
     #: Project name
     name = Column(Unicode(length=255), unique=True, nullable=False)
     #: Project slug for the URL
@@ -198,3 +203,5 @@ class Project(db.Model, DomainObject):
         return self.info.get('project_users', [])
 
 Index('project_owner_id_idx', Project.owner_id)
+add_timestamp_shadows(Project, ['created', 'updated'],
+                      indexes=[('created_ts',), ('updated_ts',)])
@@ -0,0 +1,33 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from sqlalchemy import Integer, Text
+from sqlalchemy.schema import Column
+from pybossa.core import db
+from pybossa.model import DomainObject
+
+
+class RollupWatermark(db.Model, DomainObject):
+    '''Highest source row ID already folded into an incremental rollup.'''
+
+    __tablename__ = 'rollup_watermark'
+
+    #: Name of the rollup, i.e. task_run_rollup:<project_id>
+    name = Column(Text, primary_key=True)
+    #: Last source row ID included in the rollup.
+    last_id = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,48 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from sqlalchemy import Integer, Float, Date
+from sqlalchemy.schema import Column, ForeignKey
+from pybossa.core import db
+from pybossa.model import DomainObject
+
+
+class SiteActivity(db.Model, DomainObject):
+    '''Daily activity of a user (or of the anonymous users) in a project,
+    used by the site statistics. Maintained incrementally from the task and
+    task_run tables.'''
+
+    __tablename__ = 'site_activity'
+
+    #: Day (UTC) of the activity.
+    day = Column(Date, primary_key=True)
+    #: Project.ID of the activity.
+    project_id = Column(Integer, ForeignKey('project.id', ondelete='CASCADE'),
+                        primary_key=True)
+    #: User.ID of the contributor, 0 for anonymous contributions and tasks.
+    user_id = Column(Integer, primary_key=True, default=0)
+    #: Number of task runs submitted this day.
+    n_task_runs = Column(Integer, default=0, nullable=False)
+    #: Seconds spent on the task runs submitted this day.
+    task_run_seconds = Column(Float, default=0, nullable=False)
+    #: Number of task runs with a valid created time.
+    n_timed_task_runs = Column(Integer, default=0, nullable=False)
+    #: Number of tasks created this day.
+    n_tasks_created = Column(Integer, default=0, nullable=False)
+    #: Number of completed tasks whose latest task run was this day.
+    n_completed_tasks = Column(Integer, default=0, nullable=False)
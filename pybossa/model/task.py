@@ -23,7 +23,8 @@ from sqlalchemy.orm import relationship, backref
 from sqlalchemy.dialects.postgresql import JSONB, ARRAY
 from sqlalchemy.ext.mutable import MutableList
 from pybossa.core import db
-from pybossa.model import DomainObject, make_timestamp
+from pybossa.model import DomainObject, make_timestamp, \
+    add_timestamp_shadows, timestamp_shadow
 from pybossa.model.task_run import TaskRun
 
 
@@ -38,6 +39,8 @@ class Task(db.Model, DomainObject):
     id = Column(Integer, primary_key=True)
     #: UTC timestamp when the task was created.
     created = Column(Text, default=make_timestamp)
+    #: created as a TIMESTAMPTZ, filled by a trigger.
+    created_ts = timestamp_shadow()
     #: Project.ID that this task is associated with.
     project_id = Column(Integer, ForeignKey('project.id', ondelete='CASCADE'), nullable=False)
     #: Task.state: ongoing or completed.
@@ -72,3 +75,8 @@ class Task(db.Model, DomainObject):
     )
 
 Index('task_project_id_idx', Task.project_id)
+# keyset pagination of the browse tasks view
+Index('task_project_id_priority_idx', Task.project_id, Task.priority_0, Task.id)
+Index('task_project_id_created_idx', Task.project_id, Task.created, Task.id)
+add_timestamp_shadows(Task, ['created'], indexes=[('created_ts',),
+                                                  ('project_id', 'created_ts')])
@@ -0,0 +1,44 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from sqlalchemy import Integer, Text
+from sqlalchemy.schema import Column, ForeignKey
+from pybossa.core import db
+from pybossa.model import DomainObject
+
+
+class TaskInfoKey(db.Model, DomainObject):
+    '''A key found in the info of the tasks of a project, with the number of
+    tasks holding it for each JSON type of its values. Maintained when tasks
+    are created, updated or deleted.'''
+
+    __tablename__ = 'task_info_key'
+
+    #: Project.ID of the tasks.
+    project_id = Column(Integer, ForeignKey('project.id', ondelete='CASCADE'),
+                        primary_key=True)
+    #: Key in task.info; keys of nested objects are joined with "__" to
+    #: the key of their parent, as in the CSV export headers.
+    path = Column(Text, primary_key=True)
+    #: JSON type of the values, as returned by jsonb_typeof.
+    json_type = Column(Text, primary_key=True)
+    #: Nesting level of the key, 0 for the keys of task.info itself.
+    depth = Column(Integer, default=0, nullable=False)
+    #: Number of tasks holding the key with a value of this type.
+    n_tasks = Column(Integer, default=0, nullable=False)
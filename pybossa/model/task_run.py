@@ -21,7 +21,8 @@ from sqlalchemy.schema import Column, ForeignKey
 from sqlalchemy.dialects.postgresql import JSONB
 
 from pybossa.core import db
-from pybossa.model import DomainObject, make_timestamp
+from pybossa.model import DomainObject, make_timestamp, \
+    add_timestamp_shadows, timestamp_shadow
 
 
 
@@ -34,6 +35,8 @@ class TaskRun(db.Model, DomainObject):
     id = Column(Integer, primary_key=True)
     #: UTC timestamp for when TaskRun is delivered to user.
     created = Column(Text, default=make_timestamp)
+    #: created as a TIMESTAMPTZ, filled by a trigger.
+    created_ts = timestamp_shadow()
     #: Project.id of the project associated with this TaskRun.
     project_id = Column(Integer, ForeignKey('project.id'), nullable=False)
     #: Task.id of the task associated with this TaskRun.
@@ -45,6 +48,8 @@ class TaskRun(db.Model, DomainObject):
     user_ip = Column(Text)
     #: UTC timestamp for when TaskRun is saved to DB.
     finish_time = Column(Text, default=make_timestamp)
+    #: finish_time as a TIMESTAMPTZ, filled by a trigger.
+    finish_time_ts = timestamp_shadow()
     timeout = Column(Integer)
     calibration = Column(Integer)
     #: External User ID
@@ -63,3 +68,6 @@ Index('task_run_task_id_idx', TaskRun.task_id)
 Index('task_run_user_id_idx', TaskRun.user_id)
 Index('task_run_project_id_idx', TaskRun.project_id)
 Index('unique_user_id_task_id_idx', TaskRun.task_id, TaskRun.user_id, TaskRun.user_ip, TaskRun.external_uid, unique=True)
+add_timestamp_shadows(TaskRun, ['created', 'finish_time'],
+                      indexes=[('finish_time_ts',),
+                               ('project_id', 'finish_time_ts')])
@@ -0,0 +1,44 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from sqlalchemy import Integer, Text
+from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.dialects.postgresql import TIMESTAMP
+from pybossa.core import db
+from pybossa.model import DomainObject
+
+
+class TaskRunRollup(db.Model, DomainObject):
+    '''Hourly number of contributions of a user (or anonymous IP) to a
+    project. Maintained incrementally from the task_run table.'''
+
+    __tablename__ = 'task_run_rollup'
+
+    #: Project.ID of the contributions.
+    project_id = Column(Integer, ForeignKey('project.id', ondelete='CASCADE'),
+                        primary_key=True)
+    #: Hour (truncated finish_time) of the contributions.
+    hour = Column(TIMESTAMP, primary_key=True)
+    #: User.ID of the contributor, 0 for anonymous contributions.
+    user_id = Column(Integer, primary_key=True, default=0)
+    #: Anonymized IP of the contributor, empty for authenticated users.
+    user_ip = Column(Text, primary_key=True, default=u'')
+    #: Number of task runs submitted in this hour.
+    n_task_runs = Column(Integer, default=0, nullable=False)
+    #: Number of tasks whose latest task run was submitted in this hour.
+    n_tasks = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,40 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from sqlalchemy import Integer, Text
+from sqlalchemy.schema import Column, ForeignKey
+from pybossa.core import db
+from pybossa.model import DomainObject
+
+
+class UserProjectStats(db.Model, DomainObject):
+    '''Contribution counters of a user in a project, maintained on each
+    submission together with the user_stats.'''
+
+    __tablename__ = 'user_project_stats'
+
+    #: User.ID of the contributor.
+    user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'),
+                     primary_key=True)
+    #: Project.ID of the contributions.
+    project_id = Column(Integer, ForeignKey('project.id', ondelete='CASCADE'),
+                        primary_key=True)
+    #: Number of task runs submitted to the project.
+    n_answers = Column(Integer, default=0, nullable=False)
+    #: finish_time of the last task run in the project.
+    last_submission_on = Column(Text)
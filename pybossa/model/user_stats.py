@@ -0,0 +1,43 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from sqlalchemy import Integer, Text, Float
+from sqlalchemy.schema import Column, ForeignKey
+from pybossa.core import db
+from pybossa.model import DomainObject
+
+
+class UserStats(db.Model, DomainObject):
+    '''Contribution counters of a user, maintained on each submission so
+    the user summaries do not need to aggregate the task_run table.'''
+
+    __tablename__ = 'user_stats'
+
+    #: User.ID of the contributor.
+    user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'),
+                     primary_key=True)
+    #: Number of task runs submitted.
+    n_answers = Column(Integer, default=0, nullable=False)
+    #: Number of projects contributed to.
+    n_projects = Column(Integer, default=0, nullable=False)
+    #: finish_time of the first task run.
+    first_submission_on = Column(Text)
+    #: finish_time of the last task run.
+    last_submission_on = Column(Text)
+    #: Seconds spent on all the task runs.
+    total_time = Column(Float, default=0, nullable=False)
@@ -42,10 +42,21 @@ import re
 from pybossa.model.project import Project, TaskRun, Task
 from pybossa.model.announcement import Announcement
 from pybossa.model.project_stats import ProjectStats
+from pybossa.model.task_run_rollup import TaskRunRollup
+from pybossa.model.rollup_watermark import RollupWatermark
+from pybossa.model.site_activity import SiteActivity
+from pybossa.model.user_stats import UserStats
+from pybossa.model.user_project_stats import UserProjectStats
+from pybossa.model.task_info_key import TaskInfoKey
 from sqlalchemy.sql import and_, or_
 from sqlalchemy import cast, Text, func, desc
 from sqlalchemy.types import TIMESTAMP
 from sqlalchemy.orm.base import _entity_descriptor
+from sqlalchemy.orm import load_only
+
+#: Rows fetched at a time from the server side cursor of yielded queries.
+YIELD_PER_BATCH = 500
+
 
 class Repository(object):
 
@@ -216,8 +227,14 @@ class Repository(object):
     def _filter_by(self, model, limit=None, offset=0, yielded=False,
                   last_id=None, fulltextsearch=None, desc=False,
                   orderby='id', **filters):
-        """Filter by using several arguments and ordering items."""
+        """Filter by using several arguments and ordering items.
+
+        A fields filter lists the only columns to load from the database.
+        """
+        fields = filters.pop('fields', None)
         query = self.create_context(filters, fulltextsearch, model)
+        if fields:
+            query = query.options(load_only(*fields))
         if last_id:
             query = query.filter(model.id > last_id)
             query = self._set_orderby_desc(query, model, limit,
@@ -226,8 +243,7 @@ class Repository(object):
             query = self._set_orderby_desc(query, model, limit,
                                            last_id, offset, desc, orderby)
         if yielded:
-            limit = limit or 1
-            return query.yield_per(limit)
+            return query.yield_per(min(limit or 1, YIELD_PER_BATCH))
         return query.all()
 
 
@@ -21,6 +21,7 @@ from sqlalchemy.exc import IntegrityError
 from pybossa.repositories import Repository
 from pybossa.model.helpingmaterial import HelpingMaterial
 from pybossa.exc import WrongObjectError, DBIntegrityError
+from pybossa.cache import bump_cache_group_generation
 
 
 class HelpingMaterialRepository(Repository):
@@ -41,6 +42,7 @@ class HelpingMaterialRepository(Repository):
         try:
             self.db.session.add(hm)
             self.db.session.commit()
+            bump_cache_group_generation(hm.project_id)
         except IntegrityError as e:
             self.db.session.rollback()
             raise DBIntegrityError(e)
@@ -50,6 +52,7 @@ class HelpingMaterialRepository(Repository):
         try:
             self.db.session.merge(hm)
             self.db.session.commit()
+            bump_cache_group_generation(hm.project_id)
         except IntegrityError as e:
             self.db.session.rollback()
             raise DBIntegrityError(e)
@@ -59,6 +62,7 @@ class HelpingMaterialRepository(Repository):
         blog = self.db.session.query(HelpingMaterial).filter(HelpingMaterial.id==hm.id).first()
         self.db.session.delete(blog)
         self.db.session.commit()
+        bump_cache_group_generation(blog.project_id)
 
     def _validate_can_be(self, action, hm):
         if not isinstance(hm, HelpingMaterial):
@@ -25,6 +25,7 @@ from pybossa.model.project import Project
 from pybossa.model.category import Category
 from pybossa.exc import WrongObjectError, DBIntegrityError
 from pybossa.cache import projects as cached_projects
+from pybossa.cache import bump_cache_group_generation
 from pybossa.core import uploader
 from werkzeug.exceptions import BadRequest
 
@@ -71,6 +72,7 @@ class ProjectRepository(Repository):
         try:
             self.db.session.merge(project)
             self.db.session.commit()
+            bump_cache_group_generation(project.id)
         except IntegrityError as e:
             self.db.session.rollback()
             raise DBIntegrityError(e)
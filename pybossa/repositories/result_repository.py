@@ -20,6 +20,7 @@ from sqlalchemy import cast, Date
 from pybossa.repositories import Repository
 from pybossa.model.result import Result
 from pybossa.exc import WrongObjectError, DBIntegrityError
+from pybossa.cache import bump_cache_group_generation
 from sqlalchemy import text
 
 
@@ -45,11 +46,20 @@ class ResultRepository(Repository):
                               fulltextsearch,
                               desc, **filters)
 
+    def get_last_versions_by_task_ids(self, task_ids):
+        if not task_ids:
+            return []
+        return self.db.session.query(Result)\
+                   .filter(Result.task_id.in_(task_ids),
+                           Result.last_version == True)\
+                   .order_by(Result.id).all()
+
     def save(self, result):
         self._validate_can_be('saved', result)
         try:
             self.db.session.add(result)
             self.db.session.commit()
+            bump_cache_group_generation(result.project_id)
         except IntegrityError as e:
             self.db.session.rollback()
             raise DBIntegrityError(e)
@@ -59,6 +69,7 @@ class ResultRepository(Repository):
         try:
             self.db.session.merge(result)
             self.db.session.commit()
+            bump_cache_group_generation(result.project_id)
         except IntegrityError as e:
             self.db.session.rollback()
             raise DBIntegrityError(e)
@@ -69,6 +80,7 @@ class ResultRepository(Repository):
                    ''')
         self.db.session.execute(sql, dict(project_id=project.id))
         self.db.session.commit()
+        bump_cache_group_generation(project.id)
 
 
     def _validate_can_be(self, action, result):
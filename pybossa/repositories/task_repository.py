@@ -19,16 +19,20 @@
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import cast, Date
 
-from pybossa.repositories import Repository
+from pybossa.repositories import Repository, YIELD_PER_BATCH
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
 from pybossa.model import make_timestamp
 from pybossa.model.user import User
 from pybossa.exc import WrongObjectError, DBIntegrityError
 from pybossa.cache import projects as cached_projects
+from pybossa.cache.project_stats import reset_task_run_rollup
+from pybossa.cache.users import rebuild_user_stats
 from pybossa.core import uploader
 from sqlalchemy import text
-from pybossa.cache.task_browse_helpers import get_task_filters
+from pybossa.cache.task_browse_helpers import (get_task_filters,
+                                               update_task_info_keys,
+                                               rebuild_task_info_keys)
 import json
 from datetime import datetime, timedelta
 from flask import current_app
@@ -57,6 +61,13 @@ class TaskRepository(Repository):
         return self._filter_by(Task, limit, offset, yielded, last_id,
                               fulltextsearch, desc, **filters)
 
+    def get_tasks_by_ids(self, task_ids):
+        if not task_ids:
+            return []
+        return self.db.session.query(Task)\
+                   .filter(Task.id.in_(task_ids))\
+                   .order_by(Task.id).all()
+
     def filter_completed_task_runs_by(self, limit=None, offset=0, yielded=False, **filters):
         # exported col is present in Task table
         # anything passed under filters will be
@@ -124,6 +135,13 @@ class TaskRepository(Repository):
         return self._filter_by(TaskRun, limit, offset, yielded, last_id,
                               fulltextsearch, desc, **filters)
 
+    def get_task_runs_by_task_ids(self, task_ids):
+        if not task_ids:
+            return []
+        return self.db.session.query(TaskRun)\
+                   .filter(TaskRun.task_id.in_(task_ids))\
+                   .order_by(TaskRun.id).all()
+
     def count_task_runs_with(self, **filters):
         query_args, _, _, _ = self.generate_query_from_keywords(TaskRun, **filters)
         return self.db.session.query(TaskRun).filter(*query_args).count()
@@ -140,8 +158,7 @@ class TaskRepository(Repository):
             else:
                 query = query.order_by(obj.id).limit(limit).offset(offset)
         if yielded:
-            limit = limit or 1
-            return query.yield_per(limit)
+            return query.yield_per(min(limit or 1, YIELD_PER_BATCH))
         return query.all()
 
 
@@ -178,13 +195,19 @@ class TaskRepository(Repository):
         self.db.session.execute(text('''
                    DELETE FROM result WHERE project_id=:project_id
                                       AND task_id=:task_id;'''), args)
-        self.db.session.execute(text('''
+        deleted = self.db.session.execute(text('''
                    DELETE FROM task_run WHERE project_id=:project_id
-                                        AND task_id=:task_id;'''), args)
-        self.db.session.execute(text('''
+                                        AND task_id=:task_id
+                                        RETURNING user_id;'''), args)
+        user_ids = set(row.user_id for row in deleted.fetchall())
+        deleted = self.db.session.execute(text('''
                    DELETE FROM task WHERE project_id=:project_id
-                                    AND id=:task_id;'''), args)
+                                    AND id=:task_id RETURNING info;'''), args)
+        for row in deleted.fetchall():
+            update_task_info_keys(self.db.session, project_id, row.info, -1)
+        reset_task_run_rollup(self.db.session, project_id)
         self.db.session.commit()
+        rebuild_user_stats(user_ids=user_ids)
         cached_projects.clean(project_id)
 
     def delete_valid_from_project(self, project, force_reset=False, filters=None):
@@ -234,6 +257,10 @@ class TaskRepository(Repository):
                 '''.format(sql_session_repl, conditions))
         self.db.bulkdel_session.execute(sql, dict(project_id=project.id, **params))
         self.db.bulkdel_session.commit()
+        reset_task_run_rollup(self.db.session, project.id)
+        self.db.session.commit()
+        rebuild_user_stats(project_id=project.id)
+        rebuild_task_info_keys(project.id)
         cached_projects.clean_project(project.id)
         self._delete_zip_files_from_store(project)
 
@@ -242,7 +269,9 @@ class TaskRepository(Repository):
                    DELETE FROM task_run WHERE project_id=:project_id;
                    ''')
         self.db.session.execute(sql, dict(project_id=project.id))
+        reset_task_run_rollup(self.db.session, project.id)
         self.db.session.commit()
+        rebuild_user_stats(project_id=project.id)
         cached_projects.clean_project(project.id)
         self._delete_zip_files_from_store(project)
 
@@ -294,7 +323,7 @@ class TaskRepository(Repository):
                    state='ongoing' WHERE project_id=:project_id AND
                    ((id IN (SELECT id from tasks_excl_file_urls)) OR
                    (id IN (SELECT id from tasks_with_file_urls) AND state='ongoing'
-                   AND TO_DATE(created, 'YYYY-MM-DD\THH24:MI:SS.US') >= NOW() - :task_expiration ::INTERVAL));'''
+                   AND created_ts >= NOW() - :task_expiration ::INTERVAL));'''
                    .format(conditions))
         self.db.session.execute(sql, dict(n_answers=n_answers,
                                           project_id=project.id,
@@ -460,7 +489,7 @@ class TaskRepository(Repository):
                    WHERE project_id=:project_id AND
                    ((id IN (SELECT id from tasks_excl_file_urls)) OR
                    (id IN (SELECT id from tasks_with_file_urls) AND state='ongoing'
-                   AND TO_DATE(created, 'YYYY-MM-DD\THH24:MI:SS.US') >= NOW() - :task_expiration ::INTERVAL));'''
+                   AND created_ts >= NOW() - :task_expiration ::INTERVAL));'''
                    .format(conditions))
         self.db.session.execute(sql, dict(n_answers=n_answers,
                                           project_id=project_id,
@@ -487,7 +516,7 @@ class TaskRepository(Repository):
                    AND jsonb_typeof(t.info) = 'object'
                    AND EXISTS(SELECT TRUE FROM jsonb_object_keys(t.info) AS key
                    WHERE key ILIKE '%\_\_upload\_url%')
-                   AND (t.state = 'completed' OR TO_DATE(created, 'YYYY-MM-DD\THH24:MI:SS.US') < NOW() - :task_expiration ::INTERVAL)
+                   AND (t.state = 'completed' OR created_ts < NOW() - :task_expiration ::INTERVAL)
                    AND n_answers != :n_answers;'''
                    .format(conditions))
         tasks = self.db.session.execute(sql,
@@ -0,0 +1,89 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""Module to keep track of the recent traffic and activity of projects in
+Redis."""
+from pybossa.core import sentinel
+from pybossa.cache import settings
+
+TRAFFIC_KEY = '%s:project_traffic' % settings.REDIS_KEYPREFIX
+STATS_DIRTY_KEY = '%s:project_stats_dirty' % settings.REDIS_KEYPREFIX
+STATS_REFRESHED_KEY = '%s:project_stats_refreshed:%%s' % settings.REDIS_KEYPREFIX
+
+
+def increment_project_traffic(project_id, amount=1):
+    """Add a page view or a new task request to the traffic of a project."""
+    sentinel.master.zincrby(TRAFFIC_KEY, project_id, amount)
+
+
+def get_project_traffic(project_ids):
+    """Return a dict with the traffic score of each project."""
+    pipeline = sentinel.slave.pipeline()
+    for project_id in project_ids:
+        pipeline.zscore(TRAFFIC_KEY, project_id)
+    scores = pipeline.execute()
+    return dict((project_id, score or 0)
+                for project_id, score in zip(project_ids, scores))
+
+
+def get_top_traffic_projects(n=20):
+    """Return the ids of the n projects with more recent traffic."""
+    return [int(project_id) for project_id in
+            sentinel.slave.zrevrange(TRAFFIC_KEY, 0, n - 1)]
+
+
+def decay_project_traffic(factor=0.5, min_score=1):
+    """Scale down the traffic scores so recent traffic weighs more, and
+    forget the projects whose score drops below min_score."""
+    pipeline = sentinel.master.pipeline()
+    pipeline.zunionstore(TRAFFIC_KEY, {TRAFFIC_KEY: factor})
+    pipeline.zremrangebyscore(TRAFFIC_KEY, '-inf', '(%s' % min_score)
+    pipeline.execute()
+
+
+def mark_project_stats_dirty(project_id):
+    """Flag the stats of a project as outdated after its tasks or task runs
+    change."""
+    sentinel.master.sadd(STATS_DIRTY_KEY, project_id)
+
+
+def claim_stats_refresh(project_ids, min_interval):
+    """Return the ids of the projects whose stats were not refreshed in the
+    last min_interval seconds, starting a new interval for them."""
+    pipeline = sentinel.master.pipeline()
+    for project_id in project_ids:
+        pipeline.set(STATS_REFRESHED_KEY % project_id, 1,
+                     ex=min_interval, nx=True)
+    claimed = pipeline.execute()
+    return [project_id for project_id, ok in zip(project_ids, claimed) if ok]
+
+
+def pop_dirty_projects(min_interval):
+    """Return the ids of the dirty projects whose stats can be refreshed.
+
+    Projects refreshed less than min_interval seconds ago stay dirty, so
+    they are picked up by a later run.
+    """
+    pipeline = sentinel.master.pipeline()
+    pipeline.smembers(STATS_DIRTY_KEY)
+    pipeline.delete(STATS_DIRTY_KEY)
+    project_ids = sorted(int(_id) for _id in pipeline.execute()[0])
+    ready = claim_stats_refresh(project_ids, min_interval)
+    postponed = set(project_ids) - set(ready)
+    if postponed:
+        sentinel.master.sadd(STATS_DIRTY_KEY, *postponed)
+    return ready
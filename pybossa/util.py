@@ -33,7 +33,7 @@ import dateutil.parser
 from functools import wraps
 from flask.ext.login import current_user
 from sqlalchemy import text
-from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.exc import ProgrammingError, OperationalError
 from math import ceil
 import json
 import base64
@@ -511,21 +511,15 @@ def get_user_id_or_ip():
 
 def with_cache_disabled(f):
     """Decorator that disables the cache for the execution of a function.
-    It enables it back when the function call is done.
+    It enables it back when the function call is done. Only the current
+    thread is affected.
     """
-    import os
+    from pybossa.cache import cache_disabled
 
     @wraps(f)
     def wrapper(*args, **kwargs):
-        env_cache_disabled = os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
-        if env_cache_disabled is None or env_cache_disabled is '0':
-            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = '1'
-        return_value = f(*args, **kwargs)
-        if env_cache_disabled is None:
-            del os.environ['PYBOSSA_REDIS_CACHE_DISABLED']
-        else:
-            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = env_cache_disabled
-        return return_value
+        with cache_disabled():
+            return f(*args, **kwargs)
     return wrapper
 
 
@@ -704,17 +698,33 @@ def exists_materialized_view(db, view):
 
 
 def refresh_materialized_view(db, view):
+    """Refresh a materialized view without blocking its readers.
+
+    A concurrent refresh needs a unique index on the view, so views created
+    without one fall back to a plain refresh. The duration is logged.
+    """
+    start = time.time()
     try:
         sql = text('REFRESH MATERIALIZED VIEW CONCURRENTLY %s' % view)
         db.session.execute(sql)
         db.session.commit()
-        return "Materialized view refreshed concurrently"
-    except ProgrammingError:
+        msg = "Materialized view refreshed concurrently"
+    except (ProgrammingError, OperationalError):
         sql = text('REFRESH MATERIALIZED VIEW %s' % view)
         db.session.rollback()
         db.session.execute(sql)
         db.session.commit()
-        return "Materialized view refreshed"
+        msg = "Materialized view refreshed"
+    current_app.logger.info('%s: %s in %.2fs', msg, view, time.time() - start)
+    return msg
+
+
+def create_unique_index(db, view, columns):
+    """Create the unique index a materialized view needs to be refreshed
+    concurrently."""
+    sql = text('CREATE UNIQUE INDEX IF NOT EXISTS %s_uniq_idx ON %s (%s)'
+               % (view, view, ', '.join(columns)))
+    db.session.execute(sql)
 
 
 def generate_invitation_email_for_new_user(user, project_slugs=None):
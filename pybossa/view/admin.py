@@ -26,7 +26,7 @@ from flask import flash
 from flask import redirect
 from flask import url_for
 from flask import current_app
-from flask import Response
+from flask import Response, stream_with_context
 from flask import Markup
 from flask.ext.login import login_required, current_user
 from flask.ext.babel import gettext
@@ -46,6 +46,7 @@ from pybossa.util import can_update_user_info, can_have_super_user_access
 from pybossa.cache import projects as cached_projects
 from pybossa.cache import categories as cached_cat
 from pybossa.cache import site_stats
+from pybossa.cache import get_cache_stats, flush_cache_stats
 from pybossa.cache import task_browse_helpers as helper
 from pybossa.auth import ensure_authorized_to
 from pybossa.core import announcement_repo, project_repo, user_repo, sentinel
@@ -188,14 +189,16 @@ def export_users():
 
     def respond_json():
         tmp = 'attachment; filename=all_users.json'
-        res = Response(gen_json(), mimetype='application/json')
+        res = Response(stream_with_context(gen_json()),
+                       mimetype='application/json')
         res.headers['Content-Disposition'] = tmp
         return res
 
     def gen_json():
-        users = get_users_for_report()
-        jdata = json.dumps(users)
-        return jdata
+        yield '['
+        for i, user in enumerate(get_users_for_report()):
+            yield (',' if i else '') + json.dumps(user)
+        yield ']'
 
     def dictize_with_exportable_attributes(user):
         dict_user = {}
@@ -207,16 +210,24 @@ def export_users():
         out = StringIO()
         writer = UnicodeWriter(out)
         tmp = 'attachment; filename=all_users.csv'
-        res = Response(gen_csv(out, writer, write_user), mimetype='text/csv')
+        res = Response(stream_with_context(gen_csv(out, writer, write_user)),
+                       mimetype='text/csv')
         res.headers['Content-Disposition'] = tmp
         return res
 
+    def flush(out):
+        data = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        return data
+
     def gen_csv(out, writer, write_user):
         add_headers(writer)
-        users = get_users_for_report()
-        for user in users:
+        for user in get_users_for_report():
             write_user(writer, user)
-        yield out.getvalue()
+            if out.tell() >= 64 * 1024:
+                yield flush(out)
+        yield flush(out)
 
     def write_user(writer, user):
         values = [user[attr] for attr in exportable_attributes]
@@ -592,6 +603,23 @@ def dashboard():
         return abort(500)
 
 
+@blueprint.route('/cache_stats/')
+@login_required
+@admin_required
+def cache_stats():
+    """Show hits, misses and timings of the cached functions."""
+    flush_cache_stats()
+    sort_by = request.args.get('sort_by', 'name')
+    stats = get_cache_stats()
+    if stats and sort_by in stats[0]:
+        stats.sort(key=lambda s: s[sort_by], reverse=sort_by != 'name')
+    response = dict(template='admin/cache_stats.html',
+                    title=gettext('Cache stats'),
+                    cache_stats=stats,
+                    sort_by=sort_by)
+    return handle_content_type(response)
+
+
 @blueprint.route('/management_dashboard/')
 @login_required
 @admin_required
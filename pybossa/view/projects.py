@@ -67,8 +67,10 @@ from pybossa.jobs import (webhook, send_mail,
                           import_tasks, IMPORT_TASKS_TIMEOUT,
                           delete_bulk_tasks, TASK_DELETE_TIMEOUT,
                           export_tasks, EXPORT_TASKS_TIMEOUT,
+                          sync_searchable_indexes, SEARCHABLE_INDEXES_TIMEOUT,
                           mail_project_report)
 from pybossa.forms.projects_view_forms import *
+from pybossa.forms.forms import SearchableColumnsForm
 from pybossa.forms.admin_view_forms import SearchForm
 from pybossa.importers import BulkImportException
 from pybossa.pro_features import ProFeatureHandler
@@ -81,6 +83,7 @@ from pybossa.default_settings import TIMEOUT
 from pybossa.forms.admin_view_forms import *
 from pybossa.cache.helpers import n_available_tasks, oldest_available_task, n_completed_tasks_by_user
 from pybossa.cache.helpers import n_available_tasks_for_user, latest_submission_task_date
+from pybossa.traffic import increment_project_traffic
 from pybossa.util import crossdomain
 from pybossa.error import ErrorStatus
 from pybossa.syncer import NotEnabled, SyncUnauthorized
@@ -711,6 +714,7 @@ def update(short_name):
 def details(short_name):
 
     project, owner, ps = project_by_shortname(short_name)
+    increment_project_traffic(project.id)
     num_available_tasks = n_available_tasks(project.id, current_user.id)
     num_completed_tasks_by_user = n_completed_tasks_by_user(project.id, current_user.id)
     oldest_task = oldest_available_task(project.id, current_user.id)
@@ -1238,6 +1242,13 @@ def tasks_browse(short_name, page=1, records_per_page=10):
 
     try:
         args = parse_tasks_browse_args(request.args)
+        # only keys found in the info of some task can be filtered on
+        unknown_columns = [name for name, _, _ in
+                           args.get('filter_by_field', [])
+                           if name not in columns]
+        if unknown_columns:
+            raise ValueError('unknown filter columns: {}'
+                             .format(unknown_columns))
     except (ValueError, TypeError) as err:
         current_app.logger.exception(err)
         flash(gettext('Invalid filtering criteria'), 'error')
@@ -1255,7 +1266,16 @@ def tasks_browse(short_name, page=1, records_per_page=10):
         (count, page_tasks) = cached_projects.browse_tasks(project.get('id'), args)
         current_app.logger.debug("Browse Tasks data loading took %s seconds"
                                  % (time.time()-start_time))
+        # the cursor of the last row lets the next page seek past it
+        # instead of skipping over all the previous rows
+        next_cursor = None
+        if len(page_tasks) == per_page:
+            next_cursor = page_tasks[-1].get('cursor')
         first_task_id = cached_projects.first_task_id(project.get('id'))
+        count_is_exact = True
+        if page_tasks:
+            count_is_exact = cached_projects.browse_tasks_count(
+                project.get('id'), args)[1]
 
         pagination = Pagination(page, per_page, count)
 
@@ -1273,8 +1293,10 @@ def tasks_browse(short_name, page=1, records_per_page=10):
         if args.get("pcomplete_to"):
             args["pcomplete_to"] = args["pcomplete_to"] * 100
         args["order_by"] = args.pop("order_by_dict", dict())
+        args.pop("order_by_fields", None)
         args.pop("records_per_page", None)
         args.pop("offset", None)
+        args.pop("cursor", None)
 
         if disp_info_columns:
             for task in page_tasks:
@@ -1294,6 +1316,8 @@ def tasks_browse(short_name, page=1, records_per_page=10):
                     tasks=page_tasks,
                     title=title,
                     pagination=pagination,
+                    next_cursor=next_cursor,
+                    count_is_exact=count_is_exact,
                     n_tasks=ps.n_tasks,
                     overall_progress=ps.overall_progress,
                     n_volunteers=ps.n_volunteers,
@@ -2105,6 +2129,63 @@ def task_timeout(short_name):
                                pro_features=pro)
 
 
+@blueprint.route('/<short_name>/tasks/searchable-columns',
+                 methods=['GET', 'POST'])
+@login_required
+@admin_or_subadmin_required
+def searchable_columns(short_name):
+    """Choose the task info fields that get an index for filtering."""
+    project, owner, ps = project_by_shortname(short_name)
+
+    title = project_title(project, gettext('Searchable Columns'))
+    form = SearchableColumnsForm(request.body)
+    pro = pro_features()
+    current_columns = project.info.get('searchable_columns', [])
+    form.columns.choices = [(column, column) for column in
+                            sorted(set(get_searchable_columns(project.id)) |
+                                   set(current_columns))]
+
+    def respond():
+        project_sanitized, owner_sanitized = sanitize_project_owner(project,
+                                                                    owner,
+                                                                    current_user,
+                                                                    ps)
+        response = dict(template='/projects/searchable_columns.html',
+                        title=title,
+                        form=form,
+                        project=project_sanitized,
+                        owner=owner_sanitized,
+                        pro_features=pro)
+        return handle_content_type(response)
+    ensure_authorized_to('read', project)
+    ensure_authorized_to('update', project)
+
+    if request.method == 'GET':
+        form.columns.data = current_columns
+        return respond()
+
+    if request.method == 'POST' and form.validate():
+        project = project_repo.get_by_shortname(short_name=project.short_name)
+        columns = sorted(set(form.columns.data or []))
+        if columns != current_columns:
+            project.info['searchable_columns'] = columns
+            project_repo.save(project)
+            auditlogger.log_event(project, current_user, 'update',
+                                  'searchable_columns',
+                                  current_columns, columns)
+            # indexes are built concurrently, which can take a while
+            task_queue.enqueue_call(func=sync_searchable_indexes,
+                                    args=(project.id,),
+                                    timeout=SEARCHABLE_INDEXES_TIMEOUT)
+        msg = gettext("Project searchable columns updated!")
+        flash(msg, 'success')
+
+        return redirect_content_type(url_for('.tasks', short_name=project.short_name))
+    else:
+        flash(gettext('Please correct the errors'), 'error')
+        return respond()
+
+
 @blueprint.route('/<short_name>/blog')
 def show_blogposts(short_name):
     project, owner, ps = project_by_shortname(short_name)
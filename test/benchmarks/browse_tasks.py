@@ -0,0 +1,125 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""Time a 100 records page of the browse tasks view.
+
+browse_tasks, which formats the dates and the completion in its query, is
+compared with the previous version, which parsed and converted them in
+Python for every row. Nothing is asserted. It rebuilds the test database,
+so run it from the repository root with the test settings and the cache
+disabled::
+
+    PYBOSSA_SETTINGS=settings_test.py PYBOSSA_REDIS_CACHE_DISABLED=1 \\
+        python test/benchmarks/browse_tasks.py [n_tasks] [repeat]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy.sql import text
+from default import Test, db
+from factories import ProjectFactory
+from pybossa.cache import projects as cached_projects
+from pybossa.util import convert_utc_to_est
+
+RECORDS_PER_PAGE = 100
+
+
+def previous_browse_tasks(project_id, args):
+    """browse_tasks as it was before the query formatted the rows, for the
+    default sort order and without filters."""
+    sql = text('''
+               SELECT task.id,
+               coalesce(ct, 0) as n_task_runs, task.n_answers, ft,
+               priority_0, task.created
+               FROM task LEFT OUTER JOIN
+               (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
+               MAX(finish_time) as ft FROM task_run
+               WHERE project_id=:project_id GROUP BY task_id) AS log_counts
+               ON task.id=log_counts.task_id
+               WHERE task.project_id=:project_id
+               ORDER BY task.id ASC LIMIT :limit OFFSET :offset''')
+    results = cached_projects.session.execute(
+        sql, dict(project_id=project_id, limit=args['records_per_page'],
+                  offset=args.get('offset') or 0))
+
+    def format_date(date):
+        if date is not None:
+            return convert_utc_to_est(date).strftime('%m-%d-%y %H:%M')
+
+    def pct_status(n_task_runs, n_answers):
+        if n_answers != 0 and n_answers is not None:
+            if n_task_runs > n_answers:
+                return float(1)
+            return float(n_task_runs) / n_answers
+        return float(0)
+
+    tasks = []
+    for row in results:
+        tasks.append(dict(id=row.id, n_task_runs=row.n_task_runs,
+                          n_answers=row.n_answers, priority_0=row.priority_0,
+                          finish_time=format_date(row.ft),
+                          created=format_date(row.created),
+                          pct_status=pct_status(row.n_task_runs,
+                                                row.n_answers)))
+    total_count = cached_projects.browse_tasks_count(project_id, args)[0]
+    return total_count, tasks
+
+
+def load_project(n_tasks):
+    """Create a project with n_tasks tasks, two task runs each."""
+    project = ProjectFactory.create()
+    db.session.execute(text('''
+        INSERT INTO task (created, project_id, state, n_answers, quorum,
+                          calibration, priority_0, info)
+        SELECT to_char(NOW() - i * INTERVAL '1 minute',
+                       'YYYY-MM-DD"T"HH24:MI:SS.US'),
+               :project_id, 'ongoing', 3, 0, 0, 0, '{}'
+        FROM generate_series(1, :n_tasks) AS i;
+        INSERT INTO task_run (created, finish_time, project_id, task_id,
+                              user_ip, info)
+        SELECT task.created, task.created, :project_id, task.id,
+               '10.0.0.' || ip, '{}'
+        FROM task, generate_series(1, 2) AS ip
+        WHERE task.project_id = :project_id;'''),
+        dict(project_id=project.id, n_tasks=n_tasks))
+    db.session.commit()
+    return project.id
+
+
+def main(n_tasks=10000, repeat=20):
+    bench = Test()
+    bench.setUp()
+    try:
+        with bench.flask_app.app_context():
+            project_id = load_project(n_tasks)
+            args = dict(records_per_page=RECORDS_PER_PAGE, offset=0)
+            print '%-24s %10s' % ('', 'ms')
+            for name, func in [('previous browse_tasks',
+                                previous_browse_tasks),
+                               ('browse_tasks', cached_projects.browse_tasks)]:
+                best = min(timeit.repeat(lambda: func(project_id, args),
+                                         number=1, repeat=repeat))
+                print '%-24s %10.2f' % (name, best * 1000)
+    finally:
+        bench.tearDown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,71 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""Time the project stats formatters against the loops they replaced.
+
+Both are run on a year of hourly answers, the fixture the formatting
+tests compare them on. Nothing is asserted. Run it from the repository
+root with the test settings and the cache disabled::
+
+    PYBOSSA_SETTINGS=settings_test.py PYBOSSA_REDIS_CACHE_DISABLED=1 \\
+        python test/benchmarks/stats_format.py [repeat]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from default import flask_app
+from test_stats import (year_of_hourly_data, _previous_fill_empty_days,
+                        _previous_format_dates, _previous_format_hours)
+import pybossa.cache.project_stats as stats
+
+
+def main(repeat=20):
+    (dates, dates_anon, dates_auth,
+     hours, hours_anon, hours_auth) = year_of_hourly_data()
+    max_hours = max(hours.values())
+    max_hours_anon = max(hours_anon.values())
+    max_hours_auth = max(hours_auth.values())
+    filled = _previous_fill_empty_days('2 year', dict(dates))
+
+    cases = [
+        ('fill_empty_days',
+         lambda: _previous_fill_empty_days('2 year', dict(dates)),
+         lambda: stats._fill_empty_days('2 year', dict(dates))),
+        ('format_dates',
+         lambda: _previous_format_dates(filled, dates_anon, dates_auth),
+         lambda: stats.stats_format_dates(1, filled, dates_anon,
+                                          dates_auth)),
+        ('format_hours',
+         lambda: _previous_format_hours(hours, hours_anon, hours_auth,
+                                        max_hours),
+         lambda: stats.stats_format_hours(1, hours, hours_anon, hours_auth,
+                                          max_hours, max_hours_anon,
+                                          max_hours_auth))]
+
+    print '%-16s %12s %12s' % ('', 'previous ms', 'current ms')
+    with flask_app.app_context():
+        for name, previous, current in cases:
+            times = [min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+                     for func in (previous, current)]
+            print '%-16s %12.2f %12.2f' % (name, times[0], times[1])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
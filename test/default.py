@@ -71,7 +71,8 @@ def delete_indexes():
 def delete_materialized_views():
     """Delete materialized views."""
     sql = text('''SELECT relname
-               FROM pg_class WHERE relname LIKE '%dashboard%';''')
+               FROM pg_class WHERE relname LIKE '%dashboard%'
+               AND relkind = 'm';''')
     results = db.session.execute(sql)
     for row in results:
         sql = 'drop materialized view if exists %s cascade' % row.relname
@@ -1234,6 +1234,39 @@ class TestAdmin(web.Helper):
             assert key in data.keys(), data
 
 
+    @with_context
+    def test_admin_cache_stats_auth_user_json(self):
+        """Test ADMIN JSON cache stats requires admin"""
+        url = '/admin/cache_stats/'
+        self.register()
+        self.signout()
+        self.register(fullname="juan", name="juan")
+        self.signin(email="juan@example.com")
+        res = self.app_get_json(url)
+        err_msg = "It should return 403"
+        assert res.status_code == 403, err_msg
+
+    @with_context
+    @patch('pybossa.view.admin.flush_cache_stats')
+    @patch('pybossa.view.admin.get_cache_stats')
+    def test_admin_cache_stats_admin_user_json(self, get_cache_stats, flush):
+        """Test ADMIN JSON cache stats returns the stats sorted"""
+        get_cache_stats.return_value = [
+            dict(name='a', hits=1, misses=3, hit_ratio=0.25, avg_time=0.1,
+                 avg_bytes=10),
+            dict(name='b', hits=3, misses=1, hit_ratio=0.75, avg_time=0.3,
+                 avg_bytes=20)]
+        url = '/admin/cache_stats/?sort_by=avg_time'
+        self.register()
+        self.signin()
+        res = self.app_get_json(url)
+        data = json.loads(res.data)
+        assert res.status_code == 200, res.status_code
+        assert flush.called
+        names = [stat['name'] for stat in data['cache_stats']]
+        assert names == ['b', 'a'], names
+        assert data['sort_by'] == 'avg_time', data
+
     @with_context
     def test_admin_dashboard_admin_user_data(self):
         """Test ADMIN dashboard admins can access it with data"""
@@ -861,6 +861,29 @@ class TestProjectAPI(TestAPI):
         error_msg = "Number of done tasks is wrong: %s" % len(taskruns)
         assert len(taskruns) + 1 == data['done'], error_msg
 
+    @with_context
+    def test_user_progress_etag(self):
+        """Test API userprogress answers If-None-Match until the project changes"""
+        user = UserFactory.create()
+        project = ProjectFactory.create(owner=user)
+        tasks = TaskFactory.create_batch(2, project=project)
+
+        url = '/api/project/%s/userprogress?api_key=%s' % (project.id, user.api_key)
+        res = self.app.get(url)
+        etag = res.headers.get('ETag')
+        assert res.status_code == 200, res.status_code
+        assert etag, res.headers
+
+        res = self.app.get(url, headers={'If-None-Match': etag})
+        assert res.status_code == 304, res.status_code
+        assert res.data == '', res.data
+
+        TaskRunFactory.create(task=tasks[0], user=user)
+        res = self.app.get(url, headers={'If-None-Match': etag})
+        assert res.status_code == 200, res.status_code
+        assert json.loads(res.data)['done'] == 1, res.data
+        assert res.headers.get('ETag') != etag
+
     @with_context
     def test_user_progress_authenticated_user(self):
         """Test API userprogress as an authenticated user works"""
@@ -407,6 +407,32 @@ class TestResultAPI(TestAPI):
         assert err['exception_cls'] == 'TypeError', err
 
 
+    @with_context
+    def test_result_query_etag_changes_on_update(self):
+        """Test API result query ETag changes when a result is updated"""
+        user = UserFactory.create()
+        make_subadmin(user)
+        result = self.create_result(owner=user)
+        url = '/api/result?project_id=%s&api_key=%s' % (result.project_id,
+                                                        user.api_key)
+        res = self.app.get(url)
+        etag = res.headers.get('ETag')
+        assert etag, res.headers
+        res = self.app.get(url, headers={'If-None-Match': etag})
+        assert res.status_code == 304, res.status_code
+
+        data = dict(info=dict(foo='bar'))
+        res = self.app.put('/api/result/%s?api_key=%s' % (result.id,
+                                                          user.api_key),
+                           data=json.dumps(data))
+        assert_equal(res.status, '200 OK', res.data)
+
+        res = self.app.get(url, headers={'If-None-Match': etag})
+        assert res.status_code == 200, res.status_code
+        assert res.headers.get('ETag') != etag, res.headers
+        assert json.loads(res.data)[0]['info'] == data['info'], res.data
+
+
     @with_context
     def test_result_delete(self):
         """Test API result delete"""
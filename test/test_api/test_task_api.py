@@ -29,6 +29,9 @@ from pybossa.repositories import ProjectRepository
 from pybossa.repositories import TaskRepository
 from pybossa.repositories import ResultRepository
 from pybossa.model.counter import Counter
+from pybossa.cache.projects import get_projects_data
+from pybossa.api.task import TaskAPI
+from sqlalchemy.orm import load_only
 
 project_repo = ProjectRepository(db)
 task_repo = TaskRepository(db)
@@ -100,6 +103,39 @@ class TestTaskAPI(TestAPI):
         err_msg = 'This task should not be in the list as the user participated.'
         assert task_orig.id not in task_ids, err_msg
 
+    @with_context
+    @patch('pybossa.api.task.TaskAPI._verify_auth')
+    def test_task_query_ndjson(self, auth):
+        """Test API Task query streams newline delimited JSON."""
+        auth.return_value = True
+        user = UserFactory.create()
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(150, project=project)
+        headers = {'Accept': 'application/x-ndjson'}
+
+        url = '/api/task?all=1&project_id=%s&api_key=%s' % (project.id,
+                                                           user.api_key)
+        res = self.app.get(url, headers=headers)
+        assert res.status_code == 200, res.status_code
+        assert res.mimetype == 'application/x-ndjson', res.mimetype
+        lines = res.data.splitlines()
+        assert len(lines) == 150, len(lines)
+        data = [json.loads(line) for line in lines]
+        assert [t['id'] for t in data] == [t.id for t in tasks]
+
+        # limit is not capped at 100, last_id pages through the rest
+        res = self.app.get(url + '&limit=120', headers=headers)
+        data = [json.loads(line) for line in res.data.splitlines()]
+        assert len(data) == 120, len(data)
+        res = self.app.get(url + '&limit=120&last_id=%s' % data[-1]['id'],
+                           headers=headers)
+        data = [json.loads(line) for line in res.data.splitlines()]
+        assert [t['id'] for t in data] == [t.id for t in tasks[120:]]
+
+        # plain JSON keeps the old limit
+        res = self.app.get(url + '&limit=120')
+        assert len(json.loads(res.data)) == 100
+
     @with_context
     @patch('pybossa.api.task.TaskAPI._verify_auth')
     def test_task_query_participated_user_ip(self, auth):
@@ -438,6 +474,129 @@ class TestTaskAPI(TestAPI):
         assert len(task['task_runs']) == len(taskruns), task
         assert task['result'] == None, task
 
+    @with_context
+    def test_task_query_related_prefetch(self):
+        """Test API Task query loads related objects once per page."""
+        from pybossa.api.api_base import task_repo as api_task_repo
+        from pybossa.api.api_base import result_repo as api_result_repo
+        user = UserFactory.create()
+        project = ProjectFactory.create(owner=user)
+        tasks = TaskFactory.create_batch(3, project=project, n_answers=2)
+        for task in tasks[:2]:
+            TaskRunFactory.create_batch(2, project=project, task=task)
+
+        get_runs = api_task_repo.get_task_runs_by_task_ids
+        get_results = api_result_repo.get_last_versions_by_task_ids
+        with patch.object(api_task_repo, 'get_task_runs_by_task_ids',
+                          wraps=get_runs) as runs_mock, \
+                patch.object(api_result_repo, 'get_last_versions_by_task_ids',
+                             wraps=get_results) as results_mock:
+            url = '/api/task?project_id=%s&related=True&api_key=%s'
+            res = self.app.get(url % (project.id, user.api_key))
+            assert runs_mock.call_count == 1, runs_mock.call_count
+            assert results_mock.call_count == 1, results_mock.call_count
+
+        data = {t['id']: t for t in json.loads(res.data)}
+        assert len(data) == 3, data
+        for task in tasks[:2]:
+            task_runs = data[task.id]['task_runs']
+            assert len(task_runs) == 2, task_runs
+            assert all(tr['task_id'] == task.id for tr in task_runs)
+            assert data[task.id]['result']['task_id'] == task.id
+        assert data[tasks[2].id]['task_runs'] == []
+        assert data[tasks[2].id]['result'] is None
+
+    @with_context
+    def test_task_query_resolves_project_access_once_per_page(self):
+        """Test API Task query checks each project once for a page."""
+        user = UserFactory.create()
+        projects = ProjectFactory.create_batch(2)
+        for project in projects:
+            TaskFactory.create_batch(5, project=project)
+
+        with patch('pybossa.api.task.get_projects_data',
+                   wraps=get_projects_data) as projects_data:
+            url = '/api/task?all=1&limit=100&api_key=%s' % user.api_key
+            res = self.app.get(url)
+            assert projects_data.call_count == 1, projects_data.call_count
+        assert len(json.loads(res.data)) == 10, res.data
+
+    @with_context
+    def test_task_query_etag(self):
+        """Test API Task query for one project honours If-None-Match."""
+        user = UserFactory.create()
+        project = ProjectFactory.create(owner=user)
+        TaskFactory.create_batch(2, project=project)
+        url = '/api/task?project_id=%s&api_key=%s' % (project.id, user.api_key)
+
+        res = self.app.get(url)
+        etag = res.headers.get('ETag')
+        assert etag, res.headers
+
+        with patch.object(TaskAPI, '_db_query') as db_query:
+            res = self.app.get(url, headers={'If-None-Match': etag})
+            assert res.status_code == 304, res.status_code
+            assert not db_query.called
+
+        TaskFactory.create(project=project)
+        res = self.app.get(url, headers={'If-None-Match': etag})
+        assert res.status_code == 200, res.status_code
+        assert len(json.loads(res.data)) == 3, res.data
+
+        # Listings not scoped to a project have no ETag
+        res = self.app.get('/api/task?api_key=%s' % user.api_key)
+        assert 'ETag' not in res.headers, res.headers
+
+    @with_context
+    def test_task_query_fields(self):
+        """Test API Task query returns only the requested fields."""
+        user = UserFactory.create()
+        project = ProjectFactory.create(owner=user)
+        TaskFactory.create_batch(3, project=project, info={'big': 'x' * 1000})
+        url = '/api/task?project_id=%s&api_key=%s' % (project.id, user.api_key)
+
+        res = self.app.get(url + '&fields=id,state,n_answers')
+        data = json.loads(res.data)
+        assert len(data) == 3, data
+        for task in data:
+            assert sorted(task.keys()) == ['id', 'link', 'links', 'n_answers',
+                                           'state'], task
+
+        with patch('pybossa.repositories.load_only',
+                   wraps=load_only) as load_only_mock:
+            res = self.app.get(url + '&fields=state')
+            assert res.status_code == 200, res.status_code
+            columns = load_only_mock.call_args[0]
+            assert 'info' not in columns, columns
+            assert 'state' in columns and 'project_id' in columns, columns
+
+        res = self.app.get(url + '&fields=id,wrong')
+        assert res.status_code == 415, res.status_code
+        assert json.loads(res.data)['exception_cls'] == 'AttributeError'
+
+    @with_context
+    def test_task_get_fields(self):
+        """Test API Task get by id returns only the requested fields."""
+        user = UserFactory.create()
+        project = ProjectFactory.create(owner=user)
+        task = TaskFactory.create(project=project)
+        url = '/api/task/%s?api_key=%s&fields=id,state' % (task.id,
+                                                            user.api_key)
+
+        res = self.app.get(url)
+        assert res.status_code == 200, res.data
+        data = json.loads(res.data)
+        assert data['id'] == task.id, data
+        assert data['state'] == task.state, data
+        assert 'project_id' not in data and 'info' not in data, data
+
+        with patch.dict(self.flask_app.config, {'ENABLE_ENCRYPTION': True}):
+            res = self.app.get(url)
+        data = json.loads(res.data)
+        assert res.status_code == 200, res.data
+        assert 'signature' in data, data
+        assert 'project_id' not in data, data
+
     @with_context
     def test_task_query_without_params_with_context(self):
         """ Test API Task query with context"""
@@ -16,9 +16,9 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 
-from default import assert_not_raises
+from default import assert_not_raises, with_context
 from mock import Mock, patch, PropertyMock
-from pybossa.auth import ensure_authorized_to, is_authorized
+from pybossa.auth import ensure_authorized_to, is_authorized, _authorizer_for
 from nose.tools import assert_raises
 from werkzeug.exceptions import Forbidden, Unauthorized
 from pybossa.model.user import User
@@ -120,3 +120,10 @@ class TestAuthorizationFunctions(object):
 
         auth_factory.assert_called_with('token')
         authorizer.can.assert_called_with(user, 'read', 'token')
+
+    @with_context
+    def test_authorizer_for_is_cached_in_context(self):
+        authorizer = _authorizer_for('task')
+
+        assert _authorizer_for('task') is authorizer
+        assert _authorizer_for('taskrun') is not authorizer
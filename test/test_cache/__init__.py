@@ -21,7 +21,10 @@ from mock import patch
 from pybossa.cache import (get_key_to_hash, get_hash_key, cache, memoize,
                            delete_cached, delete_memoized, memoize_essentials,
                            delete_memoized_essential, delete_cache_group,
-                           get_cache_group_key)
+                           get_cache_group_key, serialize, deserialize,
+                           SERIALIZER_MAGIC, get_cache_stats,
+                           flush_cache_stats, reset_cache_stats,
+                           cache_disabled)
 from pybossa.sentinel import Sentinel
 import settings_test
 
@@ -65,6 +68,46 @@ class TestCacheHashFunctions(object):
 
 
 
+class TestCacheSerializer(object):
+
+    def test_serialize_adds_versioned_header(self):
+        """Test CACHE serialize prefixes values with a versioned header."""
+        data = serialize({'a': 1})
+        assert data.startswith(SERIALIZER_MAGIC + '1p-'), data
+
+    def test_serialize_round_trip(self):
+        """Test CACHE deserialize returns the serialized value."""
+        value = [{'id': 1, 'name': u'ñ'}, (1, 2), None]
+        assert deserialize(serialize(value)) == value
+
+    @patch('pybossa.cache.settings')
+    def test_serialize_compresses_big_values(self, settings):
+        """Test CACHE serialize compresses values over the threshold."""
+        settings.CACHE_SERIALIZER = 'pickle'
+        settings.CACHE_COMPRESSION_THRESHOLD = 100
+        settings.CACHE_COMPRESSION_LEVEL = 6
+        value = ['a' * 10] * 1000
+        data = serialize(value)
+        assert data.startswith(SERIALIZER_MAGIC + '1pz'), data[:10]
+        assert len(data) < len(serialize(['a' * 10])) * 100
+        assert deserialize(data) == value
+
+    @patch('pybossa.cache.settings')
+    def test_serialize_no_compression(self, settings):
+        """Test CACHE serialize does not compress if threshold is None."""
+        settings.CACHE_SERIALIZER = 'pickle'
+        settings.CACHE_COMPRESSION_THRESHOLD = None
+        data = serialize(['a' * 10] * 1000)
+        assert data.startswith(SERIALIZER_MAGIC + '1p-'), data[:10]
+
+    def test_deserialize_legacy_pickle(self):
+        """Test CACHE deserialize loads values stored without header."""
+        import cPickle
+        value = {'n_tasks': 10}
+        assert deserialize(cPickle.dumps(value)) == value
+
+
+
 class FakeApp(object):
     def __init__(self):
         if all(hasattr(settings_test, attr) for attr in
@@ -78,6 +121,7 @@ class FakeApp(object):
 test_sentinel = Sentinel(app=FakeApp())
 
 @patch('pybossa.cache.sentinel', new=test_sentinel)
+@patch('pybossa.cache.flush_cache_stats', new=lambda: None)
 class TestCacheMemoizeFunctions(object):
 
     @classmethod
@@ -246,6 +290,75 @@ class TestCacheMemoizeFunctions(object):
         assert delete_succedeed is False, delete_succedeed
 
 
+    def test_memoize_many_uses_cached_values(self):
+        """Test CACHE memoize many returns cached values and computes only
+        the misses"""
+
+        @memoize()
+        def my_func(arg, call_count=[]):
+            call_count.append(arg)
+            return arg * 2
+        my_func(1)
+
+        values = my_func.many([1, 2, (3,)])
+
+        assert values == [2, 4, 6], values
+        assert my_func(2) == 4
+        assert len(test_sentinel.master.keys()) == 3
+
+
+    def test_memoize_many_calls_batch_with_misses(self):
+        """Test CACHE memoize many calls batch once with the misses and
+        caches its values"""
+        calls = []
+
+        def batch(args_list):
+            calls.append(args_list)
+            return [args[0] * 10 for args in args_list]
+
+        @memoize(batch=batch)
+        def my_func(arg):
+            return arg * 2
+        my_func(1)
+
+        values = my_func.many([1, 2, 3])
+
+        assert values == [2, 20, 30], values
+        assert calls == [[(2,), (3,)]], calls
+        assert my_func(3) == 30
+
+
+    def test_memoize_many_adds_keys_to_cache_groups(self):
+        """Test CACHE memoize many adds the computed keys to cache groups"""
+
+        @memoize(cache_group_keys=[[0]])
+        def my_func(arg):
+            return arg
+        my_func.many(['key'])
+        assert get_cache_group_key('key') in test_sentinel.master.keys()
+
+        delete_cache_group('key')
+        assert not test_sentinel.master.keys()
+
+
+    def test_memoize_cache_disabled_refreshes_value(self):
+        """Test CACHE memoize within cache_disabled computes the value and
+        stores it in the cache"""
+
+        @memoize()
+        def my_func(arg, call_count=[]):
+            call_count.append(1)
+            return len(call_count)
+        first_call = my_func('arg')
+        with cache_disabled():
+            second_call = my_func('arg')
+        third_call = my_func('arg')
+
+        assert first_call == 1, first_call
+        assert second_call == 2, second_call
+        assert third_call == 2, third_call
+
+
     def test_delete_memoized_returns_true_when_delete_succeeds(self):
         """Test CACHE delete_memoized deletes a stored key and returns True if
         deletion is successful"""
@@ -433,3 +546,82 @@ class TestCacheMemoizeFunctions(object):
             return None
         my_func('a')
         assert len(test_sentinel.master.keys()) == 1
+
+
+@patch('pybossa.cache.sentinel', new=test_sentinel)
+class TestCacheStats(object):
+
+    @classmethod
+    def setup_class(cls):
+        import os
+        cls.cache = os.environ.pop('PYBOSSA_REDIS_CACHE_DISABLED', None)
+
+    @classmethod
+    def teardown_class(cls):
+        if cls.cache:
+            import os
+            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = cls.cache
+
+    def setUp(self):
+        test_sentinel.master.flushall()
+        reset_cache_stats()
+
+    def test_memoize_records_hits_and_misses(self):
+        """Test CACHE memoize records hits and misses per function"""
+
+        @memoize()
+        def my_func(*args, **kwargs):
+            return [args, kwargs]
+        my_func('arg')
+        my_func('arg')
+        my_func('arg')
+        my_func('other')
+        flush_cache_stats()
+
+        stats = get_cache_stats()
+        assert len(stats) == 1, stats
+        assert stats[0]['name'] == 'my_func', stats
+        assert stats[0]['hits'] == 2, stats
+        assert stats[0]['misses'] == 2, stats
+        assert stats[0]['hit_ratio'] == 0.5, stats
+        assert stats[0]['avg_bytes'] > 0, stats
+
+    def test_cache_records_stats_with_key_prefix(self):
+        """Test CACHE cache records stats using the key prefix as name"""
+
+        @cache(key_prefix='my_cached_func')
+        def my_func():
+            return 'my_func was called'
+        my_func()
+        flush_cache_stats()
+
+        stats = get_cache_stats()
+        assert [s['name'] for s in stats] == ['my_cached_func'], stats
+        assert stats[0]['misses'] == 1, stats
+
+    def test_flush_cache_stats_accumulates(self):
+        """Test CACHE flush_cache_stats adds to the stats stored in Redis"""
+
+        @memoize()
+        def my_func(*args, **kwargs):
+            return None
+        my_func('arg')
+        flush_cache_stats()
+        my_func('arg')
+        flush_cache_stats()
+
+        stats = get_cache_stats()
+        assert stats[0]['hits'] == 1, stats
+        assert stats[0]['misses'] == 1, stats
+
+    def test_reset_cache_stats(self):
+        """Test CACHE reset_cache_stats removes every stat"""
+
+        @memoize()
+        def my_func(*args, **kwargs):
+            return None
+        my_func('arg')
+        flush_cache_stats()
+        reset_cache_stats()
+
+        assert get_cache_stats() == []
@@ -18,8 +18,13 @@
 
 from default import Test, with_context
 from pybossa.cache.project_stats import *
+from pybossa.cache.project_stats import _project_counters, _stats_dimensions
+from pybossa.core import db, task_repo
+from pybossa.model.rollup_watermark import RollupWatermark
 from factories import UserFactory, ProjectFactory, TaskFactory, \
     TaskRunFactory, AnonymousTaskRunFactory
+from sqlalchemy.sql import text
+from mock import patch
 import pytz
 from datetime import date, datetime, timedelta
 
@@ -54,6 +59,7 @@ class TestProjectsStatsCache(Test):
         pr = ProjectFactory.create()
         TaskRunFactory.create(project=pr)
         AnonymousTaskRunFactory.create(project=pr)
+        update_task_run_rollup(pr.id)
         users, anon_users, auth_users = stats_users(pr.id)
         assert len(users) == 2, len(users)
         assert len(anon_users) == 1, len(anon_users)
@@ -67,6 +73,7 @@ class TestProjectsStatsCache(Test):
         TaskRunFactory.create(project=pr, created=d, finish_time=d)
         d = date.today() - timedelta(days=16)
         AnonymousTaskRunFactory.create(project=pr, created=d, finish_time=d)
+        update_task_run_rollup(pr.id)
         users, anon_users, auth_users = stats_users(pr.id, '1 week')
         assert len(users) == 2, len(users)
         assert len(anon_users) == 0, len(anon_users)
@@ -81,6 +88,7 @@ class TestProjectsStatsCache(Test):
         TaskFactory.create()
         TaskRunFactory.create(project=pr, task=task)
         AnonymousTaskRunFactory.create(project=pr)
+        update_task_run_rollup(pr.id)
         dates, dates_anon, dates_auth = stats_dates(pr.id)
         assert len(dates) == 15, len(dates)
         assert len(dates_anon) == 15, len(dates_anon)
@@ -98,6 +106,7 @@ class TestProjectsStatsCache(Test):
         TaskRunFactory.create(project=pr, task=task, created=d, finish_time=d)
         dd = date.today() - timedelta(days=16)
         AnonymousTaskRunFactory.create(project=pr, created=dd, finish_time=dd)
+        update_task_run_rollup(pr.id)
         dates, dates_anon, dates_auth = stats_dates(pr.id, '1 week')
         assert len(dates) == 7, len(dates)
         assert len(dates_anon) == 7, len(dates_anon)
@@ -115,6 +124,7 @@ class TestProjectsStatsCache(Test):
         TaskFactory.create()
         TaskRunFactory.create(project=pr, task=task)
         AnonymousTaskRunFactory.create(project=pr)
+        update_task_run_rollup(pr.id)
         hours, hours_anon, hours_auth, max_hours, \
             max_hours_anon, max_hours_auth = stats_hours(pr.id)
         assert len(hours) == 24, len(hours)
@@ -136,6 +146,7 @@ class TestProjectsStatsCache(Test):
         TaskRunFactory.create(project=pr, task=task, created=d, finish_time=d)
         d = date.today() - timedelta(days=16)
         AnonymousTaskRunFactory.create(project=pr, created=d, finish_time=d)
+        update_task_run_rollup(pr.id)
         hours, hours_anon, hours_auth, max_hours, \
             max_hours_anon, max_hours_auth = stats_hours(pr.id)
         assert len(hours) == 24, len(hours)
@@ -146,3 +157,126 @@ class TestProjectsStatsCache(Test):
         assert max_hours == 1
         assert max_hours_anon is None
         assert max_hours_auth == 1
+
+    def _rollup(self, project_id):
+        sql = text('''SELECT SUM(n_task_runs) AS n_task_runs,
+                   SUM(n_tasks) AS n_tasks FROM task_run_rollup
+                   WHERE project_id=:project_id;''')
+        return db.session.execute(sql, dict(project_id=project_id)).first()
+
+    @with_context
+    def test_update_task_run_rollup_is_incremental(self):
+        """Test CACHE PROJECT STATS rollup only adds new task runs."""
+        pr = ProjectFactory.create()
+        task = TaskFactory.create(project=pr, n_answers=2)
+        TaskRunFactory.create(project=pr, task=task)
+        update_task_run_rollup(pr.id)
+        row = self._rollup(pr.id)
+        assert row.n_task_runs == 1, row
+        assert row.n_tasks == 1, row
+
+        AnonymousTaskRunFactory.create(project=pr, task=task)
+        update_task_run_rollup(pr.id)
+        update_task_run_rollup(pr.id)
+        row = self._rollup(pr.id)
+        assert row.n_task_runs == 2, row
+        # The task is only counted in the bucket of its latest answer
+        assert row.n_tasks == 1, row
+        watermark = db.session.query(RollupWatermark).get(
+            'task_run_rollup:%s' % pr.id)
+        last_id = max(tr.id for tr in
+                      task_repo.filter_task_runs_by(project_id=pr.id))
+        assert watermark.last_id == last_id, watermark.last_id
+
+    @with_context
+    def test_update_task_run_rollup_rebuilds_on_drift(self):
+        """Test CACHE PROJECT STATS rollup is rebuilt if task runs vanish."""
+        pr = ProjectFactory.create()
+        task = TaskFactory.create(project=pr, n_answers=2)
+        taskruns = TaskRunFactory.create_batch(2, project=pr, task=task)
+        update_task_run_rollup(pr.id)
+        assert self._rollup(pr.id).n_task_runs == 2
+
+        task_repo.delete(taskruns[0])
+        update_task_run_rollup(pr.id)
+        row = self._rollup(pr.id)
+        assert row.n_task_runs == 1, row
+        assert row.n_tasks == 1, row
+
+    @with_context
+    def test_stats_readers_do_not_update_rollup(self):
+        """Test CACHE PROJECT STATS readers leave the rollup untouched."""
+        pr = ProjectFactory.create()
+        TaskRunFactory.create(project=pr)
+        stats_users(pr.id)
+        stats_dates(pr.id)
+        stats_hours(pr.id)
+        watermark = db.session.query(RollupWatermark).get(
+            'task_run_rollup:%s' % pr.id)
+        assert watermark is None, watermark
+        assert self._rollup(pr.id).n_task_runs is None
+
+    @with_context
+    def test_update_task_run_rollup_waits_for_late_task_runs(self):
+        """Test CACHE PROJECT STATS rollup watermark waits for task runs
+        still being written."""
+        pr = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=pr, n_answers=2)
+        old = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+        settled = TaskRunFactory.create(project=pr, task=tasks[0],
+                                        created=old, finish_time=old)
+        conn = db.engine.connect()
+        trans = conn.begin()
+        # A task run that takes its id now but commits after the update
+        conn.execute(text('''INSERT INTO task_run (project_id, task_id,
+                          user_ip, created, finish_time, info)
+                          VALUES (:project_id, :task_id, '127.0.0.2',
+                          :now, :now, '{}');'''),
+                     dict(project_id=pr.id, task_id=tasks[1].id,
+                          now=datetime.utcnow().isoformat()))
+        TaskRunFactory.create(project=pr, task=tasks[0])
+
+        update_task_run_rollup(pr.id)
+        watermark = db.session.query(RollupWatermark).get(
+            'task_run_rollup:%s' % pr.id)
+        assert watermark.last_id == settled.id, watermark.last_id
+        assert self._rollup(pr.id).n_task_runs == 1
+        update_stats(pr.id)
+        assert self._rollup(pr.id).n_task_runs == 1
+
+        trans.commit()
+        conn.close()
+        update_task_run_rollup(pr.id)
+        row = self._rollup(pr.id)
+        assert row.n_task_runs == 3, row
+        assert row.n_tasks == 2, row
+
+    @with_context
+    def test_project_counters(self):
+        """Test CACHE PROJECT STATS counters match the cached project ones."""
+        pr = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=pr, n_answers=1)
+        TaskRunFactory.create(project=pr, task=tasks[0])
+        AnonymousTaskRunFactory.create(project=pr, task=tasks[1])
+        counters = _project_counters(pr.id)
+        assert counters['n_tasks'] == cached_projects.n_tasks(pr.id)
+        assert counters['n_task_runs'] == 2, counters
+        assert counters['n_volunteers'] == 2, counters
+        assert counters['n_completed_tasks'] == \
+            cached_projects.n_completed_tasks(pr.id)
+        assert counters['overall_progress'] == \
+            cached_projects.overall_progress(pr.id)
+        assert counters['last_activity'] == \
+            cached_projects.last_activity(pr.id)
+        assert counters['n_results'] == cached_projects.n_results(pr.id)
+        assert counters['n_blogposts'] == 0, counters
+
+    @with_context
+    def test_update_stats_uses_one_rollup_query(self):
+        """Test CACHE PROJECT STATS update_stats reads the rollup once."""
+        pr = ProjectFactory.create()
+        TaskRunFactory.create(project=pr)
+        with patch('pybossa.cache.project_stats._stats_dimensions',
+                   wraps=_stats_dimensions) as dimensions:
+            update_stats(pr.id)
+        assert dimensions.call_count == 1, dimensions.call_count
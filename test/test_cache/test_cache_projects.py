@@ -25,7 +25,7 @@ import datetime
 from pybossa.core import result_repo
 from pybossa.model.project import Project
 from pybossa.cache.project_stats import update_stats
-from nose.tools import nottest
+from nose.tools import nottest, assert_raises
 from pybossa.cache.task_browse_helpers import get_task_filters
 
 class TestProjectsCache(Test):
@@ -432,6 +432,179 @@ class TestProjectsCache(Test):
         assert cached_tasks[0].get('pct_status') == 1.0, cached_tasks[0].get('pct_status')
 
 
+    @with_context
+    def test_browse_tasks_cursor_pages(self):
+        """Test CACHE PROJECTS browse_tasks pages with a cursor the same
+        rows that it pages with an offset"""
+        from pybossa.cache.task_browse_helpers import parse_tasks_browse_args
+
+        project = ProjectFactory.create()
+        for priority in [0.5, 0.1, 0.5, 0.9, 0.1, 0.5, 0.3]:
+            TaskFactory.create(project=project, priority_0=priority)
+        args = parse_tasks_browse_args(dict(order_by='priority desc'))
+
+        args.update(records_per_page=7, offset=0)
+        count, expected = cached_projects.browse_tasks(project.id, args)
+        expected = [task['id'] for task in expected]
+
+        browsed = []
+        args.update(records_per_page=3)
+        while True:
+            count, tasks = cached_projects.browse_tasks(project.id, args)
+            assert count == 7, count
+            browsed.extend(task['id'] for task in tasks)
+            if len(tasks) < 3:
+                break
+            args['cursor'] = parse_tasks_browse_args(
+                dict(order_by='priority desc',
+                     cursor=tasks[-1]['cursor']))['cursor']
+
+        assert browsed == expected, (browsed, expected)
+
+    @with_context
+    def test_browse_tasks_cursor_with_null_keys(self):
+        """Test CACHE PROJECTS browse_tasks cursor pages over tasks without
+        task runs when sorting by finish time"""
+        from pybossa.cache.task_browse_helpers import parse_tasks_browse_args
+
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(4, project=project)
+        TaskRunFactory.create(task=tasks[2])
+
+        for direction in ['asc', 'desc']:
+            order_by = 'finish_time {}'.format(direction)
+            args = parse_tasks_browse_args(dict(order_by=order_by))
+            args.update(records_per_page=1)
+            browsed = []
+            while True:
+                count, page = cached_projects.browse_tasks(project.id, args)
+                if not page:
+                    break
+                browsed.extend(task['id'] for task in page)
+                args['cursor'] = parse_tasks_browse_args(
+                    dict(order_by=order_by,
+                         cursor=page[-1]['cursor']))['cursor']
+
+            assert sorted(browsed) == sorted(t.id for t in tasks), browsed
+            assert len(browsed) == 4, browsed
+
+    @with_context
+    def test_browse_tasks_count(self):
+        """Test CACHE PROJECTS browse_tasks_count counts the filtered tasks
+        and stops at the cap"""
+        project = ProjectFactory.create()
+        TaskFactory.create_batch(3, project=project, priority_0=0.9)
+        TaskFactory.create_batch(2, project=project, priority_0=0.1)
+
+        count = cached_projects.browse_tasks_count(
+            project.id, dict(records_per_page=10, offset=20))
+        assert count == (5, True), count
+
+        count = cached_projects.browse_tasks_count(
+            project.id, dict(priority_from=0.5))
+        assert count == (3, True), count
+
+        with patch.object(cached_projects, 'BROWSE_TASKS_COUNT_CAP', 2):
+            count = cached_projects.browse_tasks_count(
+                project.id, dict(priority_from=0.0))
+        assert count == (2, False), count
+
+    def test_filters_key_ignores_paging_and_order(self):
+        """Test browse tasks filters key only depends on the filters"""
+        from pybossa.cache.task_browse_helpers import get_filters_key
+
+        first = get_filters_key(dict(priority_from=0.0, state='ongoing',
+                                     offset=10, order_by='id desc',
+                                     hide_completed=False))
+        second = get_filters_key(dict(state='ongoing', priority_from=0.0,
+                                      offset=0, cursor=[3]))
+        assert first == second, (first, second)
+        assert get_filters_key(dict(offset=10)) == '{}'
+
+    def test_task_info_filters_match_searchable_indexes(self):
+        """Test task info filters are ILIKE predicates on the expression
+        the searchable columns indexes are built on"""
+        from pybossa.cache.task_browse_helpers import get_info_index_sql
+
+        filters, params = get_task_filters(dict(filter_by_field=[
+            (u'city', u'equals', u'New_York')]))
+        expression = "COALESCE(task.info->>'city', '')"
+        assert filters == " AND ({} ilike :filter_by_field_0 escape '\\')" \
+            .format(expression), filters
+        assert params == {'filter_by_field_0': 'New\\_York'}, params
+
+        sql = get_info_index_sql(7, u'city')
+        assert "USING gin ((COALESCE(info->>'city', '')) gin_trgm_ops)" in sql
+        assert sql.endswith('WHERE project_id = 7'), sql
+        assert_raises(ValueError, get_info_index_sql, 7, u"city') --")
+
+    @with_context
+    def test_task_info_keys_catalog(self):
+        """Test the task info keys catalog follows heterogeneous tasks"""
+        from pybossa.cache.task_browse_helpers import (get_task_info_keys,
+                                                       get_searchable_columns,
+                                                       rebuild_task_info_keys)
+        from pybossa.core import task_repo
+
+        project = ProjectFactory.create()
+        first = TaskFactory.create(project=project,
+                                   info=dict(city='Paris', n=1))
+        TaskFactory.create(project=project,
+                           info=dict(city='Rome', geo=dict(lat=1.5)))
+
+        catalog = dict(((row['path'], row['json_type']), row['n_tasks'])
+                       for row in get_task_info_keys(project.id))
+        assert catalog == {('city', 'string'): 2, ('n', 'number'): 1,
+                           ('geo', 'object'): 1, ('geo__lat', 'number'): 1}, \
+            catalog
+        columns = get_searchable_columns(project.id)
+        assert columns == ['city', 'geo', 'n'], columns
+
+        first.info = dict(city=None)
+        task_repo.update(first)
+        task_repo.delete(first)
+        catalog = dict(((row['path'], row['json_type']), row['n_tasks'])
+                       for row in get_task_info_keys(project.id))
+        assert catalog == {('city', 'string'): 1, ('geo', 'object'): 1,
+                           ('geo__lat', 'number'): 1}, catalog
+
+        before = get_task_info_keys(project.id)
+        rebuild_task_info_keys(project.id)
+        assert get_task_info_keys(project.id) == before
+
+    def test_task_browse_args_cursor_must_match_order(self):
+        """Test task browse args reject a cursor for another order"""
+        from pybossa.cache.task_browse_helpers import (parse_tasks_browse_args,
+                                                       encode_cursor)
+
+        cursor = encode_cursor([0.5, 3])
+        args = parse_tasks_browse_args(dict(order_by='priority desc',
+                                            cursor=cursor))
+        assert args['cursor'] == [0.5, 3], args
+
+        assert_raises(ValueError, parse_tasks_browse_args,
+                      dict(cursor=cursor))
+        assert_raises(ValueError, parse_tasks_browse_args,
+                      dict(cursor='not a cursor'))
+
+    @with_context
+    def test_browse_tasks_formats_dates(self):
+        """Test CACHE PROJECTS browse_tasks shows the creation and finish
+        dates in the browse timezone"""
+        from pybossa.util import convert_utc_to_est
+
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project,
+                                  created='2018-01-24T19:49:21.799870')
+        TaskRunFactory.create(task=task,
+                              finish_time='2018-07-04T03:05:00.000000')
+
+        count, tasks = cached_projects.browse_tasks(project.id, {})
+
+        expected = convert_utc_to_est(task.created).strftime('%m-%d-%y %H:%M')
+        assert tasks[0]['created'] == expected == '01-24-18 14:49', tasks
+        assert tasks[0]['finish_time'] == '07-03-18 23:05', tasks
+
     @with_context
     def test_n_featured_returns_nothing(self):
         """Test CACHE PROJECTS _n_featured 0 if there are no featured projects"""
@@ -451,9 +624,9 @@ class TestProjectsCache(Test):
 
 
     @with_context
-    @patch('pybossa.cache.pickle')
+    @patch('pybossa.cache.serialize')
     @patch('pybossa.cache.projects._n_draft')
-    def test_n_count_calls_n_draft(self, _n_draft, pickle):
+    def test_n_count_calls_n_draft(self, _n_draft, serialize):
         """Test CACHE PROJECTS n_count calls _n_draft when called with argument
         'draft'"""
         cached_projects.n_count('draft')
@@ -462,9 +635,9 @@ class TestProjectsCache(Test):
 
 
     @with_context
-    @patch('pybossa.cache.pickle')
+    @patch('pybossa.cache.serialize')
     @patch('pybossa.cache.projects._n_featured')
-    def test_n_count_calls_n_featuredt(self, _n_featured, pickle):
+    def test_n_count_calls_n_featuredt(self, _n_featured, serialize):
         """Test CACHE PROJECTS n_count calls _n_featured when called with
         argument 'featured'"""
         cached_projects.n_count('featured')
@@ -590,6 +763,38 @@ class TestProjectsCache(Test):
         assert activity == last_task_run.finish_time, last_task_run
 
 
+    @with_context
+    def test_get_listing_stats_matches_single_project_functions(self):
+        """Test CACHE PROJECTS get_listing_stats returns the same values as
+        the per project cached functions"""
+        busy = self.create_project_with_contributors(anonymous=2, registered=3)
+        TaskFactory.create(project=busy, state='completed')
+        idle = ProjectFactory.create()
+
+        stats = cached_projects.get_listing_stats([busy.id, idle.id])
+
+        for project in (busy, idle):
+            project_stats = stats[project.id]
+            assert project_stats['n_tasks'] == cached_projects.n_tasks(project.id)
+            assert project_stats['n_volunteers'] == cached_projects.n_volunteers(project.id)
+            assert project_stats['overall_progress'] == cached_projects.overall_progress(project.id)
+            assert project_stats['last_activity_raw'] == cached_projects.last_activity(project.id)
+        assert stats[busy.id]['n_volunteers'] == 5, stats
+        assert stats[idle.id]['last_activity_raw'] is None, stats
+
+
+    @with_context
+    def test_n_tasks_many_returns_values_in_order(self):
+        """Test CACHE PROJECTS n_tasks.many returns the values in the order
+        of the arguments"""
+        project = self.create_project_with_tasks(1, 2)
+        other = self.create_project_with_tasks(0, 1)
+
+        n_tasks = cached_projects.n_tasks.many([other.id, project.id, 999])
+
+        assert n_tasks == [1, 3, 0], n_tasks
+
+
     @with_context
     def test_n_published_counts_published_projects(self):
         published_project = ProjectFactory.create_batch(2, published=True)
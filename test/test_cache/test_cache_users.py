@@ -16,7 +16,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 
-from default import Test, with_context
+from default import Test, with_context, db
 from pybossa.cache import users as cached_users
 from pybossa.model.user import User
 from pybossa.leaderboard.jobs import leaderboard as update_leaderboard
@@ -502,6 +502,95 @@ class TestUsersCache(Test):
 
         assert len(users_with_contrib) == 1, users_with_contrib
 
+    @with_context
+    def test_user_stats_maintained_on_submission(self):
+        """Test CACHE USERS user_stats are kept up to date on each submission
+        and match a rebuild from the task runs"""
+        user = UserFactory.create()
+        projects = ProjectFactory.create_batch(2)
+        for project in projects:
+            tasks = TaskFactory.create_batch(2, project=project)
+            for task in tasks:
+                TaskRunFactory.create(user=user, task=task)
+        sql = """SELECT n_answers, n_projects, first_submission_on,
+                 last_submission_on FROM user_stats WHERE user_id=:user_id"""
+        stats = db.session.execute(sql, dict(user_id=user.id)).fetchall()
+
+        assert stats[0].n_answers == 4, stats
+        assert stats[0].n_projects == 2, stats
+        assert cached_users.n_projects_contributed(user.id) == 2
+        summary = cached_users.get_user_summary(user.name)
+        assert summary['n_answers'] == 4, summary
+        assert summary['last_task_submission_on'] == stats[0].last_submission_on
+
+        cached_users.rebuild_user_stats()
+
+        rebuilt = db.session.execute(sql, dict(user_id=user.id)).fetchall()
+        assert rebuilt == stats, (rebuilt, stats)
+
+    @with_context
+    def test_user_stats_maintained_on_delete(self):
+        """Test CACHE USERS user_stats follow the deletion of task runs"""
+        from pybossa.core import task_repo
+        user = UserFactory.create()
+        projects = ProjectFactory.create_batch(2)
+        taskruns = []
+        for project in projects:
+            tasks = TaskFactory.create_batch(2, project=project)
+            for task in tasks:
+                taskruns.append(TaskRunFactory.create(user=user, task=task))
+        sql = """SELECT n_answers, n_projects, first_submission_on,
+                 last_submission_on FROM user_stats WHERE user_id=:user_id"""
+
+        task_repo.delete(taskruns[-1])
+        stats = db.session.execute(sql, dict(user_id=user.id)).fetchall()
+        assert stats[0].n_answers == 3, stats
+        assert stats[0].n_projects == 2, stats
+        assert stats[0].last_submission_on == taskruns[-2].finish_time, stats
+
+        task_repo.delete_taskruns_from_project(projects[0])
+        stats = db.session.execute(sql, dict(user_id=user.id)).fetchall()
+        assert stats[0].n_answers == 1, stats
+        assert stats[0].n_projects == 1, stats
+        assert cached_users.n_projects_contributed(user.id) == 1
+
+        cached_users.rebuild_user_stats()
+        rebuilt = db.session.execute(sql, dict(user_id=user.id)).fetchall()
+        assert rebuilt == stats, (rebuilt, stats)
+
+    @with_context
+    def test_get_project_report_userdata(self):
+        """Test CACHE USERS get_project_report_userdata aggregates the task
+        runs of each contributor in the project"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(4, project=project)
+        users = UserFactory.create_batch(2)
+        for task in tasks:
+            TaskRunFactory.create(user=users[0], task=task)
+        TaskRunFactory.create(user=users[1], task=tasks[0])
+        TaskRunFactory.create()
+
+        report = list(cached_users.get_project_report_userdata(project.id))
+
+        assert [row[0] for row in report] == [u.id for u in users], report
+        assert [row[14] for row in report] == [4, 1], report
+        assert [row[15] for row in report] == [100, 25], report
+
+    @with_context
+    def test_get_users_for_report(self):
+        """Test CACHE USERS get_users_for_report streams one row per user
+        with its counters"""
+        user = UserFactory.create()
+        UserFactory.create(restrict=True)
+        TaskRunFactory.create_batch(2, user=user)
+
+        report = dict((row['id'], row) for row in
+                      cached_users.get_users_for_report())
+
+        assert report[user.id]['completed_tasks'] == 2, report
+        assert report[user.id]['total_projects_contributed'] == 2, report
+        assert all(not row['restrict'] for row in report.values()), report
+
     @with_context
     def test_get_users_page_supports_pagination(self):
         users = UserFactory.create_batch(3)
@@ -237,6 +237,7 @@ class TestSiteStatsCache(Test):
         TaskRunFactory.create(project=recently_contributed_project)
         TaskRunFactory.create(project=long_ago_contributed_project, finish_time=date_60_days_old)
 
+        stats.update_site_activity()
         total_active_projects = stats.number_of_active_jobs()
         assert total_active_projects == 1, "Total number of active projects in last 30 days should be 1"
 
@@ -251,6 +252,7 @@ class TestSiteStatsCache(Test):
         TaskFactory.create()
         TaskFactory.create()
         TaskFactory.create(created=date_60_days_old)
+        stats.update_site_activity()
         tasks = stats.number_of_created_tasks()
 
         assert tasks == 2, "Total number tasks created in last 30 days should be 2"
@@ -275,6 +277,7 @@ class TestSiteStatsCache(Test):
             task = TaskFactory.create(n_answers=1, project=old_project, created=date_60_days_old)
             TaskRunFactory.create(task=task, project=recent_project, finish_time=date_60_days_old)
 
+        stats.update_site_activity()
         total_tasks = stats.number_of_completed_tasks()
         assert total_tasks == recent_taskruns, "Total completed tasks in last 30 days should be {}".format(recent_taskruns)
 
@@ -294,6 +297,7 @@ class TestSiteStatsCache(Test):
         old_user = UserFactory.create()
         TaskRunFactory.create(user=old_user, finish_time=date_60_days_old)
 
+        stats.update_site_activity()
         total_users = stats.number_of_active_users()
         assert total_users == recent_users, "Total active users in last 30 days should be {}".format(recent_users)
 
@@ -328,6 +332,7 @@ class TestSiteStatsCache(Test):
         TaskFactory.create_batch(5, n_answers=1, project=project, created=date_now)
         TaskFactory.create_batch(5, n_answers=1, project=old_project, created=date_old)
 
+        stats.update_site_activity()
         avg_tasks = stats.avg_task_per_job()
         assert avg_tasks == expected_avg_tasks, "Average task created per job should be {}".format(expected_avg_tasks)
 
@@ -341,6 +346,7 @@ class TestSiteStatsCache(Test):
         for i in range(5):
             TaskRunFactory.create(created=date_15m_old, finish_time=date_now)
 
+        stats.update_site_activity()
         avg_time = stats.avg_time_to_complete_task()
         assert avg_time == expected_avg_time, \
             "Average time to complete tasks in last 30 days should be {}".format(expected_avg_time)
@@ -366,9 +372,65 @@ class TestSiteStatsCache(Test):
         for i in range(3):
             TaskFactory.create(project=project3, created=date_recent)
 
+        stats.update_site_activity()
         avg_tasks = round(stats.tasks_per_category())
         assert avg_tasks == expected_avg_tasks, "Average tasks created per category should be {}".format(expected_avg_tasks)
 
+    @with_context
+    def test_update_site_activity_is_incremental(self):
+        """Test site activity only aggregates again the last day"""
+        date_60_days_old = (datetime.datetime.utcnow() -  datetime.timedelta(60)).isoformat()
+        old_task = TaskFactory.create(n_answers=1, created=date_60_days_old)
+        TaskRunFactory.create(task=old_task, finish_time=date_60_days_old)
+        start = stats.update_site_activity()
+        assert start == datetime.date.min, start
+
+        task = TaskFactory.create(n_answers=2)
+        TaskRunFactory.create(task=task)
+        start = stats.update_site_activity()
+        expected = (datetime.datetime.utcnow() - datetime.timedelta(60)).date()
+        assert start == expected, start
+
+        TaskRunFactory.create(task=task)
+        AnonymousTaskRunFactory.create(task=task)
+        start = stats.update_site_activity()
+        assert start == datetime.datetime.utcnow().date(), start
+
+        sql = """SELECT SUM(n_task_runs) AS n_task_runs,
+                 SUM(n_tasks_created) AS n_tasks,
+                 SUM(n_completed_tasks) AS n_completed
+                 FROM site_activity"""
+        row = db.session.execute(sql).first()
+        assert row.n_task_runs == 4, row
+        assert row.n_tasks == 2, row
+        assert row.n_completed == 2, row
+        assert stats.number_of_active_users() == 2
+        assert stats.number_of_active_users(days='all') == 3
+
+    @with_context
+    def test_update_site_activity_counts_completed_tasks_once(self):
+        """Test site activity counts a completed task on the day it was
+        completed, even if it gets more task runs later"""
+        now = datetime.datetime.utcnow()
+        five_days_old = (now - datetime.timedelta(5)).isoformat()
+        two_days_old = (now - datetime.timedelta(2)).isoformat()
+        task = TaskFactory.create(n_answers=1, created=five_days_old)
+        TaskRunFactory.create(task=task, finish_time=five_days_old)
+        other_task = TaskFactory.create(n_answers=2, created=two_days_old)
+        TaskRunFactory.create(task=other_task, finish_time=two_days_old)
+        stats.update_site_activity()
+
+        TaskRunFactory.create(task=task)
+        stats.update_site_activity()
+
+        sql = """SELECT day, SUM(n_completed_tasks) AS n_completed
+                 FROM site_activity GROUP BY day HAVING
+                 SUM(n_completed_tasks) > 0"""
+        rows = db.session.execute(sql).fetchall()
+        assert len(rows) == 1, rows
+        assert rows[0].day == (now - datetime.timedelta(5)).date(), rows
+        assert rows[0].n_completed == 1, rows
+
     @with_context
     def test_charts(self):
         """Test project chart"""
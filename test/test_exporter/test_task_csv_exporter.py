@@ -120,3 +120,23 @@ class TestExporters(Test):
         call_json_params = json_uploader.upload_file.call_args_list
         expected_json_params = set(['1_project1_task_run_json.zip', '1_project1_result_json.zip', '1_project1_task_json.zip'])
         assert self._check_func_called_with_params(call_json_params, expected_json_params)
+
+    @with_context
+    def test_task_csv_exporter_catalog_headers_match_rows(self):
+        """Test the headers of a filtered task export are the ones found
+        walking its rows, without reading them."""
+        from pybossa.exporter.export_helpers import browse_tasks_export
+        project = ProjectFactory.create()
+        TaskFactory.create(project=project, info={'a': {'b': 1}},
+                           user_pref={'languages': ['en']})
+        TaskFactory.create(project=project, info={'c': 2},
+                           user_pref={'locations': {'city': 'x'}})
+        exporter = TaskCsvExporter()
+        info_headers = exporter._get_info_headers(project.id, 'task', False)
+
+        headers = exporter._get_catalog_headers(project.id, info_headers)
+
+        rows = browse_tasks_export('task', project.id, False, {})
+        expected = exporter._get_all_headers(objs=rows, expanded=False,
+                                             table='task', from_obj=False)
+        assert headers == expected, (headers, expected)
@@ -37,7 +37,7 @@ class TestDashBoardActiveAnon(Test):
         db_mock.slave_session.execute.return_value = results
         res = active_anon_week()
         assert db_mock.session.execute.called
-        assert res == 'Materialized view refreshed'
+        assert res == 'Materialized view refreshed concurrently'
 
     @with_context
     @patch('pybossa.dashboard.jobs.db')
@@ -37,7 +37,7 @@ class TestDashBoardActiveUsers(Test):
         db_mock.slave_session.execute.return_value = results
         res = active_users_week()
         assert db_mock.session.execute.called
-        assert res == 'Materialized view refreshed'
+        assert res == 'Materialized view refreshed concurrently'
 
     @with_context
     @patch('pybossa.dashboard.jobs.db')
@@ -62,6 +62,25 @@ class TestDashBoardActiveUsers(Test):
 
         assert results[0].n_users == 1, results[0].n_users
 
+    @with_context
+    def test_active_week_refreshed_concurrently(self):
+        """Test JOB dashboard view has a unique index and is refreshed
+        concurrently."""
+        active_users_week()
+        sql = """select indexdef from pg_indexes
+                 where tablename='dashboard_week_users';"""
+        indexes = [row.indexdef for row in db.session.execute(sql)]
+        assert len(indexes) == 1, indexes
+        assert 'UNIQUE' in indexes[0], indexes
+
+        TaskRunFactory.create()
+        res = active_users_week()
+
+        assert res == 'Materialized view refreshed concurrently', res
+        results = db.session.execute(
+            "select * from dashboard_week_users;").fetchall()
+        assert results[0].n_users == 1, results
+
     @with_context
     def test_format_users_week(self):
         """Test format users week works."""
@@ -43,7 +43,7 @@ class TestDashBoardDraftProject(Test):
         db_mock.slave_session.execute.return_value = results
         res = draft_projects_week()
         assert db_mock.session.execute.called
-        assert res == 'Materialized view refreshed'
+        assert res == 'Materialized view refreshed concurrently'
 
     @with_context
     @patch('pybossa.dashboard.jobs.db')
@@ -90,7 +90,7 @@ class TestDashBoardPublishedProject(Test):
         db_mock.slave_session.execute.return_value = results
         res = published_projects_week()
         assert db_mock.session.execute.called
-        assert res == 'Materialized view refreshed'
+        assert res == 'Materialized view refreshed concurrently'
 
     @with_context
     @patch('pybossa.dashboard.jobs.db')
@@ -139,7 +139,7 @@ class TestDashBoardUpdateProject(Test):
         db_mock.slave_session.execute.return_value = results
         res = update_projects_week()
         assert db_mock.session.execute.called
-        assert res == 'Materialized view refreshed'
+        assert res == 'Materialized view refreshed concurrently'
 
     @with_context
     @patch('pybossa.dashboard.jobs.db')
@@ -18,9 +18,11 @@
 
 from pybossa.leaderboard.jobs import leaderboard
 from pybossa.leaderboard.data import get_leaderboard
-from pybossa.core import db
+from pybossa.leaderboard.scores import (increment_user_score,
+                                         get_rank_and_score, rebuild_scores)
+from pybossa.core import db, sentinel
 from pybossa.jobs import get_leaderboard_jobs
-from factories import UserFactory, TaskRunFactory
+from factories import UserFactory, TaskFactory, TaskRunFactory
 from default import Test, with_context
 from mock import patch, MagicMock
 from sqlalchemy.exc import ProgrammingError
@@ -47,7 +49,7 @@ class TestLeaderboard(Test):
         result.exists = True
         results = [result]
         db_mock.slave_session.execute.return_value = results
-        res = leaderboard()
+        res = leaderboard(info='n')
         assert db_mock.session.execute.called
         assert res == 'Materialized view refreshed concurrently'
 
@@ -65,7 +67,7 @@ class TestLeaderboard(Test):
                                                                 'bar',
                                                                 'bar'),
                                                True]
-        res = leaderboard()
+        res = leaderboard(info='n')
         assert db_mock.session.execute.called
         assert res == 'Materialized view refreshed'
 
@@ -77,7 +79,7 @@ class TestLeaderboard(Test):
         result.exists = False
         results = [result]
         db_mock.slave_session.execute.return_value = results
-        res = leaderboard()
+        res = leaderboard(info='n')
         assert db_mock.session.commit.called
         assert res == 'Materialized view created'
 
@@ -97,9 +99,86 @@ class TestLeaderboard(Test):
         for u in top_users:
             assert u['name'] != restricted.name, u
 
-        results = db.session.execute('select * from users_rank');
-        for r in results:
-            assert r.restrict is False, r
+        assert get_rank_and_score(restricted.id) == (None, None)
+
+    @with_context
+    def test_leaderboard_scores_incremented_on_submission(self):
+        """Test JOB leaderboard scores follow new task runs without a
+        rebuild."""
+        users = UserFactory.create_batch(3)
+        leaderboard()
+        TaskRunFactory.create_batch(3, user=users[1])
+        TaskRunFactory.create(user=users[2])
+
+        top_users = get_leaderboard(top_users=2)
+
+        assert [u['name'] for u in top_users] == [users[1].name,
+                                                  users[2].name]
+        assert [u['score'] for u in top_users] == [3, 1], top_users
+        assert [u['rank'] for u in top_users] == [1, 2], top_users
+
+    @with_context
+    def test_leaderboard_scores_reconciled(self):
+        """Test JOB leaderboard rebuilds scores that drifted from the DB."""
+        user = UserFactory.create()
+        TaskRunFactory.create_batch(2, user=user)
+        increment_user_score(user.id, 10)
+        assert get_rank_and_score(user.id) == (1, 12)
+
+        leaderboard()
+
+        assert get_rank_and_score(user.id) == (1, 2)
+
+    @with_context
+    def test_leaderboard_scores_keep_increments_during_rebuild(self):
+        """Test JOB leaderboard rebuild keeps the contributions made while
+        it reads the task runs."""
+        user = UserFactory.create()
+        TaskRunFactory.create_batch(2, user=user)
+        delete = sentinel.master.delete
+
+        def delete_and_contribute(*args, **kwargs):
+            result = delete(*args, **kwargs)
+            # a task run committed after the snapshot of the rebuild
+            TaskRunFactory.create(user=user)
+            return result
+
+        with patch.object(sentinel.master, 'delete',
+                          side_effect=delete_and_contribute):
+            rebuild_scores()
+
+        assert get_rank_and_score(user.id) == (1, 3)
+
+    @with_context
+    def test_leaderboard_scores_incremented_after_commit(self):
+        """Test JOB leaderboard scores are not incremented for task runs
+        that are rolled back."""
+        user = UserFactory.create()
+        task = TaskFactory.create()
+        leaderboard()
+        taskrun = TaskRunFactory.build(user=user, task=task)
+        db.session.add(taskrun)
+        db.session.flush()
+        assert get_rank_and_score(user.id)[1] == 0
+        db.session.rollback()
+        assert get_rank_and_score(user.id)[1] == 0
+
+        TaskRunFactory.create(user=user, task=task)
+        assert get_rank_and_score(user.id)[1] == 1
+
+    @with_context
+    def test_leaderboard_window(self):
+        """Test JOB leaderboard returns the neighbourhood of a user."""
+        users = UserFactory.create_batch(6)
+        for i, user in enumerate(users):
+            TaskRunFactory.create_batch(6 - i, user=user)
+        leaderboard()
+
+        top_users = get_leaderboard(top_users=1, user_id=users[4].id,
+                                    window=1)
+
+        assert [u['rank'] for u in top_users] == [1, 4, 5, 6], top_users
+        assert top_users[2]['name'] == users[4].name
 
     @with_context
     def test_leaderboard_foo_key(self):
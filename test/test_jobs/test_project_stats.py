@@ -17,7 +17,9 @@
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 
 from pybossa.jobs import get_project_jobs, create_dict_jobs, get_project_stats
-from pybossa.jobs import warm_cache
+from pybossa.jobs import warm_cache, warm_projects
+from pybossa.traffic import mark_project_stats_dirty
+from mock import patch
 from default import Test, with_context
 from factories import ProjectFactory
 from factories import UserFactory
@@ -75,7 +77,8 @@ class TestProjectsStats(Test):
     def test_get_project_jobs_for_non_pro_users(self):
         """Test JOB get project jobs works for non pro users."""
         owner = UserFactory.create(pro=False)
-        ProjectFactory.create(owner=owner)
+        project = ProjectFactory.create(owner=owner)
+        mark_project_stats_dirty(project.id)
         jobs_generator = get_project_jobs('high')
         jobs = []
         for job in jobs_generator:
@@ -83,6 +86,37 @@ class TestProjectsStats(Test):
 
         err_msg = "There should be only 1 jobs"
         assert len(jobs) == 1, err_msg
+        assert jobs[0]['args'] == [project.id, project.short_name], jobs
+
+    @with_context
+    def test_get_project_jobs_only_dirty_projects(self):
+        """Test JOB get project jobs skips projects without new answers."""
+        ProjectFactory.create()
+        task = TaskFactory.create()
+        TaskRunFactory.create(project=task.project, task=task)
+        jobs = list(get_project_jobs('high'))
+        assert len(jobs) == 1, jobs
+        assert jobs[0]['args'][0] == task.project.id, jobs
+
+        # Refreshed projects are rate limited
+        TaskRunFactory.create(project=task.project, task=task)
+        assert list(get_project_jobs('high')) == []
+
+    @with_context
+    def test_get_project_jobs_after_deleting_task_runs(self):
+        """Test JOB get project jobs refreshes projects whose task runs are
+        deleted."""
+        from pybossa.core import task_repo
+        task = TaskFactory.create()
+        TaskRunFactory.create(project=task.project, task=task)
+        assert len(list(get_project_jobs('high'))) == 1
+
+        task_repo.delete_taskruns_from_project(task.project)
+        with patch('pybossa.traffic.claim_stats_refresh',
+                   side_effect=lambda ids, interval: ids):
+            jobs = list(get_project_jobs('high'))
+        assert len(jobs) == 1, jobs
+        assert jobs[0]['args'][0] == task.project.id, jobs
 
     @with_context
     def test_warm_project(self):
@@ -93,3 +127,57 @@ class TestProjectsStats(Test):
             TaskRunFactory.create(project=project, task=task)
         res = warm_cache()
         assert res, res
+
+    @with_context
+    @patch('pybossa.jobs.enqueue_job')
+    def test_warm_cache_refreshes_listings(self, enqueue_job):
+        """Test JOB warm_cache recomputes the cached project listings."""
+        from pybossa.cache import is_cache_disabled
+        calls = []
+
+        def get_top():
+            calls.append(is_cache_disabled())
+            return []
+
+        with patch('pybossa.cache.projects.get_top', side_effect=get_top):
+            warm_cache()
+        assert calls == [True], calls
+
+    @with_context
+    @patch('pybossa.jobs.enqueue_job')
+    def test_warm_cache_enqueues_shards(self, enqueue_job):
+        """Test JOB warm_cache enqueues warm jobs with busiest projects first."""
+        from pybossa.traffic import increment_project_traffic
+        projects = ProjectFactory.create_batch(3, featured=True)
+        increment_project_traffic(projects[2].id, 10)
+        with patch.dict(self.flask_app.config, {'WARM_CACHE_SHARD_SIZE': 2}):
+            warm_cache()
+        warm_projects_jobs = [call[0][0] for call in enqueue_job.call_args_list
+                              if call[0][0]['name'] == warm_projects]
+        assert len(warm_projects_jobs) == 2, warm_projects_jobs
+        first_shard = warm_projects_jobs[0]['args'][0]
+        assert first_shard[0][0] == projects[2].id, first_shard
+        assert len(first_shard) == 2, first_shard
+
+    @with_context
+    @patch('pybossa.jobs.enqueue_job')
+    def test_warm_cache_skips_unchanged_projects(self, enqueue_job):
+        """Test JOB warm_cache skips projects warmed since their last change."""
+        project = ProjectFactory.create(featured=True)
+        warm_cache()
+        shards = [call[0][0]['args'][0] for call in enqueue_job.call_args_list
+                  if call[0][0]['name'] == warm_projects]
+        warm_projects(*shards)
+        enqueue_job.reset_mock()
+
+        warm_cache()
+        shards = [call[0][0]['args'][0] for call in enqueue_job.call_args_list
+                  if call[0][0]['name'] == warm_projects]
+        assert shards == [], shards
+
+        TaskRunFactory.create(project=project)
+        enqueue_job.reset_mock()
+        warm_cache()
+        shards = [call[0][0]['args'][0] for call in enqueue_job.call_args_list
+                  if call[0][0]['name'] == warm_projects]
+        assert [_id for _id, _ in shards[0]] == [project.id], shards
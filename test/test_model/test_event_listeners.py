@@ -17,7 +17,7 @@
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 
 from default import Test, with_context
-from factories import TaskFactory, TaskRunFactory
+from factories import ProjectFactory, TaskFactory, TaskRunFactory
 from mock import patch, MagicMock
 from pybossa.core import db, task_repo, result_repo
 from pybossa.model.counter import Counter
@@ -282,3 +282,21 @@ class TestModelEventListeners(Test):
         assert len(counters) == 1, counters
         counter = counters[0]
         assert counter[2] == 0, counter
+
+    @with_context
+    @patch('pybossa.model.event_listeners.task_queue')
+    def test_delete_project_drops_searchable_indexes(self, queue):
+        """Test delete project with searchable columns syncs its indexes
+        once the deletion is committed"""
+        from pybossa.jobs import sync_searchable_indexes
+        project = ProjectFactory.create(
+            info=dict(searchable_columns=['company']))
+
+        db.session.delete(project)
+        db.session.flush()
+        assert not queue.enqueue_call.called
+        db.session.commit()
+
+        assert queue.enqueue_call.call_count == 1
+        assert queue.enqueue_call.call_args[1]['func'] == sync_searchable_indexes
+        assert queue.enqueue_call.call_args[1]['args'] == (project.id,)
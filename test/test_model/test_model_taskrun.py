@@ -16,9 +16,13 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 
+from datetime import datetime, timedelta
+import pytz
 from default import Test, db, with_context
+from factories import TaskRunFactory
 from nose.tools import assert_raises
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import text
 from pybossa.model.user import User
 from pybossa.model.project import Project
 from pybossa.model.task import Task
@@ -59,3 +63,36 @@ class TestModelTaskRun(Test):
         db.session.add(task_run)
         assert_raises(IntegrityError, db.session.commit)
         db.session.rollback()
+
+    @with_context
+    def test_task_run_timestamp_shadows(self):
+        """Test TASK_RUN keeps timestamptz copies of its text timestamps."""
+        task_run = TaskRunFactory.create(
+            created='2018-05-14T10:00:00.000000',
+            finish_time='2018-05-14T10:00:30.500000')
+        sql = text('''SELECT finish_time_ts - created_ts AS elapsed,
+                   finish_time_ts AT TIME ZONE 'UTC' AS finish_time
+                   FROM task_run WHERE id=:id''')
+        row = db.session.execute(sql, dict(id=task_run.id)).first()
+        assert row.elapsed == timedelta(seconds=30.5), row.elapsed
+        assert row.finish_time == datetime(2018, 5, 14, 10, 0, 30, 500000)
+
+        task_run.finish_time = 'not a timestamp'
+        db.session.commit()
+        row = db.session.execute(sql, dict(id=task_run.id)).first()
+        assert row.finish_time is None, row.finish_time
+
+    @with_context
+    def test_task_run_timestamp_shadows_on_model(self):
+        """Test TASK_RUN timestamp shadows are mapped but not dictized."""
+        task_run = TaskRunFactory.create(
+            finish_time='2018-05-14T10:00:30.500000')
+        expected = datetime(2018, 5, 14, 10, 0, 30, 500000, tzinfo=pytz.utc)
+        assert task_run.finish_time_ts == expected, task_run.finish_time_ts
+        assert 'finish_time_ts' not in task_run.dictize()
+        assert 'created_ts' not in task_run.dictize()
+
+        task_run.finish_time = '2018-05-15T10:00:00'
+        db.session.commit()
+        expected = datetime(2018, 5, 15, 10, 0, tzinfo=pytz.utc)
+        assert task_run.finish_time_ts == expected, task_run.finish_time_ts
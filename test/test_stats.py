@@ -38,6 +38,7 @@ class TestStats(Test):
         """Test STATS stats_dates with no completed tasks"""
         self.prepare_data()
         today = unicode(datetime.date.today())
+        stats.update_task_run_rollup(self.project.id)
         dates, dates_anon, dates_auth = stats.stats_dates(self.project.id)
         assert len(dates.keys()) == 15, "There should be 15 days."
         for d in dates.keys():
@@ -60,6 +61,7 @@ class TestStats(Test):
         self.prepare_data()
         today = unicode(datetime.date.today())
         TaskRunFactory.create(task=self.project.tasks[1])
+        stats.update_task_run_rollup(self.project.id)
         dates, dates_anon, dates_auth = stats.stats_dates(self.project.id)
         assert dates[today] == 4, dates
         assert dates_anon[today] == 4, dates_anon[today]
@@ -70,6 +72,7 @@ class TestStats(Test):
         """Test STATS hours method works"""
         self.prepare_data()
         hour = unicode(datetime.datetime.utcnow().strftime('%H'))
+        stats.update_task_run_rollup(self.project.id)
         hours, hours_anon, hours_auth, max_hours,\
             max_hours_anon, max_hours_auth = stats.stats_hours(self.project.id)
         print hours
@@ -170,3 +173,118 @@ class TestStats(Test):
         assert user_stats['n_anon'] + user_stats['n_auth'] == 7, err_msg
         for u in user_stats['auth']['top10']:
             assert u['restrict'] is False, u
+
+    @with_context
+    def test_format_stats_matches_previous_formatting(self):
+        """Test STATS formatting a year of hourly data gives the same output
+        as the previous per day and per hour loops"""
+        (dates, dates_anon, dates_auth,
+         hours, hours_anon, hours_auth) = year_of_hourly_data()
+        max_hours = max(hours.values())
+        max_hours_anon = max(hours_anon.values())
+        max_hours_auth = max(hours_auth.values())
+
+        filled = stats._fill_empty_days('2 year', dict(dates))
+        assert filled == _previous_fill_empty_days('2 year', dict(dates))
+        assert stats._fill_empty_days('1 week', dict(dates)) == dates
+
+        dates_stats = stats.stats_format_dates(1, filled, dates_anon,
+                                               dates_auth)
+        expected = _previous_format_dates(filled, dates_anon, dates_auth)
+        for item, expected_values in zip(dates_stats, expected):
+            assert item['values'] == expected_values, item['label']
+
+        hours_stats = stats.stats_format_hours(1, hours, hours_anon,
+                                               hours_auth, max_hours,
+                                               max_hours_anon,
+                                               max_hours_auth)
+        expected = _previous_format_hours(hours, hours_anon, hours_auth,
+                                          max_hours)
+        for item, expected_item in zip(hours_stats, expected):
+            assert item['values'] == expected_item, item['label']
+        assert [item['max'] for item in hours_stats] == \
+            [max_hours, max_hours_anon, max_hours_auth]
+
+    @with_context
+    def test_format_hours_matches_previous_formatting_without_answers(self):
+        """Test STATS formatting hours without answers gives the same output
+        as the previous per hour loop"""
+        hours = dict((str(i).zfill(2), 0) for i in range(0, 24))
+        hours_stats = stats.stats_format_hours(2, hours, dict(hours),
+                                               dict(hours), 0, 0, 0)
+        expected = _previous_format_hours(hours, hours, hours, 0)
+        assert [item['values'] for item in hours_stats] == expected
+
+
+def year_of_hourly_data():
+    """Return a year of hourly answers in the shape _stats_dimensions
+    returns them."""
+    start = datetime.datetime.utcnow() - datetime.timedelta(days=365)
+    dates, dates_anon, dates_auth = {}, {}, {}
+    hours = dict((str(i).zfill(2), 0) for i in range(0, 24))
+    hours_anon, hours_auth = dict(hours), dict(hours)
+    for i in range(0, 365 * 24):
+        moment = start + datetime.timedelta(hours=i)
+        day, hour = moment.strftime('%Y-%m-%d'), moment.strftime('%H')
+        anon, auth = i % 3, i % 5
+        dates[day] = dates.get(day, 0) + (1 if auth else 0)
+        dates_anon[day] = dates_anon.get(day, 0) + anon
+        dates_auth[day] = dates_auth.get(day, 0) + auth
+        hours[hour] += anon + auth
+        hours_anon[hour] += anon
+        hours_auth[hour] += auth
+    # days with answers of only one kind, and days with no completions
+    days = sorted(dates.keys())
+    for day in days[::10]:
+        del dates_auth[day]
+    for day in days[5::10]:
+        del dates_anon[day]
+    for day in days[::3]:
+        del dates[day]
+    return dates, dates_anon, dates_auth, hours, hours_anon, hours_auth
+
+
+def _previous_fill_empty_days(period, obj):
+    """_fill_empty_days as it was before it used pandas."""
+    n_days = stats.convert_period_to_days(period) if period else 0
+    if len(obj) < n_days:
+        base = datetime.datetime.today()
+        for x in range(0, n_days):
+            tmp_date = base - datetime.timedelta(days=x)
+            if tmp_date.strftime('%Y-%m-%d') not in obj:
+                obj[tmp_date.strftime('%Y-%m-%d')] = 0
+    return obj
+
+
+def _previous_format_dates(dates, dates_anon, dates_auth):
+    """The values of stats_format_dates as they were before it used
+    pandas."""
+    def js_time(d):
+        return int(time.mktime(time.strptime(d, "%Y-%m-%d")) * 1000)
+
+    new, anon, auth, completed = [], [], [], []
+    total = 0
+    for d in sorted(dates.keys()):
+        total = total + dates[d]
+        completed.append([js_time(d), total])
+    for d in sorted(set(dates_anon.keys() + dates_auth.keys())):
+        anon_ans = dates_anon.get(d, 0)
+        auth_ans = dates_auth.get(d, 0)
+        new.append([js_time(d), anon_ans + auth_ans])
+        anon.append([js_time(d), anon_ans])
+        auth.append([js_time(d), auth_ans])
+    return [new, anon, auth, completed]
+
+
+def _previous_format_hours(hours, hours_anon, hours_auth, max_hours):
+    """The values of stats_format_hours as they were before it used
+    pandas."""
+    def values(counts):
+        out = []
+        for h in sorted(hours.keys()):
+            if h in counts:
+                size = (counts[h] * 5) / max_hours if counts[h] != 0 else 0
+                out.append([int(h), counts[h], size])
+        return out
+
+    return [values(hours), values(hours_anon), values(hours_auth)]
@@ -0,0 +1,78 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+from default import Test, with_context
+from pybossa.traffic import (increment_project_traffic, get_project_traffic,
+                             get_top_traffic_projects, decay_project_traffic,
+                             mark_project_stats_dirty, pop_dirty_projects,
+                             STATS_DIRTY_KEY)
+from pybossa.core import sentinel
+
+
+class TestTraffic(Test):
+
+    def setUp(self):
+        super(TestTraffic, self).setUp()
+        sentinel.master.flushall()
+
+    @with_context
+    def test_get_project_traffic_no_traffic(self):
+        traffic = get_project_traffic([1, 2])
+        assert traffic == {1: 0, 2: 0}, traffic
+
+    @with_context
+    def test_increment_project_traffic(self):
+        increment_project_traffic(1)
+        increment_project_traffic(1)
+        increment_project_traffic(2)
+        traffic = get_project_traffic([1, 2])
+        assert traffic == {1: 2, 2: 1}, traffic
+
+    @with_context
+    def test_get_top_traffic_projects(self):
+        increment_project_traffic(1)
+        increment_project_traffic(2, 5)
+        increment_project_traffic(3, 3)
+        top = get_top_traffic_projects(2)
+        assert top == [2, 3], top
+
+    @with_context
+    def test_decay_project_traffic(self):
+        increment_project_traffic(1, 10)
+        increment_project_traffic(2, 1)
+        decay_project_traffic()
+        traffic = get_project_traffic([1, 2])
+        assert traffic == {1: 5, 2: 0}, traffic
+        assert get_top_traffic_projects() == [1]
+
+    @with_context
+    def test_pop_dirty_projects(self):
+        mark_project_stats_dirty(2)
+        mark_project_stats_dirty(1)
+        mark_project_stats_dirty(2)
+        assert pop_dirty_projects(60) == [1, 2]
+        assert pop_dirty_projects(60) == []
+
+    @with_context
+    def test_pop_dirty_projects_rate_limited(self):
+        mark_project_stats_dirty(1)
+        assert pop_dirty_projects(60) == [1]
+        mark_project_stats_dirty(1)
+        mark_project_stats_dirty(2)
+        assert pop_dirty_projects(60) == [2]
+        # Project 1 stays dirty until its interval expires
+        assert sentinel.master.smembers(STATS_DIRTY_KEY) == set(['1'])
@@ -627,10 +627,12 @@ class TestIsReservedName(object):
 class TestWithCacheDisabledDecorator(object):
 
     def setUp(self):
-        os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = '0'
+        self.env_cache_disabled = os.environ.pop(
+            'PYBOSSA_REDIS_CACHE_DISABLED', None)
 
     def tearDown(self):
-        os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = '1'
+        if self.env_cache_disabled is not None:
+            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = self.env_cache_disabled
 
     def test_it_returns_same_as_original_function(self):
         def original_func(first_value, second_value='world'):
@@ -645,34 +647,46 @@ class TestWithCacheDisabledDecorator(object):
             'Hello, ', second_value='there')
 
     def test_it_executes_function_with_cache_disabled(self):
-        def original_func():
-            return os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
+        from pybossa.cache import is_cache_disabled
 
-        decorated_func = util.with_cache_disabled(original_func)
+        decorated_func = util.with_cache_disabled(is_cache_disabled)
 
-        assert original_func() == '0', original_func()
-        assert decorated_func() == '1', decorated_func()
+        assert is_cache_disabled() is False
+        assert decorated_func() is True
 
-    def test_it_executes_function_with_cache_disabled_triangulation(self):
-        def original_func():
+    def test_it_does_not_modify_environment(self):
+        @util.with_cache_disabled
+        def decorated_func():
             return os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
 
-        del os.environ['PYBOSSA_REDIS_CACHE_DISABLED']
-        decorated_func = util.with_cache_disabled(original_func)
+        assert decorated_func() is None
+        assert os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None
 
-        assert original_func() == None, original_func()
-        assert decorated_func() == '1', decorated_func()
+    def test_it_leaves_cache_enabled_after_exception(self):
+        from pybossa.cache import is_cache_disabled
 
-    def test_it_leaves_environment_as_it_was_before(self):
         @util.with_cache_disabled
         def decorated_func():
-            return
+            raise ValueError()
+
+        assert_raises(ValueError, decorated_func)
+        assert is_cache_disabled() is False
 
-        original_value = os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
-        decorated_func()
-        left_value = os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
+    def test_it_only_disables_cache_in_current_thread(self):
+        import threading
+        from pybossa.cache import is_cache_disabled
+        other_thread = []
 
-        assert left_value == original_value, left_value
+        @util.with_cache_disabled
+        def decorated_func():
+            thread = threading.Thread(
+                target=lambda: other_thread.append(is_cache_disabled()))
+            thread.start()
+            thread.join()
+            return is_cache_disabled()
+
+        assert decorated_func() is True
+        assert other_thread == [False], other_thread
 
 
 class TestUsernameFromFullnameFunction(object):
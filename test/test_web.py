@@ -7484,6 +7484,35 @@ class TestWeb(web.Helper):
         assert dom.find(id="signin") is not None, err_msg
 
 
+    @with_context
+    @patch('pybossa.view.projects.task_queue')
+    def test_77_task_settings_searchable_columns_json(self, queue):
+        """Test WEB TASK SETTINGS JSON searchable columns syncs the indexes"""
+        from pybossa.jobs import sync_searchable_indexes
+        admin, owner = UserFactory.create_batch(2)
+        make_subadmin(owner)
+        project = ProjectFactory.create(owner=owner)
+        TaskFactory.create(project=project, info=dict(company='a', city='b'))
+        url = '/project/%s/tasks/searchable-columns?api_key=%s' % (
+            project.short_name, owner.api_key)
+
+        res = self.app_get_json(url)
+        data = json.loads(res.data)
+        assert 'columns' in data['form'].keys(), data
+
+        res = self.app_post_json(url, data=dict(columns=['company']))
+        data = json.loads(res.data)
+        assert data['status'] == SUCCESS, data
+        project = project_repo.get(project.id)
+        assert project.info['searchable_columns'] == ['company'], project.info
+        assert queue.enqueue_call.call_args[1]['func'] == sync_searchable_indexes
+        assert queue.enqueue_call.call_args[1]['args'] == (project.id,)
+
+        res = self.app_post_json(url, data=dict(columns=['unknown']))
+        data = json.loads(res.data)
+        assert data['status'] == 'error', data
+        assert queue.enqueue_call.call_count == 1
+
     @with_context
     def test_78_cookies_warning(self):
         """Test WEB cookies warning is displayed"""